@@ -0,0 +1,56 @@
+<?php
+
+namespace App\Console\Commands;
+
+use App\Services\PythonCommandService;
+use Illuminate\Console\Command;
+
+class RetrainDriftedModels extends Command
+{
+    protected $signature = 'models:retrain-drifted
+                            {--ticker= : Проверить только указанный тикер}
+                            {--budget= : Бюджет на переобучение в CPU-минутах (по умолчанию services.training.retrain_budget_minutes)}
+                            {--max-parallel= : Сколько моделей обучается одновременно}
+                            {--dry-run : Только отчет о дрейфе, без обучения}';
+
+    protected $description = 'Переобучить только устаревшие и дрейфующие модели (stock.py --retrain-drifted)';
+
+    public function handle(PythonCommandService $pythonService): int
+    {
+        $stockScript = base_path('stock.py');
+        if (! file_exists($stockScript)) {
+            $this->error("Скрипт обучения не найден: {$stockScript}");
+
+            return Command::FAILURE;
+        }
+
+        $pythonCommand = $pythonService->findPythonCommandWithTensorFlow();
+        if (! $pythonCommand) {
+            $this->error('Python с TensorFlow не найден');
+
+            return Command::FAILURE;
+        }
+
+        // Проверка дрейфа - векторные статистики по CSV и снимку, обучение - очередью
+        // stock.py --tickers, вывод каждого обучения - в storage/logs/model_training_<ticker>.log
+        $arguments = [
+            '--retrain-drifted',
+            '--max-parallel', (string) ($this->option('max-parallel') ?: config('services.training.max_parallel', 2)),
+        ];
+        if ($this->option('ticker')) {
+            array_push($arguments, '--tickers', strtoupper($this->option('ticker')));
+        }
+        $budget = $this->option('budget') ?: config('services.training.retrain_budget_minutes', 120);
+        array_push($arguments, '--budget-minutes', (string) (float) $budget);
+        if ($this->option('dry-run')) {
+            $arguments[] = '--dry-run';
+        }
+
+        $command = $pythonService->buildPythonCommand($pythonCommand, $stockScript, $arguments, false);
+        $this->line('Проверка дрейфа моделей...');
+
+        passthru($command, $exitCode);
+
+        return $exitCode === 0 ? Command::SUCCESS : Command::FAILURE;
+    }
+}
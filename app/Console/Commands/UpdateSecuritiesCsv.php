@@ -13,7 +13,8 @@ class UpdateSecuritiesCsv extends Command
     protected $signature = 'securities:update-csv 
                             {--ticker= : Обновить только указанный тикер}
                             {--interval=24 : Интервал для загрузки (24 = день)}
-                            {--all : Загрузить все данные с начала}';
+                            {--all : Загрузить все данные с начала}
+                            {--workers=2 : Количество процессов для пакетного прогноза}';
 
     protected $description = 'Обновить CSV файлы с данными по акциям MOEX';
 
@@ -42,6 +43,8 @@ public function handle(SecurityCsvService $csvService): int
 
         $this->info('Начинаю обновление CSV файлов...');
 
+        $forecastTickers = [];
+
         foreach ($tickers as $ticker) {
 
             $this->line("Обрабатываю тикер: {$ticker}");
@@ -108,7 +111,7 @@ public function handle(SecurityCsvService $csvService): int
                 $added = $csvService->appendData($ticker, $points);
                 $this->info("  ✓ Добавлено новых записей: {$added}");
 
-                $this->addPredictionsToCsv($ticker, $csvService);
+                $forecastTickers[] = $ticker;
 
             } catch (\Exception $e) {
                 $this->error("Ошибка при обработке {$ticker}: ".$e->getMessage());
@@ -117,23 +120,33 @@ public function handle(SecurityCsvService $csvService): int
             }
         }
 
+        $this->generatePredictions($forecastTickers);
+
         $this->info('Обновление завершено!');
 
         return Command::SUCCESS;
     }
 
-    private function addPredictionsToCsv(string $ticker, SecurityCsvService $csvService): void
+    private function generatePredictions(array $tickers): void
     {
-        try {
+        $tickers = array_values(array_filter($tickers, function (string $ticker) {
             $modelPath = base_path('models/lstm_patterns_'.strtolower($ticker).'.h5');
             $scalerPath = base_path('models/scaler_patterns_'.strtolower($ticker).'.pkl');
 
             if (! file_exists($modelPath) || ! file_exists($scalerPath)) {
                 $this->warn("  ⚠ Модель для {$ticker} не найдена, пропускаем прогнозы");
 
-                return;
+                return false;
             }
 
+            return true;
+        }));
+
+        if (empty($tickers)) {
+            return;
+        }
+
+        try {
             $pythonCommand = $this->findPythonCommand();
             if (! $pythonCommand) {
                 $this->warn('  ⚠ Python с TensorFlow не найден, пропускаем прогнозы');
@@ -148,7 +161,16 @@ private function addPredictionsToCsv(string $ticker, SecurityCsvService $csvServ
                 return;
             }
 
-            $this->line("  Генерация прогнозов для {$ticker}...");
+            $this->line('Генерация прогнозов для: '.implode(', ', $tickers).'...');
+
+            // Один запуск на все тикеры: процессы пула загружают модули один раз,
+            // результаты приходят по одной JSON-строке на тикер. Точки прогноза
+            // predict_future.py сам пишет в хранилище прогнозов, поэтому достаточно итогов
+            $arguments = sprintf(
+                '--tickers %s --workers %d --output summary',
+                escapeshellarg(implode(',', $tickers)),
+                max(1, (int) $this->option('workers'))
+            );
 
             if (PHP_OS_FAMILY === 'Windows') {
                 $quotePath = function ($path) {
@@ -165,85 +187,73 @@ private function addPredictionsToCsv(string $ticker, SecurityCsvService $csvServ
                     : $pythonCommand;
                 $scriptQuoted = $quotePath($predictScript);
 
-                $command = sprintf(
-                    '%s %s %s 252',
-                    $pythonCmd,
-                    $scriptQuoted,
-                    escapeshellarg($ticker)
-                );
+                $command = sprintf('%s %s %s 2>nul', $pythonCmd, $scriptQuoted, $arguments);
             } else {
                 $command = sprintf(
-                    'PYTHONIOENCODING=utf-8 %s %s %s 252',
+                    'PYTHONIOENCODING=utf-8 %s %s %s 2>/dev/null',
                     escapeshellcmd($pythonCommand),
                     escapeshellarg($predictScript),
-                    escapeshellarg($ticker)
+                    $arguments
                 );
             }
 
-            if (PHP_OS_FAMILY === 'Windows') {
-                $output = shell_exec($command.' 2>nul');
-            } else {
-                $output = shell_exec($command.' 2>/dev/null');
-            }
-
-            if (empty($output)) {
-                $this->warn('  ⚠ Скрипт прогнозирования не вернул результат');
+            $handle = popen($command, 'r');
+            if ($handle === false) {
+                $this->warn('  ⚠ Не удалось запустить скрипт прогнозирования');
 
                 return;
             }
 
-            $jsonStart = strpos($output, '{');
-            if ($jsonStart !== false) {
-                $jsonOutput = substr($output, $jsonStart);
-                $result = json_decode($jsonOutput, true);
-            } else {
-                $result = json_decode($output, true);
+            while (($line = fgets($handle)) !== false) {
+                $line = trim($line);
+                if ($line === '' || $line[0] !== '{') {
+                    continue;
+                }
+
+                $this->reportPrediction($line);
             }
 
-            if (json_last_error() !== JSON_ERROR_NONE) {
-                $this->warn('  ⚠ Ошибка парсинга JSON: '.json_last_error_msg());
+            pclose($handle);
 
-                return;
-            }
+        } catch (\Exception $e) {
+            $this->warn('  ⚠ Ошибка при добавлении прогнозов: '.$e->getMessage());
+        }
+    }
 
-            if (isset($result['error'])) {
-                $this->warn('  ⚠ Ошибка при генерации прогнозов: '.$result['error']);
+    private function reportPrediction(string $line): void
+    {
+        $result = json_decode($line, true);
 
-                return;
-            }
+        if (json_last_error() !== JSON_ERROR_NONE || ! is_array($result)) {
+            $this->warn('  ⚠ Ошибка парсинга JSON: '.json_last_error_msg());
 
-            if (isset($result['used_snapshot'])) {
-                if ($result['used_snapshot']) {
-                    $this->info('  ✓ Использован снимок данных от: '.($result['snapshot_timestamp'] ?? 'unknown'));
-                } else {
-                    $this->warn('  ⚠ Использован CSV (снимок не найден или отключен)');
-                }
-            }
+            return;
+        }
 
-            if (! isset($result['predictions']) || empty($result['predictions'])) {
-                $this->warn('  ⚠ Нет прогнозных данных');
+        $ticker = $result['ticker'] ?? '?';
 
-                return;
-            }
+        if (isset($result['error'])) {
+            $this->warn("  ⚠ Ошибка при генерации прогнозов для {$ticker}: ".$result['error']);
 
-            $predictionPoints = [];
-            foreach ($result['predictions'] as $pred) {
-                $predictionPoints[] = [
-                    'time' => $pred['time'],
-                    'open' => (float) $pred['open'],
-                    'high' => (float) $pred['high'],
-                    'low' => (float) $pred['low'],
-                    'close' => (float) $pred['close'],
-                    'volume' => (int) ($pred['volume'] ?? 0),
-                ];
+            return;
+        }
+
+        if (isset($result['used_snapshot'])) {
+            if ($result['used_snapshot']) {
+                $this->info("  ✓ {$ticker}: использован снимок данных от: ".($result['snapshot_timestamp'] ?? 'unknown'));
+            } else {
+                $this->warn("  ⚠ {$ticker}: использован CSV (снимок не найден или отключен)");
             }
+        }
 
-            $addedPredictions = $csvService->appendData($ticker, $predictionPoints);
-            $this->info("  ✓ Добавлено прогнозных записей: {$addedPredictions}");
+        if (empty($result['count'])) {
+            $this->warn("  ⚠ Нет прогнозных данных для {$ticker}");
 
-        } catch (\Exception $e) {
-            $this->warn('  ⚠ Ошибка при добавлении прогнозов: '.$e->getMessage());
+            return;
         }
+
+        // В CSV с историей прогноз больше не пишется: график читает его из хранилища прогнозов
+        $this->info("  ✓ {$ticker}: прогноз на {$result['count']} точек сохранен в хранилище прогнозов");
     }
 
     private function findPythonCommand(): ?string
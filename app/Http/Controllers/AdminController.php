@@ -157,9 +157,24 @@ public function checkModelStatus(string $ticker)
             'is_ready' => $isReady,
             'model_exists' => file_exists($modelPath),
             'scaler_exists' => file_exists($scalerPath),
+            'training' => $this->readTrainingStatus($ticker),
         ]);
     }
 
+    private function readTrainingStatus(string $ticker): ?array
+    {
+        // Файл пишет пакетный режим stock.py (ml/train_batch.py)
+        $statusPath = base_path('models/training_status.json');
+
+        if (! file_exists($statusPath)) {
+            return null;
+        }
+
+        $status = json_decode((string) file_get_contents($statusPath), true);
+
+        return $status['tickers'][strtoupper($ticker)] ?? null;
+    }
+
     private function runStockNotebook(string $ticker): void
     {
         $stockScript = base_path('stock.py');
@@ -190,7 +205,11 @@ private function runStockNotebook(string $ticker): void
                 mkdir($modelsDir, 0755, true);
             }
 
-            $logFile = storage_path('logs/model_training_'.strtolower($ticker).'_'.time().'.log');
+            // Обучение идет через очередь stock.py --tickers: не больше max_parallel моделей
+            // одновременно, вывод самого обучения - в storage/logs/model_training_<ticker>.log.
+            // --force: запуск из админки явный, пропуск моделей новее данных здесь не нужен
+            $maxParallel = (int) config('services.training.max_parallel', 2);
+            $logFile = storage_path('logs/model_training_queue_'.strtolower($ticker).'_'.time().'.log');
 
             if (PHP_OS_FAMILY === 'Windows') {
                 $quotePath = function ($path) {
@@ -214,20 +233,22 @@ private function runStockNotebook(string $ticker): void
                 $logFileQuoted = $quotePath($logFile);
 
                 $command = sprintf(
-                    'chcp 65001 >nul && start /B "" %s %s %s > %s 2>&1',
+                    'chcp 65001 >nul && start /B "" %s %s --tickers %s --max-parallel %d --force > %s 2>&1',
                     $pythonCmd,
                     $stockScriptQuoted,
                     escapeshellarg($ticker),
+                    $maxParallel,
                     $logFileQuoted
                 );
 
                 pclose(popen($command, 'r'));
             } else {
                 $command = sprintf(
-                    'PYTHONIOENCODING=utf-8 %s %s %s > %s 2>&1 &',
+                    'PYTHONIOENCODING=utf-8 %s %s --tickers %s --max-parallel %d --force > %s 2>&1 &',
                     escapeshellcmd($pythonCommand),
                     escapeshellarg($stockScript),
                     escapeshellarg($ticker),
+                    $maxParallel,
                     escapeshellarg($logFile)
                 );
                 exec($command);
@@ -479,125 +500,6 @@ private function loadInitialData(string $ticker, SecurityCsvService $csvService)
         }
     }
 
-    private function addPredictionsToCsv(string $ticker, SecurityCsvService $csvService): void
-    {
-        set_time_limit(300);
-        ini_set('max_execution_time', '300');
-
-        try {
-            $modelPath = base_path('models/lstm_patterns_'.strtolower($ticker).'.h5');
-            $scalerPath = base_path('models/scaler_patterns_'.strtolower($ticker).'.pkl');
-
-            if (! file_exists($modelPath) || ! file_exists($scalerPath)) {
-                \Log::info("Модель для {$ticker} не найдена, пропускаем прогнозы");
-
-                return;
-            }
-
-            $pythonCommand = $this->findPythonCommand();
-            if (! $pythonCommand) {
-                \Log::warning("Python с TensorFlow не найден, пропускаем прогнозы для {$ticker}");
-
-                return;
-            }
-
-            $predictScript = base_path('predict_future.py');
-            if (! file_exists($predictScript)) {
-                \Log::warning("Скрипт прогнозирования не найден: {$predictScript}");
-
-                return;
-            }
-
-            \Log::info("Генерация прогнозов для {$ticker}...");
-
-            if (PHP_OS_FAMILY === 'Windows') {
-                $quotePath = function ($path) {
-                    $normalized = str_replace('/', '\\', $path);
-                    if (strpos($normalized, '"') === 0 && substr($normalized, -1) === '"') {
-                        return $normalized;
-                    }
-
-                    return '"'.$normalized.'"';
-                };
-
-                $pythonCmd = file_exists($pythonCommand)
-                    ? $quotePath($pythonCommand)
-                    : $pythonCommand;
-                $scriptQuoted = $quotePath($predictScript);
-
-                $command = sprintf(
-                    '%s %s %s 252',
-                    $pythonCmd,
-                    $scriptQuoted,
-                    escapeshellarg($ticker)
-                );
-            } else {
-                $command = sprintf(
-                    'PYTHONIOENCODING=utf-8 %s %s %s 252',
-                    escapeshellcmd($pythonCommand),
-                    escapeshellarg($predictScript),
-                    escapeshellarg($ticker)
-                );
-            }
-
-            if (PHP_OS_FAMILY === 'Windows') {
-                $output = shell_exec($command.' 2>nul');
-            } else {
-                $output = shell_exec($command.' 2>/dev/null');
-            }
-
-            if (empty($output)) {
-                \Log::warning("Скрипт прогнозирования не вернул результат для {$ticker}");
-
-                return;
-            }
-
-            $jsonStart = strpos($output, '{');
-            if ($jsonStart !== false) {
-                $jsonOutput = substr($output, $jsonStart);
-                $result = json_decode($jsonOutput, true);
-            } else {
-                $result = json_decode($output, true);
-            }
-
-            if (json_last_error() !== JSON_ERROR_NONE) {
-                \Log::warning("Ошибка парсинга JSON для {$ticker}: ".json_last_error_msg().' Output: '.substr($output, 0, 200));
-
-                return;
-            }
-
-            if (isset($result['error'])) {
-                \Log::warning("Ошибка при генерации прогнозов для {$ticker}: ".$result['error']);
-
-                return;
-            }
-
-            if (! isset($result['predictions']) || empty($result['predictions'])) {
-                \Log::warning("Нет прогнозных данных для {$ticker}");
-
-                return;
-            }
-
-            $predictionPoints = [];
-            foreach ($result['predictions'] as $pred) {
-                $predictionPoints[] = [
-                    'time' => $pred['time'],
-                    'open' => (float) $pred['open'],
-                    'high' => (float) $pred['high'],
-                    'low' => (float) $pred['low'],
-                    'close' => (float) $pred['close'],
-                    'volume' => (int) ($pred['volume'] ?? 0),
-                ];
-            }
-
-            $addedPredictions = $csvService->appendData($ticker, $predictionPoints);
-            \Log::info("Добавлено {$addedPredictions} прогнозных записей для тикера {$ticker}");
-
-        } catch (\Exception $e) {
-            \Log::error("Ошибка при добавлении прогнозов для {$ticker}: ".$e->getMessage());
-        }
-    }
-
     private function fetchStockInfo(string $ticker): array
     {
         try {
@@ -3,6 +3,7 @@
 namespace App\Http\Controllers;
 
 use App\Models\Stock;
+use App\Services\ForecastStoreService;
 use App\Services\SecurityCsvService;
 use Barryvdh\DomPDF\Facade\Pdf;
 use Illuminate\Http\JsonResponse;
@@ -193,7 +194,7 @@ public function history(Request $request, string $ticker): JsonResponse
         ]);
     }
 
-    public function csvData(Request $request, string $ticker, SecurityCsvService $csvService): JsonResponse
+    public function csvData(Request $request, string $ticker, SecurityCsvService $csvService, ForecastStoreService $forecastStore): JsonResponse
     {
         $normalizedTicker = strtoupper($ticker);
         $availableTickers = $this->getAvailableTickers();
@@ -215,6 +216,22 @@ public function csvData(Request $request, string $ticker, SecurityCsvService $cs
             ];
         })->values()->all();
 
+        // Прогноз хранится отдельно от истории: последний запуск читается одним блоком
+        // и добавляется к графику после последней реальной свечи
+        $forecast = $forecastStore->getRun($normalizedTicker);
+        $forecastInfo = null;
+        if ($forecast !== null) {
+            $lastTime = count($points) > 0 ? $points[count($points) - 1]['time'] : '';
+            $forecastPoints = array_values(array_filter($forecast['points'], fn ($point) => $point['time'] > $lastTime));
+            $points = array_merge($points, $forecastPoints);
+            $forecastInfo = [
+                'run_id' => $forecast['run_id'],
+                'created_at' => $forecast['created_at'] ?? null,
+                'first_time' => $forecastPoints[0]['time'] ?? null,
+                'count' => count($forecastPoints),
+            ];
+        }
+
         \Log::info("CSV данные для {$normalizedTicker}: загружено ".count($points).' точек');
         if (count($points) > 0) {
             \Log::info('Первая точка: '.$points[0]['time']);
@@ -225,6 +242,7 @@ public function csvData(Request $request, string $ticker, SecurityCsvService $cs
             'ticker' => $normalizedTicker,
             'count' => count($points),
             'points' => $points,
+            'forecast' => $forecastInfo,
         ]);
     }
 
@@ -416,16 +434,21 @@ private function exportExcel(string $ticker, array $predictions)
 
             $content .= chr(0xEF).chr(0xBB).chr(0xBF);
 
-            $content .= "Ценная бумага;Текущая цена;Прогноз на год;Рекомендация\n";
+            $content .= "Ценная бумага;Текущая цена;Прогноз на год;Интервал прогноза;Рекомендация\n";
 
             foreach ($predictions as $prediction) {
                 $price252d = $prediction['predicted_price_252d'] ?? ($prediction['predicted_price'] ?? 0);
 
+                $interval = isset($prediction['predicted_price_252d_low'], $prediction['predicted_price_252d_high'])
+                    ? number_format($prediction['predicted_price_252d_low'], 2, ',', ' ').' - '.number_format($prediction['predicted_price_252d_high'], 2, ',', ' ')
+                    : '';
+
                 $content .= sprintf(
-                    "%s;%s;%s;%s\n",
+                    "%s;%s;%s;%s;%s\n",
                     $prediction['ticker'],
                     number_format($prediction['current_price'], 2, ',', ' '),
                     number_format($price252d, 2, ',', ' '),
+                    $interval,
                     $prediction['recommendation']
                 );
             }
@@ -29,6 +29,12 @@ public function boot(): void
                 ->dailyAt('20:00')
                 ->withoutOverlapping()
                 ->runInBackground();
+
+            // После обновления данных переобучаем только устаревшие и дрейфующие модели
+            $schedule->command('models:retrain-drifted')
+                ->dailyAt('22:00')
+                ->withoutOverlapping()
+                ->runInBackground();
         });
     }
 }
@@ -0,0 +1,110 @@
+<?php
+
+namespace App\Services;
+
+use Illuminate\Support\Facades\Storage;
+
+/**
+ * Чтение хранилища прогнозов, которое пишет predict_future.py (ml/forecast_store.py).
+ *
+ * forecasts/index.json - запуски по тикерам (последний - в конце списка) со смещением
+ * блока в файле данных; блок - колонки little-endian: time int64 (секунды),
+ * open/high/low/close float64, volume int64, band_* float64.
+ */
+class ForecastStoreService
+{
+    private const STORE_DIR = 'forecasts';
+
+    private const STORE_VERSION = 1;
+
+    public function runs(string $ticker): array
+    {
+        $indexPath = self::STORE_DIR.'/index.json';
+
+        if (! Storage::exists($indexPath)) {
+            return [];
+        }
+
+        $index = json_decode(Storage::get($indexPath), true);
+        if (! is_array($index) || ($index['version'] ?? null) !== self::STORE_VERSION) {
+            return [];
+        }
+
+        return $index['tickers'][strtoupper($ticker)] ?? [];
+    }
+
+    /**
+     * Запуск прогноза (по умолчанию последний): итоговые поля из индекса и точки прогноза.
+     */
+    public function getRun(string $ticker, ?string $runId = null): ?array
+    {
+        $runs = $this->runs($ticker);
+        $entry = null;
+
+        if ($runId === null) {
+            $entry = end($runs) ?: null;
+        } else {
+            foreach (array_reverse($runs) as $run) {
+                if ($run['run_id'] === $runId) {
+                    $entry = $run;
+                    break;
+                }
+            }
+        }
+
+        if ($entry === null) {
+            return null;
+        }
+
+        $columns = $this->readColumns($entry);
+        if ($columns === null) {
+            return null;
+        }
+
+        $points = [];
+        for ($i = 0; $i < $entry['points']; $i++) {
+            $points[] = [
+                'time' => gmdate('Y-m-d H:i:s', $columns['time'][$i]),
+                'open' => $columns['open'][$i],
+                'high' => $columns['high'][$i],
+                'low' => $columns['low'][$i],
+                'close' => $columns['close'][$i],
+                'volume' => $columns['volume'][$i],
+            ];
+        }
+
+        return array_merge($entry, ['ticker' => strtoupper($ticker), 'points' => $points]);
+    }
+
+    /**
+     * Колонки блока запуска: один fseek и один fread по смещению из индекса.
+     */
+    private function readColumns(array $entry): ?array
+    {
+        $path = Storage::path(self::STORE_DIR.'/'.$entry['file']);
+        $handle = @fopen($path, 'rb');
+        if ($handle === false) {
+            return null;
+        }
+
+        fseek($handle, $entry['offset']);
+        $data = fread($handle, $entry['length']);
+        fclose($handle);
+
+        if ($data === false || strlen($data) !== $entry['length']) {
+            return null;
+        }
+
+        $count = (int) $entry['points'];
+        $columns = [];
+        $position = 0;
+        foreach ($entry['columns'] as $name) {
+            // q - int64, e - float64 little-endian
+            $format = in_array($name, ['time', 'volume'], true) ? 'q' : 'e';
+            $columns[$name] = $count > 0 ? array_values(unpack("{$format}{$count}", $data, $position)) : [];
+            $position += $count * 8;
+        }
+
+        return $columns;
+    }
+}
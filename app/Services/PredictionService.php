@@ -2,7 +2,9 @@
 
 namespace App\Services;
 
+use Illuminate\Http\Client\ConnectionException;
 use Illuminate\Support\Collection;
+use Illuminate\Support\Facades\Http;
 use Illuminate\Support\Facades\Log;
 
 class PredictionService
@@ -13,50 +15,10 @@ public function getPredictions(string $ticker, Collection $data): array
             return [];
         }
 
-        $pythonScript = base_path('predict_future.py');
-
-        $pythonService = app(PythonCommandService::class);
-        $pythonCommand = $pythonService->findPythonCommandWithTensorFlow();
-
-        if (! $pythonCommand) {
-            Log::warning("Python с TensorFlow не найден, используется fallback прогноз для тикера: {$ticker}");
-
-            return $this->getFallbackPrediction($ticker, $data);
-        }
-
-        if (! file_exists($pythonScript)) {
-            Log::error("Python скрипт не найден: {$pythonScript}");
-
-            return $this->getFallbackPrediction($ticker, $data);
-        }
-
         try {
-            $command = $pythonService->buildPythonCommand(
-                $pythonCommand,
-                $pythonScript,
-                [$ticker, '252', 'snapshot'],
-                true
-            );
-
-            $output = shell_exec($command);
-
-            if (empty($output)) {
-                Log::error("Python скрипт не вернул результат для тикера: {$ticker}. Команда: {$command}");
-
-                return $this->getFallbackPrediction($ticker, $data);
-            }
-
-            $jsonStart = strpos($output, '{');
-            if ($jsonStart !== false) {
-                $jsonOutput = substr($output, $jsonStart);
-                $result = json_decode($jsonOutput, true);
-            } else {
-                $result = json_decode($output, true);
-            }
-
-            if (json_last_error() !== JSON_ERROR_NONE) {
-                Log::error('Ошибка парсинга JSON от Python скрипта: '.json_last_error_msg().' Output: '.substr($output, 0, 500));
+            $result = $this->fetchFromDaemon($ticker) ?? $this->runPredictionScript($ticker);
 
+            if ($result === null) {
                 return $this->getFallbackPrediction($ticker, $data);
             }
 
@@ -82,6 +44,8 @@ public function getPredictions(string $ticker, Collection $data): array
                 $predictedPrice252d = (float) ($lastPrediction['close'] ?? $predictedPrice252d);
             }
 
+            [$predictedLow252d, $predictedHigh252d] = $this->extractBand($result);
+
             $change = $predictedPrice252d - $currentPrice;
             $changePercent = $currentPrice > 0 ? ($change / $currentPrice) * 100 : 0;
             if ($changePercent > 15) {
@@ -93,7 +57,12 @@ public function getPredictions(string $ticker, Collection $data): array
             }
 
             $dataSource = isset($result['data_source']) ? $result['data_source'] : 'unknown';
-            Log::info("Прогнозы для {$ticker}: текущая={$currentPrice}, 1д={$predictedPrice1d}, 252д={$predictedPrice252d}, источник={$dataSource}");
+            $cacheStatus = isset($result['cache']['hit']) ? ($result['cache']['hit'] ? 'hit' : 'miss') : 'off';
+            // direct - весь горизонт одним проходом прямой модели (stock.py --direct), recursive - по шагам
+            $forecastMode = $result['forecast_mode'] ?? 'recursive';
+            // Замеры этапов от predict_future.py / сервиса - видно, какой этап замедлился
+            $timings = isset($result['timings']) && is_array($result['timings']) ? ['timings' => $result['timings']] : [];
+            Log::info("Прогнозы для {$ticker}: текущая={$currentPrice}, 1д={$predictedPrice1d}, 252д={$predictedPrice252d}, источник={$dataSource}, кэш={$cacheStatus}, режим={$forecastMode}", $timings);
 
             return [
                 [
@@ -102,6 +71,8 @@ public function getPredictions(string $ticker, Collection $data): array
                     'predicted_price_1d' => $predictedPrice1d,
                     'predicted_price_252d' => $predictedPrice252d,
                     'predicted_price' => $predictedPrice252d,
+                    'predicted_price_252d_low' => $predictedLow252d,
+                    'predicted_price_252d_high' => $predictedHigh252d,
                     'recommendation' => $recommendation,
                     'model_accuracy' => isset($result['model_accuracy']) ? (float) $result['model_accuracy'] : null,
                     'data_source' => $result['data_source'] ?? null,
@@ -116,6 +87,111 @@ public function getPredictions(string $ticker, Collection $data): array
         }
     }
 
+    /**
+     * Крайние перцентили Monte Carlo dropout на последней контрольной точке: [нижняя, верхняя] или [null, null].
+     */
+    private function extractBand(array $result): array
+    {
+        $checkpoints = $result['checkpoints'] ?? null;
+        if (! is_array($checkpoints) || empty($checkpoints)) {
+            return [null, null];
+        }
+
+        $last = end($checkpoints);
+        $bands = isset($last['bands']) && is_array($last['bands']) ? array_filter($last['bands'], 'is_numeric') : [];
+        if (empty($bands)) {
+            return [null, null];
+        }
+
+        return [(float) min($bands), (float) max($bands)];
+    }
+
+    private function mcSamples(): int
+    {
+        return max(0, (int) config('services.forecast_uncertainty.samples', 0));
+    }
+
+    private function fetchFromDaemon(string $ticker): ?array
+    {
+        $url = config('services.forecast_daemon.url');
+
+        if (empty($url)) {
+            return null;
+        }
+
+        try {
+            $response = Http::timeout((int) config('services.forecast_daemon.timeout', 60))
+                ->get(rtrim($url, '/').'/forecast', array_filter([
+                    'ticker' => $ticker,
+                    'days' => 252,
+                    'source' => 'snapshot',
+                    'engine' => 'numpy',
+                    'output' => 'summary',
+                    'samples' => $this->mcSamples() ?: null,
+                ]));
+        } catch (ConnectionException $e) {
+            Log::info("Сервис прогнозирования недоступен ({$url}), запуск predict_future.py для тикера: {$ticker}");
+
+            return null;
+        }
+
+        $result = $response->json();
+
+        if (! is_array($result)) {
+            Log::warning("Сервис прогнозирования вернул некорректный ответ для тикера {$ticker}: HTTP {$response->status()}");
+
+            return null;
+        }
+
+        return $result;
+    }
+
+    private function runPredictionScript(string $ticker): ?array
+    {
+        $pythonScript = base_path('predict_future.py');
+
+        $pythonService = app(PythonCommandService::class);
+        $pythonCommand = $pythonService->findPythonCommandWithTensorFlow();
+
+        if (! $pythonCommand) {
+            Log::warning("Python с TensorFlow не найден, используется fallback прогноз для тикера: {$ticker}");
+
+            return null;
+        }
+
+        if (! file_exists($pythonScript)) {
+            Log::error("Python скрипт не найден: {$pythonScript}");
+
+            return null;
+        }
+
+        $arguments = [$ticker, '252', 'snapshot', '--engine', 'numpy', '--output', 'summary'];
+        if ($this->mcSamples() > 0) {
+            $arguments = array_merge($arguments, ['--samples', (string) $this->mcSamples()]);
+        }
+
+        $command = $pythonService->buildPythonCommand($pythonCommand, $pythonScript, $arguments, true);
+
+        $output = shell_exec($command);
+
+        if (empty($output)) {
+            Log::error("Python скрипт не вернул результат для тикера: {$ticker}. Команда: {$command}");
+
+            return null;
+        }
+
+        // В stdout только JSON: диагностика predict_future.py идет в stderr
+        $result = json_decode(trim($output), true);
+
+        if (json_last_error() !== JSON_ERROR_NONE) {
+            Log::error('Ошибка парсинга JSON от Python скрипта: '.json_last_error_msg().' Output: '.substr($output, 0, 500));
+
+            return null;
+        }
+
+        return $result;
+    }
+
     private function getFallbackPrediction(string $ticker, Collection $data): array
     {
         $lastPoint = $data->last();
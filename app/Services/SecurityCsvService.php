@@ -124,6 +124,7 @@ public function getLastDate(string $ticker): ?Carbon
             return null;
         }
 
+        $now = Carbon::now();
         for ($i = count($lines) - 1; $i >= 1; $i--) {
             $line = trim($lines[$i]);
             if (empty($line)) {
@@ -133,10 +134,16 @@ public function getLastDate(string $ticker): ?Carbon
             $row = str_getcsv($line);
             if (count($row) >= 2) {
                 try {
-                    return Carbon::parse($row[1]);
+                    $date = Carbon::parse($row[1]);
                 } catch (\Exception $e) {
                     continue;
                 }
+                // Строки прогноза, которые дописывали старые версии predict_future.py
+                if ($date->greaterThan($now)) {
+                    continue;
+                }
+
+                return $date;
             }
         }
 
@@ -160,6 +167,9 @@ public function getAllData(string $ticker): Collection
 
         $lines = explode("\n", $content);
         $data = [];
+        // Строки позже текущего момента - прогноз, который старые версии predict_future.py
+        // дописывали в CSV (удаляются командой python -m ml.price_store --drop-future)
+        $now = Carbon::now()->format('Y-m-d H:i:s');
 
         $startIndex = 0;
         if (count($lines) > 0) {
@@ -182,6 +192,9 @@ public function getAllData(string $ticker): Collection
                 }
 
                 $time = trim($row[1], '"\'');
+                if ($time > $now) {
+                    continue;
+                }
 
                 $data[] = [
                     'ticker' => $row[0],
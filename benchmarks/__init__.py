@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+"""Офлайн-бенчмарки конвейера прогнозирования (python -m benchmarks.forecast_bench)."""
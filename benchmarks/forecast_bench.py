@@ -0,0 +1,463 @@
+# -*- coding: utf-8 -*-
+"""Бенчмарк конвейера прогноза на синтетических данных, полностью офлайн.
+
+Для каждой длины истории генерируются CSV с OHLCV, scaler, снимок данных и
+модель той же архитектуры, что в stock.py, со случайными весами (см.
+ml/model_factory.py). Все файлы пишутся во временный каталог: models/ и
+storage/ репозитория не затрагиваются. Каждая длина измеряется в отдельном
+процессе, чтобы пиковая память (RSS) одного размера не влияла на другой.
+
+Этапы: разбор CSV без хранилища и из хранилища, загрузка снимка, построение
+окон, загрузка scaler'а и модели, прогноз на 252 шага (точный и stateful, с
+расхождением между ними) и сериализация JSON.
+По каждому этапу - медиана/минимум/максимум времени, пик tracemalloc и пиковый
+RSS процесса после этапа.
+
+    python -m benchmarks.forecast_bench --rows 1000,10000,100000 --output before.json
+    python -m benchmarks.forecast_bench --compare before.json after.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import pickle
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from ml import paths
+from ml.model_factory import PATTERN_DROPOUT, PATTERN_LSTM_LAYERS, PATTERN_UNITS
+from ml.resources import format_bytes, peak_rss_bytes
+
+TICKER = 'BENCH'
+LOOKBACK = 60
+FORECAST_DAYS = 1
+DEFAULT_ROWS = (1000, 10000, 100000)
+DEFAULT_REPEAT = 3
+# Рост медианы этапа больше этой доли в --compare считается регрессией
+DEFAULT_THRESHOLD = 0.2
+RESULT_VERSION = 1
+# Дневные свечи дальше ~1700 года не помещаются в datetime64[ns]
+MAX_DAILY_ROWS = 50000
+
+
+def default_output_path(sha):
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    return os.path.join(paths.logs_dir, 'benchmarks', f'forecast-{stamp}-{sha or "nogit"}.json')
+
+
+def git_revision():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=paths.script_dir,
+                             capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def tensorflow_available():
+    try:
+        import importlib.util
+        return importlib.util.find_spec('tensorflow') is not None
+    except (ImportError, ValueError):
+        return False
+
+
+# --- синтетические данные ---------------------------------------------------
+
+def synthetic_prices(rows, seed=0):
+    """Случайное блуждание цены закрытия с правдоподобными OHLCV."""
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    close = 100.0 * np.exp(np.cumsum(rng.normal(0.0, 0.015, rows)))
+    spread = np.abs(rng.normal(0.0, 0.01, rows))
+    # Последняя свеча - вчера: из CSV отбрасываются строки позже текущего момента
+    end = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+    if rows <= MAX_DAILY_ROWS:
+        time_index = pd.bdate_range(end=end, periods=rows)
+    else:
+        time_index = pd.date_range(end=end, periods=rows, freq='h')
+
+    return pd.DataFrame({
+        'ticker': TICKER,
+        'time': time_index.strftime('%Y-%m-%d %H:%M:%S'),
+        'open': close * (1 + rng.normal(0.0, 0.005, rows)),
+        'high': close * (1 + spread),
+        'low': close * (1 - spread),
+        'close': close,
+        'volume': rng.integers(1000, 100000, rows),
+    })
+
+
+def random_numpy_model(lookback=LOOKBACK, units=PATTERN_UNITS, lstm_layers=PATTERN_LSTM_LAYERS, seed=0):
+    """NumPy-копия архитектуры stock.py со случайными весами (без TensorFlow)."""
+    from ml.numpy_lstm import NumpyLSTMModel
+
+    rng = np.random.default_rng(seed)
+    layers = []
+    inputs = 1
+    for i in range(lstm_layers):
+        layers.append({
+            'type': 'lstm',
+            'name': f'lstm_{i}',
+            'units': units,
+            'return_sequences': i < lstm_layers - 1,
+            'activation': 'tanh',
+            'recurrent_activation': 'sigmoid',
+            'weights': [
+                rng.normal(0.0, 1.0 / np.sqrt(inputs), (inputs, 4 * units)),
+                rng.normal(0.0, 1.0 / np.sqrt(units), (units, 4 * units)),
+                np.zeros(4 * units),
+            ],
+        })
+        layers.append({'type': 'dropout', 'name': f'dropout_{i}', 'rate': PATTERN_DROPOUT, 'weights': []})
+        inputs = units
+    layers.append({
+        'type': 'dense',
+        'name': 'dense',
+        'activation': 'linear',
+        'weights': [rng.normal(0.0, 1.0 / np.sqrt(units), (units, 1)), np.zeros(1)],
+    })
+    return NumpyLSTMModel(layers)
+
+
+def prepare_fixture(rows, with_keras=False, seed=0):
+    """Пишет CSV, scaler, снимок и модель в текущие paths.csv_dir / paths.models_dir."""
+    from sklearn.preprocessing import MinMaxScaler
+
+    from ml.scaler import save_sidecar, sidecar_path
+    from ml.snapshot import write_snapshot
+    from ml.windowing import make_windows
+
+    os.makedirs(paths.csv_dir, exist_ok=True)
+    os.makedirs(paths.models_dir, exist_ok=True)
+
+    df = synthetic_prices(rows, seed=seed)
+    df.to_csv(paths.csv_path(TICKER), index=False)
+
+    scaler = MinMaxScaler(feature_range=(0, 1))
+    scaled = scaler.fit_transform(df[['close']].values)
+    with open(paths.scaler_path(TICKER), 'wb') as f:
+        pickle.dump(scaler, f)
+    save_sidecar(scaler, sidecar_path(paths.scaler_path(TICKER)))
+
+    X, _ = make_windows(scaled, lookback=LOOKBACK, forecast_days=FORECAST_DAYS)
+    snapshot_df = df[['time', 'close', 'volume']].copy()
+    snapshot_df['time'] = snapshot_df['time'].astype('datetime64[ns]')
+    write_snapshot(paths.snapshot_dir(TICKER), snapshot_df, X[-1], {
+        'last_date': str(df['time'].iloc[-1]),
+        'last_price': float(df['close'].iloc[-1]),
+        'lookback': LOOKBACK,
+        'forecast_days': FORECAST_DAYS,
+        'timestamp': datetime.now().isoformat(),
+        'accuracy': 0.0,
+        'mape': None,
+        'test_mae': 0.0,
+        'training_mode': 'benchmark',
+    })
+
+    if with_keras:
+        import tensorflow as tf
+
+        from ml.model_factory import build_pattern_model
+        from ml.numpy_lstm import NumpyLSTMModel
+
+        tf.keras.utils.set_random_seed(seed)
+        model = build_pattern_model(lookback=LOOKBACK)
+        model.save(paths.model_path(TICKER))
+        NumpyLSTMModel.from_keras_model(model).save_npz(paths.weights_path(TICKER))
+    else:
+        random_numpy_model(seed=seed).save_npz(paths.weights_path(TICKER))
+
+    return df
+
+
+# --- измерения ----------------------------------------------------------------
+
+def measure(fn, repeat=DEFAULT_REPEAT, setup=None):
+    """Время repeat запусков fn и отдельный запуск под tracemalloc; возвращает (запись, результат)."""
+    times = []
+    result = None
+    for _ in range(max(1, repeat)):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        result = fn()
+        times.append((time.perf_counter() - started) * 1000)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        _, traced_peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    record = {
+        'wall_ms': {
+            'median': round(float(np.median(times)), 3),
+            'min': round(min(times), 3),
+            'max': round(max(times), 3),
+        },
+        'runs': len(times),
+        'tracemalloc_peak_bytes': int(traced_peak),
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+    return record, result
+
+
+def run_size(rows, repeat=DEFAULT_REPEAT, engines=('numpy',), days=252, train_epoch=False, seed=0):
+    """Все этапы для одной длины истории во временном каталоге; возвращает словарь этапов."""
+    from ml import forecast, results
+    from ml.numpy_lstm import NumpyLSTMModel
+    from ml.snapshot import read_snapshot
+
+    with_keras = 'keras' in engines or train_epoch
+    saved = (paths.csv_dir, paths.models_dir, paths.forecast_cache_dir)
+    workdir = tempfile.mkdtemp(prefix='forecast-bench-')
+    paths.csv_dir = os.path.join(workdir, 'securities')
+    paths.models_dir = os.path.join(workdir, 'models')
+    paths.forecast_cache_dir = os.path.join(workdir, 'cache')
+
+    stages = {}
+    try:
+        started = time.perf_counter()
+        prepare_fixture(rows, with_keras=with_keras, seed=seed)
+        fixture_seconds = time.perf_counter() - started
+        store = os.path.join(paths.csv_dir, '.store')
+
+        def drop_store():
+            shutil.rmtree(store, ignore_errors=True)
+
+        stages['csv_parse_cold'], _ = measure(lambda: forecast.load_history_csv(TICKER), repeat, setup=drop_store)
+        forecast.load_history_csv(TICKER)
+        stages['csv_load_store'], df = measure(lambda: forecast.load_history_csv(TICKER), repeat)
+
+        def load_snapshot():
+            snapshot = read_snapshot(TICKER)
+            snapshot.last_sequence
+            snapshot.avg_volume(30)
+            return snapshot
+
+        stages['snapshot_load'], snapshot = measure(load_snapshot, repeat)
+        stages['scaler_load'], scaler = measure(lambda: forecast.load_scaler(paths.scaler_path(TICKER)), repeat)
+        stages['windows'], _ = measure(
+            lambda: forecast.prepare_pattern_data_local(df, lookback=LOOKBACK, forecast_days=FORECAST_DAYS,
+                                                        scaler_to_use=scaler), repeat)
+
+        models = {}
+        stages['model_load_numpy'], models['numpy'] = measure(
+            lambda: NumpyLSTMModel.from_npz(paths.weights_path(TICKER)), repeat)
+        if with_keras:
+            stages['model_load_keras'], models['keras'] = measure(
+                lambda: forecast.load_keras_model(paths.model_path(TICKER)), repeat)
+
+        result = None
+        drift = {}
+        for engine in engines:
+            artifacts = forecast.ModelArtifacts(TICKER, models[engine], scaler, snapshot, engine)
+            stages[f'rollout_{engine}'], result = measure(
+                lambda: forecast.run_forecast(artifacts, days=days, use_snapshot=True), repeat)
+            stages[f'rollout_{engine}_stateful'], stateful = measure(
+                lambda: forecast.run_forecast(artifacts, days=days, use_snapshot=True, rollout='stateful'), repeat)
+            drift[engine] = rollout_drift(result, stateful)
+
+        if result is not None:
+            stages['serialize_full'], _ = measure(lambda: json.dumps(result, ensure_ascii=False, indent=2), repeat)
+            stages['serialize_summary'], _ = measure(
+                lambda: json.dumps(results.summarize_result(result), ensure_ascii=False), repeat)
+
+        if train_epoch:
+            stages['train_epoch'] = _train_epoch(models['keras'], scaler, df)
+    finally:
+        paths.csv_dir, paths.models_dir, paths.forecast_cache_dir = saved
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {'rows': rows, 'fixture_seconds': round(fixture_seconds, 3), 'stages': stages, 'drift': drift}
+
+
+def rollout_drift(exact, approx):
+    """Расхождение цен закрытия stateful-прогноза с точным скользящим окном."""
+    exact_close = np.array([p['close'] for p in exact['predictions']], dtype=np.float64)
+    approx_close = np.array([p['close'] for p in approx['predictions']], dtype=np.float64)
+    rel = np.abs(approx_close - exact_close) / np.abs(exact_close)
+    return {
+        'max_abs': float(np.max(np.abs(approx_close - exact_close))),
+        'max_rel_pct': float(np.max(rel)) * 100,
+        'final_rel_pct': float(rel[-1]) * 100,
+    }
+
+
+def _train_epoch(model, scaler, df, batch_size=32):
+    """Одна эпоха обучения через tf.data, как в stock.py (без повторов - это дорого)."""
+    from ml.tf_pipeline import window_dataset
+
+    series = scaler.transform(df[['close']].values).astype(np.float32).ravel()
+    windows = len(series) - LOOKBACK - FORECAST_DAYS + 1
+    model.compile(optimizer='adam', loss='mse')
+    dataset = window_dataset(series, 0, windows, lookback=LOOKBACK, forecast_days=FORECAST_DAYS,
+                             batch_size=batch_size, shuffle=True, seed=0)
+
+    started = time.perf_counter()
+    model.fit(dataset, epochs=1, verbose=0)
+    seconds = time.perf_counter() - started
+    return {
+        'wall_ms': {'median': round(seconds * 1000, 3), 'min': round(seconds * 1000, 3),
+                    'max': round(seconds * 1000, 3)},
+        'runs': 1,
+        'samples_per_sec': round(windows / seconds, 1) if seconds > 0 else None,
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+
+
+def environment():
+    return {
+        'git_revision': git_revision(),
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run_benchmark(rows_list, repeat=DEFAULT_REPEAT, engines=('numpy',), days=252, train_epoch=False,
+                  isolate=True):
+    """Результат целиком: окружение и этапы по каждой длине истории."""
+    results = []
+    for rows in rows_list:
+        if isolate:
+            results.append(_run_size_in_subprocess(rows, repeat, engines, days, train_epoch))
+        else:
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stderr(devnull):
+                results.append(run_size(rows, repeat, engines, days, train_epoch))
+
+    return {
+        'version': RESULT_VERSION,
+        'benchmark': 'forecast',
+        'environment': environment(),
+        'params': {'repeat': repeat, 'engines': list(engines), 'days': days, 'lookback': LOOKBACK},
+        'sizes': results,
+    }
+
+
+def _run_size_in_subprocess(rows, repeat, engines, days, train_epoch):
+    command = [sys.executable, '-m', 'benchmarks.forecast_bench', '--child', '--rows', str(rows),
+               '--repeat', str(repeat), '--engines', ','.join(engines), '--days', str(days)]
+    if train_epoch:
+        command.append('--train-epoch')
+
+    env = dict(os.environ, TF_CPP_MIN_LOG_LEVEL='2')
+    proc = subprocess.run(command, cwd=paths.script_dir, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f'Бенчмарк для {rows} строк завершился с кодом {proc.returncode}:\n{proc.stderr[-2000:]}')
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+# --- сравнение ------------------------------------------------------------------
+
+def compare(base, new, threshold=DEFAULT_THRESHOLD):
+    """Строки сравнения медиан по общим этапам и список регрессий сверх threshold."""
+    base_sizes = {s['rows']: s for s in base['sizes']}
+    lines = [f"{'строк':>8}  {'этап':<24} {'было, мс':>12} {'стало, мс':>12} {'изм.':>8}  RSS"]
+    regressions = []
+
+    for size in new['sizes']:
+        old = base_sizes.get(size['rows'])
+        if old is None:
+            continue
+        for stage, record in size['stages'].items():
+            old_record = old['stages'].get(stage)
+            if old_record is None:
+                continue
+            before = old_record['wall_ms']['median']
+            after = record['wall_ms']['median']
+            change = (after / before - 1) if before > 0 else 0.0
+            mark = ''
+            if change > threshold:
+                mark = '  <-- регрессия'
+                regressions.append((size['rows'], stage, change))
+            lines.append(f"{size['rows']:>8}  {stage:<24} {before:>12.2f} {after:>12.2f} {change * 100:>+7.1f}%  "
+                         f"{format_bytes(old_record.get('peak_rss_bytes'))} -> "
+                         f"{format_bytes(record.get('peak_rss_bytes'))}{mark}")
+
+    return lines, regressions
+
+
+def _load_result(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Офлайн-бенчмарк конвейера прогноза на синтетических данных')
+    parser.add_argument('--rows', default=','.join(str(r) for r in DEFAULT_ROWS),
+                        help='Длины истории через запятую (по умолчанию 1000,10000,100000)')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help='Повторов каждого этапа, берется медиана (по умолчанию 3)')
+    parser.add_argument('--engines', default='numpy',
+                        help='Движки прогноза через запятую: numpy, keras (keras требует TensorFlow)')
+    parser.add_argument('--days', type=int, default=252, help='Горизонт прогноза (по умолчанию 252)')
+    parser.add_argument('--train-epoch', action='store_true',
+                        help='Дополнительно измерить одну эпоху обучения (требует TensorFlow)')
+    parser.add_argument('--output', help='Файл результата JSON (по умолчанию storage/logs/benchmarks/...)')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'),
+                        help='Сравнить два файла результатов; код возврата 1 при регрессии')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Допустимый рост медианы этапа для --compare (по умолчанию 0.2 = 20%%)')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        lines, regressions = compare(_load_result(args.compare[0]), _load_result(args.compare[1]), args.threshold)
+        print('\n'.join(lines))
+        if regressions:
+            print(f'Регрессий: {len(regressions)}')
+        return 1 if regressions else 0
+
+    rows_list = [int(r) for r in args.rows.split(',') if r.strip()]
+    engines = tuple(e.strip() for e in args.engines.split(',') if e.strip())
+    unknown = [e for e in engines if e not in ('numpy', 'keras')]
+    if unknown:
+        parser.error(f'неизвестный движок: {", ".join(unknown)}')
+    if ('keras' in engines or args.train_epoch) and not tensorflow_available():
+        parser.error('для движка keras и --train-epoch нужен TensorFlow')
+
+    if args.child:
+        # Дочерний процесс: одна длина, результат - последней строкой stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            result = run_size(rows_list[0], args.repeat, engines, args.days, args.train_epoch)
+        print(json.dumps(result))
+        return 0
+
+    result = run_benchmark(rows_list, args.repeat, engines, args.days, args.train_epoch)
+    output = args.output or default_output_path(result['environment']['git_revision'])
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    for size in result['sizes']:
+        print(f"{size['rows']} строк:")
+        for stage, record in size['stages'].items():
+            print(f"  {stage:<24} {record['wall_ms']['median']:>10.2f} мс  "
+                  f"tracemalloc {format_bytes(record.get('tracemalloc_peak_bytes'))}  "
+                  f"RSS {format_bytes(record.get('peak_rss_bytes'))}")
+        for engine, drift in size.get('drift', {}).items():
+            print(f"  расхождение stateful ({engine}): макс. {drift['max_rel_pct']:.2g}%, "
+                  f"на последнем шаге {drift['final_rel_pct']:.2g}%")
+    print(f'Результат сохранен: {output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -28,6 +28,20 @@
         'region' => env('AWS_DEFAULT_REGION', 'us-east-1'),
     ],
 
+    'forecast_daemon' => [
+        'url' => env('FORECAST_DAEMON_URL'),
+        'timeout' => env('FORECAST_DAEMON_TIMEOUT', 60),
+    ],
+
+    'forecast_uncertainty' => [
+        'samples' => env('FORECAST_MC_SAMPLES', 0),
+    ],
+
+    'training' => [
+        'max_parallel' => env('TRAINING_MAX_PARALLEL', 2),
+        'retrain_budget_minutes' => env('RETRAIN_BUDGET_MINUTES', 120),
+    ],
+
     'slack' => [
         'notifications' => [
             'bot_user_oauth_token' => env('SLACK_BOT_USER_OAUTH_TOKEN'),
@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+"""Общий код прогнозирования для stock.py и predict_future.py."""
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""Walk-forward бэктест обученных моделей на исторических точках отсчета.
+
+Из каждой точки отсчета (anchor) модель строит прогноз, как predict_future.py
+из последней свечи, и прогноз сравнивается с тем, что было на самом деле.
+Все точки идут одним батчем: шаг горизонта - последовательное измерение,
+число точек - ширина батча, поэтому годы точек отсчета стоят 252 вызова модели,
+а не 252 вызова на каждую точку. Ошибка считается по горизонтам (по умолчанию
+1, 21, 63 и 252 торговых дня), тикеры обрабатываются в пуле процессов.
+
+По умолчанию точки отсчета берутся с начала тестовой части ряда (последние 20%
+окон, как в оценке stock.py): более ранние попали в обучение модели.
+
+    python -m ml.backtest SBER,GAZP [--step 5] [--horizons 1,21,63,252] [--engine numpy]
+"""
+
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from ml.results import ROLLOUTS, ForecastError, check_model_exists, error_payload
+from ml.timings import Timings
+
+DEFAULT_HORIZONS = (1, 21, 63, 252)
+DEFAULT_LOOKBACK = 60
+# Доля окон, на которой stock.py обучает модель; тест - остальное
+TRAIN_FRACTION = 0.8
+# Точек отсчета в одном батче модели: ограничивает память на длинной истории
+DEFAULT_BATCH = 1024
+
+
+def parse_horizons(value):
+    """'1,21,63,252' -> (1, 21, 63, 252); ValueError при неположительных значениях."""
+    horizons = tuple(sorted({int(h) for h in str(value).split(',') if h.strip()}))
+    if not horizons or horizons[0] < 1:
+        raise ValueError(f'Горизонты должны быть положительными: {value}')
+    return horizons
+
+
+def anchor_indices(times, lookback, step=1, start=None, max_anchors=None):
+    """Индексы последней известной свечи каждой точки отсчета.
+
+    start - дата 'YYYY-MM-DD' первой точки; по умолчанию начало тестовой части.
+    """
+    n = len(times)
+    if start is None:
+        first = int((n - lookback) * TRAIN_FRACTION) + lookback - 1
+    else:
+        first = int(np.searchsorted(np.asarray(times, dtype=str), str(start)))
+    first = max(first, lookback - 1)
+
+    # У каждой точки должна быть хотя бы одна следующая свеча для сравнения
+    anchors = np.arange(first, n - 1, max(1, int(step)))
+    if max_anchors and len(anchors) > max_anchors:
+        anchors = anchors[-max_anchors:]
+    return anchors
+
+
+def rollout_paths(artifacts, windows, steps, rollout='window'):
+    """Масштабированные прогнозы (точки, steps) из окон (точки, lookback, 1): один вызов модели на шаг."""
+    out = np.empty((len(windows), steps), dtype=np.float32)
+    if rollout == 'stateful':
+        stepper = artifacts.start_stateful(windows)
+        pred = stepper.output
+        for h in range(steps):
+            if h:
+                pred = stepper.step(pred)
+            out[:, h] = pred[:, 0]
+        return out
+
+    seqs = np.array(windows, dtype=np.float32)
+    for h in range(steps):
+        pred = np.asarray(artifacts.model.predict(seqs, verbose=0))
+        out[:, h] = pred[:, 0]
+        seqs[:, :-1] = seqs[:, 1:]
+        seqs[:, -1, 0] = pred[:, 0]
+    return out
+
+
+def horizon_errors(predicted, actual, base):
+    """Ошибки прогноза на одном горизонте; base - цена в точке отсчета (для направления)."""
+    err = predicted - actual
+    nonzero = actual != 0
+    mape = float(np.mean(np.abs(err[nonzero] / actual[nonzero])) * 100) if nonzero.any() else None
+    return {
+        'count': int(len(actual)),
+        'mae': float(np.mean(np.abs(err))),
+        'rmse': float(np.sqrt(np.mean(err ** 2))),
+        'mape': mape,
+        # Та же метрика, что accuracy в снимке stock.py
+        'accuracy': max(0.0, min(100.0, 100 - mape)) if mape is not None else None,
+        'direction_accuracy': float(np.mean(np.sign(predicted - base) == np.sign(actual - base)) * 100),
+    }
+
+
+def run_backtest(artifacts, df, horizons=DEFAULT_HORIZONS, step=1, start=None, max_anchors=None,
+                 rollout='window', batch=DEFAULT_BATCH, timings=None):
+    """Бэктест одного тикера по истории df (колонки time, close)."""
+    if rollout not in ROLLOUTS:
+        raise ForecastError(f'Неизвестный режим прогноза: {rollout}')
+    timings = timings or Timings()
+    snapshot = artifacts.snapshot
+    lookback = int(snapshot.get('lookback', DEFAULT_LOOKBACK)) if snapshot else DEFAULT_LOOKBACK
+
+    history = df[df['close'].notna()]
+    times = history['time'].astype(str).to_numpy()
+    close = history['close'].to_numpy(dtype=np.float64)
+
+    with timings.stage('windows'):
+        anchors = anchor_indices(times, lookback, step=step, start=start, max_anchors=max_anchors)
+        if len(anchors) == 0:
+            raise ForecastError(f'Недостаточно данных для бэктеста: {len(close)} записей при окне {lookback}')
+        scaled = artifacts.scaler.transform(close.reshape(-1, 1)).astype(np.float32).reshape(-1)
+        # Окно точки a - свечи a-lookback+1..a включительно
+        all_windows = np.lib.stride_tricks.sliding_window_view(scaled, lookback)
+        windows = all_windows[anchors - lookback + 1][:, :, None]
+
+    # Дальше последней свечи сравнивать не с чем - шаги за ней не считаются
+    steps = min(max(horizons), len(close) - 1 - int(anchors[0]))
+    with timings.stage('rollout'):
+        scaled_paths = np.concatenate([rollout_paths(artifacts, windows[i:i + batch], steps, rollout)
+                                       for i in range(0, len(windows), batch)])
+
+    with timings.stage('metrics'):
+        prices = artifacts.scaler.inverse_transform(scaled_paths.reshape(-1, 1)).reshape(scaled_paths.shape)
+        report = {}
+        for h in horizons:
+            valid = anchors + h < len(close)
+            if h > steps or not valid.any():
+                report[str(h)] = {'count': 0}
+                continue
+            report[str(h)] = horizon_errors(prices[valid, h - 1], close[anchors[valid] + h], close[anchors[valid]])
+
+    return {
+        'ticker': artifacts.ticker,
+        'engine': artifacts.engine,
+        'rollout': rollout,
+        'lookback': lookback,
+        'anchors': int(len(anchors)),
+        'first_anchor': times[anchors[0]],
+        'last_anchor': times[anchors[-1]],
+        'step': int(step),
+        'horizons': report,
+    }
+
+
+def backtest_ticker(ticker, engine='numpy', horizons=DEFAULT_HORIZONS, step=1, start=None, max_anchors=None,
+                    rollout='window'):
+    from ml.forecast import ModelArtifacts, load_history_csv
+
+    timings = Timings()
+    try:
+        check_model_exists(ticker)
+        artifacts = ModelArtifacts.load(ticker, with_snapshot=True, engine=engine, timings=timings, with_direct=False)
+        with timings.stage('csv_parse'):
+            df = load_history_csv(ticker)
+        result = run_backtest(artifacts, df, horizons=horizons, step=step, start=start, max_anchors=max_anchors,
+                              rollout=rollout, timings=timings)
+    except Exception as e:
+        result = {'ticker': ticker, **error_payload(e)}
+    return {**result, 'timings': timings.to_dict()}
+
+
+def run_backtests(tickers, engine='numpy', horizons=DEFAULT_HORIZONS, step=1, start=None, max_anchors=None,
+                  rollout='window', workers=None, threads_per_worker=None):
+    """Бэктест нескольких тикеров в пуле процессов; по JSON-строке на тикер в stdout.
+
+    Возвращает количество тикеров, завершившихся ошибкой.
+    """
+    from ml.batch import _init_worker, pool_thread_limits
+
+    cpu_count = os.cpu_count() or 1
+    workers = max(1, min(workers or cpu_count, len(tickers)))
+    threads = threads_per_worker or max(1, cpu_count // workers)
+
+    failed = 0
+    # spawn: fork процесса с уже инициализированным TensorFlow небезопасен
+    context = multiprocessing.get_context('spawn')
+    with pool_thread_limits(threads), \
+            ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                initializer=_init_worker, initargs=(threads, engine)) as pool:
+        futures = {
+            pool.submit(backtest_ticker, ticker, engine, horizons, step, start, max_anchors, rollout): ticker
+            for ticker in tickers
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'ticker': futures[future], 'error': f'Ошибка воркера: {str(e)}'}
+
+            if 'error' in result:
+                failed += 1
+
+            sys.stdout.write(json.dumps(result, ensure_ascii=False) + '\n')
+            sys.stdout.flush()
+
+    return failed
+
+
+def main(argv=None):
+    import argparse
+
+    from ml.train_batch import all_tickers
+
+    parser = argparse.ArgumentParser(prog='python -m ml.backtest',
+                                     description='Walk-forward бэктест обученных моделей по горизонтам')
+    parser.add_argument('tickers', help='Тикеры через запятую или all - все тикеры, для которых есть CSV')
+    parser.add_argument('--horizons', default=','.join(str(h) for h in DEFAULT_HORIZONS),
+                        help='Горизонты в торговых днях через запятую (по умолчанию 1,21,63,252)')
+    parser.add_argument('--step', type=int, default=1,
+                        help='Шаг между точками отсчета в свечах (по умолчанию 1 - каждая свеча)')
+    parser.add_argument('--from', dest='start',
+                        help='Дата первой точки отсчета YYYY-MM-DD (по умолчанию начало тестовой части ряда)')
+    parser.add_argument('--max-anchors', type=int, default=None,
+                        help='Не больше стольких последних точек отсчета на тикер')
+    parser.add_argument('--engine', choices=['keras', 'numpy'], default='numpy',
+                        help='Движок инференса (по умолчанию numpy - без TensorFlow)')
+    parser.add_argument('--rollout', choices=list(ROLLOUTS), default='window',
+                        help='window - точный прогноз скользящим окном (по умолчанию), stateful - приближенный')
+    parser.add_argument('--workers', type=int, default=None, help='Процессов (по умолчанию по числу ядер)')
+    parser.add_argument('--threads-per-worker', type=int, default=None,
+                        help='Потоков BLAS/TensorFlow на процесс (по умолчанию ядра / workers)')
+    args = parser.parse_args(argv)
+
+    try:
+        horizons = parse_horizons(args.horizons)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.tickers.strip().lower() == 'all':
+        tickers = all_tickers()
+    else:
+        tickers = [t.strip().upper() for t in args.tickers.split(',') if t.strip()]
+    if not tickers:
+        parser.error('не указано ни одного тикера')
+
+    failed = run_backtests(tickers, engine=args.engine, horizons=horizons, step=args.step, start=args.start,
+                           max_anchors=args.max_anchors, rollout=args.rollout, workers=args.workers,
+                           threads_per_worker=args.threads_per_worker)
+    return 1 if failed == len(tickers) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+
+THREAD_ENV_VARS = (
+    'OMP_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'NUMEXPR_NUM_THREADS',
+    'TF_NUM_INTRAOP_THREADS',
+    'TF_NUM_INTEROP_THREADS',
+)
+
+
+def limit_threads(threads):
+    """Ограничивает потоки BLAS/TensorFlow; действует на модули, импортированные после вызова."""
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+
+
+@contextmanager
+def pool_thread_limits(threads):
+    """Лимиты потоков в окружении только на время жизни пула, затем прежние значения.
+
+    Воркеры spawn импортируют главный модуль (например, ml.backtest с NumPy) до
+    initializer'а, поэтому BLAS должен увидеть лимит уже в унаследованном окружении.
+    Вызывающий процесс (сервис, последующие подпроцессы) лимиты не наследует.
+    """
+    saved = {name: os.environ.get(name) for name in THREAD_ENV_VARS}
+    limit_threads(threads)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def _init_worker(threads, engine):
+    limit_threads(threads)
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+
+    if engine == 'keras':
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    # Тяжелые импорты выполняются один раз на воркер, а не на каждый тикер
+    import ml.forecast  # noqa: F401
+
+
+def _forecast_ticker(ticker, days, use_snapshot, engine, use_cache, output='full', metrics_file=None, samples=0,
+                     quantiles=None, seed=0, rollout='window', store=True, recursive=False):
+    from ml.forecast import ModelArtifacts, run_forecast
+    from ml.forecast_store import is_default_run, store_result
+    from ml.result_cache import ResultCache, cached_forecast
+    from ml.results import DEFAULT_QUANTILES, check_model_exists, error_payload, forecast_options, summarize_result
+    from ml.timings import Timings, write_metrics
+
+    timings = Timings()
+    quantiles = quantiles or DEFAULT_QUANTILES
+
+    def compute():
+        artifacts = ModelArtifacts.load(ticker, with_snapshot=use_snapshot, engine=engine, timings=timings,
+                                        with_direct=not recursive)
+        return run_forecast(artifacts, days=days, use_snapshot=use_snapshot, timings=timings, samples=samples,
+                            quantiles=quantiles, seed=seed, rollout=rollout)
+
+    try:
+        check_model_exists(ticker)
+        cache = ResultCache() if use_cache else None
+        result = cached_forecast(cache, ticker, days, use_snapshot, engine, compute,
+                                 forecast_options(samples, quantiles, seed, rollout, recursive))
+        if store and is_default_run(days, samples, rollout, recursive):
+            with timings.stage('store'):
+                store_result(result)
+        payload = summarize_result(result) if output == 'summary' else result
+    except Exception as e:
+        payload = {'ticker': ticker, **error_payload(e)}
+
+    report = timings.to_dict()
+    if metrics_file:
+        write_metrics(metrics_file, report, 'predict_future', ticker)
+    return {**payload, 'timings': report}
+
+
+def _output_lines(result, output):
+    """Строки stdout по тикеру: результат одной строкой, для ndjson - его события meta/prediction/summary
+    подряд (или одно событие error); timings - в последней строке."""
+    if output != 'ndjson':
+        return [result]
+    from ml.results import result_events
+
+    if 'error' in result:
+        return [{'type': 'error', **result}]
+    report = result.pop('timings', None)
+    events = list(result_events(result))
+    if report is not None:
+        events[-1]['timings'] = report
+    return events
+
+
+def run_batch(tickers, days=252, use_snapshot=True, engine='keras', workers=None, threads_per_worker=None,
+              use_cache=True, output='full', metrics_file=None, samples=0, quantiles=None, seed=0,
+              rollout='window', store=True, recursive=False):
+    """Прогноз по нескольким тикерам в пуле процессов.
+
+    Результаты печатаются в stdout по мере готовности тикеров - как --output в predict_future.py:
+    full - полный результат одной JSON-строкой на тикер, summary - только итоговые поля
+    (см. summarize_result), ndjson - события тикера подряд, по строке на шаг прогноза.
+    Каждый тикер несет свои timings; metrics_file - куда их дополнительно записать.
+    samples > 0 - полосы неопределенности Monte Carlo dropout, rollout - режим шага (см. forecast_events),
+    recursive=True - пошаговый прогноз даже при наличии прямой модели горизонта.
+    store - сохранять рассчитанные прогнозы в хранилище прогнозов (ml/forecast_store.py);
+    сохраняется только режим по умолчанию (is_default_run).
+    Возвращает количество тикеров, завершившихся ошибкой.
+    """
+    cpu_count = os.cpu_count() or 1
+    workers = max(1, min(workers or cpu_count, len(tickers)))
+    threads = threads_per_worker or max(1, cpu_count // workers)
+
+    failed = 0
+    # spawn: fork процесса с уже инициализированным TensorFlow небезопасен
+    context = multiprocessing.get_context('spawn')
+    with pool_thread_limits(threads), \
+            ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                initializer=_init_worker, initargs=(threads, engine)) as pool:
+        futures = {
+            pool.submit(_forecast_ticker, ticker, days, use_snapshot, engine, use_cache, output,
+                        metrics_file, samples, quantiles, seed, rollout, store, recursive): ticker
+            for ticker in tickers
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'ticker': futures[future], 'error': f'Ошибка воркера: {str(e)}'}
+
+            if 'error' in result:
+                failed += 1
+
+            sys.stdout.write(''.join(json.dumps(line, ensure_ascii=False) + '\n'
+                                     for line in _output_lines(result, output)))
+            sys.stdout.flush()
+
+    return failed
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""Прямая модель горизонта: весь прогноз за один проход модели.
+
+Рекурсивный прогноз (ml/forecast.py) вызывает модель на каждый из 252 шагов
+и подает ее выход обратно в окно: время растет линейно с горизонтом, ошибки
+шагов накапливаются. Прямая модель - та же архитектура (ml/model_factory.py)
+с выходом Dense(len(horizons)): по последнему окну она сразу дает
+масштабированную цену через h торговых дней для каждого горизонта h.
+
+Горизонты (stock.py --direct [full|checkpoints]):
+    full        - каждый день 1..252;
+    checkpoints - контрольные точки 1/5/21/63/126/252 (CHECKPOINT_DAYS в ml/results.py),
+                  дни между ними - линейная интерполяция.
+
+Модель обучается stock.py вместе с моделью тикера и с тем же scaler'ом:
+models/lstm_direct_<ticker>.h5, .npz - веса для NumPy-движка, .json - горизонты
+и метрики. Прогноз берет ее сам (ModelArtifacts.direct), если она не старше
+модели тикера и режим допускает один проход: без Monte Carlo dropout,
+--rollout window, горизонт не длиннее обученного.
+"""
+
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+from ml import paths
+from ml.results import CHECKPOINT_DAYS, log
+
+DIRECT_VERSION = 1
+HORIZON_MODES = ('full', 'checkpoints')
+DEFAULT_HORIZON = 252
+# Меньше окон - прямую модель не обучаем: у дальних горизонтов почти нет примеров
+MIN_WINDOWS = 20
+
+
+def horizons_for(mode, days=DEFAULT_HORIZON):
+    """Горизонты выхода модели в торговых днях."""
+    if mode not in HORIZON_MODES:
+        raise ValueError(f'Неизвестный режим горизонтов: {mode}')
+    if mode == 'checkpoints':
+        return [d for d in CHECKPOINT_DAYS if d < days] + [days]
+    return list(range(1, days + 1))
+
+
+def expand_horizons(values, horizons, days, last_value):
+    """Масштабированный прогноз на шаги 1..days по выходам модели для horizons.
+
+    Между горизонтами - линейная интерполяция, до первого - от последнего
+    известного значения ряда; при горизонтах 1..N значения не меняются.
+    """
+    grid = np.concatenate([[0], np.asarray(horizons, dtype=np.float64)])
+    known = np.concatenate([[last_value], np.asarray(values, dtype=np.float64).reshape(-1)])
+    return np.interp(np.arange(1, days + 1), grid, known).astype(np.float32)
+
+
+def window_count(series_length, lookback, horizons):
+    return series_length - lookback - max(horizons) + 1
+
+
+def train_direct(series, scaler, lookback, horizons, hyperparams, cache=False):
+    """Обучает прямую модель по масштабированному ряду series; возвращает (модель, метрики).
+
+    Разбиение окон как в stock.py: 80% - обучение (из них последние 20% - валидация),
+    20% - тест. Метрики - MAPE по контрольным точкам на тестовой части.
+    """
+    from tensorflow.keras.callbacks import EarlyStopping
+
+    from ml.model_factory import build_pattern_model
+    from ml.tf_pipeline import ThroughputLogger, window_dataset
+
+    n_windows = window_count(len(series), lookback, horizons)
+    if n_windows < MIN_WINDOWS:
+        raise ValueError(f'Недостаточно данных для прямой модели: нужно минимум '
+                         f'{lookback + max(horizons) + MIN_WINDOWS - 1} записей, есть {len(series)}')
+
+    train_size = int(n_windows * 0.8)
+    fit_size = int(train_size * 0.8)
+    batch_size = hyperparams['batch_size']
+
+    def dataset(start, end, shuffle=False):
+        return window_dataset(series, start, end, lookback=lookback, batch_size=batch_size, shuffle=shuffle,
+                              cache=cache, horizons=horizons)
+
+    model = build_pattern_model(lookback=lookback, units=hyperparams['units'], lstm_layers=hyperparams['lstm_layers'],
+                                dropout=hyperparams['dropout'], outputs=len(horizons))
+    model.compile(optimizer='adam', loss='mse', metrics=['mae'])
+    throughput = ThroughputLogger(samples_per_epoch=fit_size)
+    history = model.fit(
+        dataset(0, fit_size, shuffle=True),
+        validation_data=dataset(fit_size, train_size),
+        epochs=hyperparams['epochs'],
+        callbacks=[EarlyStopping(monitor='val_loss', patience=10, restore_best_weights=True), throughput],
+        verbose=2,
+    )
+
+    metrics = {'windows': int(n_windows), 'epochs_run': len(history.history.get('loss', [])),
+               'epochs': throughput.epochs, 'mape': {}}
+    if n_windows > train_size:
+        predicted = model.predict(dataset(train_size, n_windows), verbose=0)
+        starts = np.arange(train_size, n_windows)
+        for column, h in enumerate(horizons):
+            if h not in CHECKPOINT_DAYS and h != horizons[-1]:
+                continue
+            actual = scaler.inverse_transform(series[starts + lookback + h - 1].reshape(-1, 1)).ravel()
+            pred = scaler.inverse_transform(predicted[:, column].reshape(-1, 1)).ravel()
+            nonzero = actual != 0
+            if nonzero.any():
+                errors = np.abs((actual[nonzero] - pred[nonzero]) / actual[nonzero])
+                metrics['mape'][str(h)] = float(np.mean(errors) * 100)
+    return model, metrics
+
+
+def save_direct(ticker, model, meta):
+    """Keras-модель, веса NumPy-движка и метаданные прямой модели тикера."""
+    from ml.numpy_lstm import NumpyLSTMModel
+
+    os.makedirs(paths.models_dir, exist_ok=True)
+    model_path = paths.direct_model_path(ticker)
+    try:
+        model.save(model_path, save_format='h5')
+    except (TypeError, ValueError):
+        model.save(model_path)
+    try:
+        NumpyLSTMModel.from_keras_model(model).save_npz(paths.direct_weights_path(ticker))
+    except Exception as e:
+        print(f"Не удалось сохранить веса прямой модели для NumPy-движка: {str(e)}")
+
+    meta = {'version': DIRECT_VERSION, 'trained_at': datetime.now().isoformat(), **meta}
+    meta_path = paths.direct_meta_path(ticker)
+    tmp_path = f'{meta_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, meta_path)
+
+
+class DirectModel:
+    """Загруженная прямая модель: окно (lookback, 1) -> масштабированный прогноз на days шагов."""
+
+    def __init__(self, model, meta, engine='keras'):
+        self.model = model
+        self.meta = meta
+        self.engine = engine
+        self.horizons = [int(h) for h in meta['horizons']]
+        self.lookback = int(meta['lookback'])
+
+    @property
+    def max_horizon(self):
+        return self.horizons[-1]
+
+    @property
+    def mode(self):
+        """forecast_mode результата: direct - выход на каждый день, direct_checkpoints - с интерполяцией."""
+        return 'direct' if self.horizons == list(range(1, self.max_horizon + 1)) else 'direct_checkpoints'
+
+    def forecast(self, window, days):
+        window = np.asarray(window, dtype=np.float32)
+        values = np.asarray(self.model.predict(window[None], verbose=0))[0]
+        return expand_horizons(values, self.horizons, days, float(window[-1, 0]))
+
+
+def load_direct(ticker, engine='keras'):
+    """Прямая модель тикера или None: ее нет, она старше модели тикера или не загружается."""
+    model_path = paths.direct_model_path(ticker)
+    try:
+        if os.path.getmtime(model_path) < os.path.getmtime(paths.model_path(ticker)):
+            # Модель тикера переобучена без --direct: scaler мог измениться
+            return None
+        with open(paths.direct_meta_path(ticker), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != DIRECT_VERSION:
+        return None
+
+    try:
+        if engine == 'numpy':
+            try:
+                from ml.numpy_lstm import load_numpy_model
+                return DirectModel(load_numpy_model(model_path, paths.direct_weights_path(ticker)), meta, 'numpy')
+            except Exception as e:
+                log({'warning': f'NumPy-движок недоступен для прямой модели {ticker}: {str(e)}. Используется Keras.'})
+
+        from ml.forecast import load_keras_model
+        return DirectModel(load_keras_model(model_path), meta, 'keras')
+    except Exception as e:
+        log({'warning': f'Не удалось загрузить прямую модель {ticker}: {str(e)}. Используется пошаговый прогноз.'})
+        return None
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""Переобучение по дрейфу данных: только устаревшие и дрейфующие модели, в пределах бюджета CPU.
+
+Для каждого тикера с моделью ряд из CSV сравнивается со снимком прошлого
+обучения дешевыми векторными проверками:
+
+    new_rows    - сколько свечей добавилось после обучения;
+    range       - сколько новых цен закрытия вышло за min/max scaler'а
+                  (модель видит такие цены за пределами [0, 1]) и насколько;
+    recent_mape - ошибка прогнозов на шаг вперед по последним error_window
+                  свечам (все окна - одним вызовом модели) против MAPE модели
+                  на тестовой части при обучении (mape в снимке).
+
+Решение по тикеру:
+    full        - цены вышли за диапазон scaler'а, ошибка выросла больше чем
+                  в max_error_ratio раз, снимка нет или история изменилась;
+    incremental - только новые свечи (не меньше min_new_rows): дообучение
+                  stock.py --incremental (оно само перейдет на полное, если нужно);
+    None        - модель актуальна.
+
+Очередь упорядочена по серьезности (выход за диапазон, рост ошибки, число
+новых свечей) и обрезается бюджетом CPU: оценка стоимости тикера - длительность
+его прошлого обучения из models/training_status.json, умноженная на число потоков.
+Обучение идет очередью ml/train_batch.py; прямая модель горизонта (ml/direct.py),
+если она была, обучается заново в том же режиме.
+
+    python -m ml.drift [--tickers SBER,GAZP|all] [--budget-minutes 120] [--dry-run]
+    python stock.py --retrain-drifted ...   (то же, для запуска из Laravel)
+"""
+
+import json
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+
+from ml import paths
+from ml.results import ForecastError
+
+MIN_NEW_ROWS = 5
+ERROR_WINDOW = 20
+MAX_ERROR_RATIO = 1.5
+DEFAULT_BUDGET_MINUTES = 120
+# Оценка обучения тикера, у которого еще нет замера длительности
+DEFAULT_TRAIN_SECONDS = 300
+
+
+def range_breach(new_close, data_min, data_max):
+    """(число цен вне [data_min, data_max], наибольший выход в долях диапазона scaler'а)."""
+    new_close = np.asarray(new_close, dtype=np.float64)
+    if not len(new_close):
+        return 0, 0.0
+    span = max(data_max - data_min, 1e-12)
+    outside = int(np.count_nonzero((new_close < data_min) | (new_close > data_max)))
+    excess = max(0.0, (new_close.max() - data_max) / span, (data_min - new_close.min()) / span)
+    return outside, float(excess)
+
+
+def recent_mape(model, scaler, close, lookback, window=ERROR_WINDOW):
+    """MAPE прогнозов на шаг вперед для последних window цен; None, если ряд короче lookback + 1."""
+    from ml.windowing import make_windows
+
+    close = np.asarray(close, dtype=np.float64)
+    window = min(window, len(close) - lookback)
+    if window <= 0:
+        return None
+    tail = scaler.transform(close[-(lookback + window):].reshape(-1, 1))
+    X, _ = make_windows(tail, lookback=lookback, forecast_days=1)
+    pred = scaler.inverse_transform(np.asarray(model.predict(np.ascontiguousarray(X), verbose=0)).reshape(-1, 1))
+    actual = close[-window:]
+    nonzero = actual != 0
+    if not nonzero.any():
+        return None
+    return float(np.mean(np.abs((actual[nonzero] - pred.ravel()[nonzero]) / actual[nonzero])) * 100)
+
+
+def estimated_cpu_seconds(ticker, status):
+    """Стоимость переобучения: длительность прошлого обучения x потоков, с которыми оно шло."""
+    entry = status.get('tickers', {}).get(ticker, {})
+    threads = entry.get('threads') or os.cpu_count() or 1
+    return float(entry.get('duration') or DEFAULT_TRAIN_SECONDS) * threads
+
+
+def check_ticker(ticker, min_new_rows=MIN_NEW_ROWS, max_error_ratio=MAX_ERROR_RATIO, error_window=ERROR_WINDOW,
+                 status=None):
+    """Статистики дрейфа тикера и решение: action - full, incremental или None."""
+    from ml.forecast import load_history_csv, load_model_for_engine
+    from ml.scaler import load_scaler
+    from ml.snapshot import read_snapshot
+
+    report = {'ticker': ticker, 'reasons': [], 'action': None}
+    if not os.path.exists(paths.model_path(ticker)):
+        report['reasons'].append('no_model')
+        return report
+
+    report['cpu_seconds'] = estimated_cpu_seconds(ticker, status or {})
+    if not paths.snapshot_exists(ticker):
+        report.update(reasons=['no_snapshot'], action='full')
+        return report
+
+    snapshot = read_snapshot(ticker)
+    # Тот же ряд (ml/price_store.py, load_history), по которому stock.py записал records_count
+    close = load_history_csv(ticker)['close'].to_numpy(dtype=np.float64)
+    new_rows = len(close) - snapshot.records_count
+    report['new_rows'] = int(new_rows)
+    if new_rows < 0:
+        report.update(reasons=['history_changed'], action='full')
+        return report
+
+    scaler = load_scaler(paths.scaler_path(ticker))
+    outside, excess = range_breach(close[snapshot.records_count:], scaler.data_min_[0], scaler.data_max_[0])
+    report['range'] = {'min': float(scaler.data_min_[0]), 'max': float(scaler.data_max_[0]), 'outside': outside,
+                       'excess': round(excess, 4)}
+
+    model, _ = load_model_for_engine(ticker, 'numpy')
+    report['recent_mape'] = recent_mape(model, scaler, close, int(snapshot.get('lookback', 60)), error_window)
+    report['train_mape'] = snapshot.get('mape')
+    if report['recent_mape'] is not None and report['train_mape']:
+        report['error_ratio'] = round(report['recent_mape'] / report['train_mape'], 3)
+
+    if outside:
+        report['reasons'].append('range')
+    if report.get('error_ratio', 0) > max_error_ratio:
+        report['reasons'].append('error')
+    if report['reasons']:
+        report['action'] = 'full'
+    elif new_rows >= min_new_rows:
+        report.update(reasons=['stale'], action='incremental')
+    return report
+
+
+def _severity(report):
+    range_excess = report.get('range', {}).get('excess', 0.0)
+    structural = report['reasons'][0] in ('no_snapshot', 'history_changed')
+    return structural, range_excess, report.get('error_ratio') or 0.0, report.get('new_rows') or 0
+
+
+def plan(reports, budget_seconds):
+    """Тикеры к переобучению по убыванию серьезности, пока хватает бюджета; (очередь, не вошедшие)."""
+    candidates = sorted((r for r in reports if r['action']), key=_severity, reverse=True)
+    queued, deferred, spent = [], [], 0.0
+    for report in candidates:
+        # Первый тикер обучается всегда: иначе при маленьком бюджете не обучится никто
+        if queued and spent + report['cpu_seconds'] > budget_seconds:
+            deferred.append(report)
+            continue
+        spent += report['cpu_seconds']
+        queued.append(report)
+    return queued, deferred
+
+
+def _direct_mode(ticker):
+    try:
+        with open(paths.direct_meta_path(ticker), 'r', encoding='utf-8') as f:
+            return json.load(f).get('mode')
+    except (OSError, ValueError):
+        return None
+
+
+def retrain(queued, max_parallel, threads_per_job=None):
+    """Обучает очередь группами (режим, прямая модель); возвращает число тикеров с ошибкой."""
+    from ml.train_batch import run_training_batch
+
+    groups = {}
+    for report in queued:
+        key = (report['action'] == 'incremental', _direct_mode(report['ticker']))
+        groups.setdefault(key, []).append(report['ticker'])
+
+    failed = 0
+    for (incremental, direct), tickers in groups.items():
+        failed += run_training_batch(tickers, max_parallel=max_parallel, threads_per_job=threads_per_job, force=True,
+                                     incremental=incremental, direct=direct)
+    return failed
+
+
+def main(argv=None):
+    import argparse
+
+    from ml.train_batch import DEFAULT_MAX_PARALLEL, all_tickers, read_status, update_status
+
+    parser = argparse.ArgumentParser(prog='python -m ml.drift',
+                                     description='Переобучение только устаревших и дрейфующих моделей')
+    parser.add_argument('--tickers', default='all', help='Тикеры через запятую или all (по умолчанию)')
+    parser.add_argument('--budget-minutes', type=float,
+                        default=float(os.environ.get('RETRAIN_BUDGET_MINUTES') or DEFAULT_BUDGET_MINUTES),
+                        help='Бюджет на переобучение в CPU-минутах (по умолчанию RETRAIN_BUDGET_MINUTES '
+                             f'или {DEFAULT_BUDGET_MINUTES})')
+    parser.add_argument('--min-new-rows', type=int, default=MIN_NEW_ROWS,
+                        help=f'Сколько новых свечей делает модель устаревшей (по умолчанию {MIN_NEW_ROWS})')
+    parser.add_argument('--max-error-ratio', type=float, default=MAX_ERROR_RATIO,
+                        help='Во сколько раз ошибка на последних свечах может превысить MAPE при обучении '
+                             f'(по умолчанию {MAX_ERROR_RATIO})')
+    parser.add_argument('--error-window', type=int, default=ERROR_WINDOW,
+                        help=f'По скольким последним свечам считается ошибка (по умолчанию {ERROR_WINDOW})')
+    parser.add_argument('--max-parallel', type=int, default=DEFAULT_MAX_PARALLEL)
+    parser.add_argument('--threads-per-job', type=int, default=None)
+    parser.add_argument('--dry-run', action='store_true', help='Только отчет, без обучения')
+    args = parser.parse_args(argv)
+
+    if args.tickers.strip().lower() == 'all':
+        tickers = all_tickers()
+    else:
+        tickers = [t.strip().upper() for t in args.tickers.split(',') if t.strip()]
+
+    status = read_status()
+    reports = []
+    for ticker in tickers:
+        try:
+            report = check_ticker(ticker, args.min_new_rows, args.max_error_ratio, args.error_window, status)
+        except (ForecastError, OSError, ValueError, KeyError) as e:
+            report = {'ticker': ticker, 'reasons': [], 'action': None, 'error': str(e)}
+        reports.append(report)
+        if report['reasons'] != ['no_model']:
+            # Последняя проверка видна в статусе обучения рядом с результатом прошлого обучения
+            update_status(ticker, drift={**report, 'checked_at': datetime.now().isoformat()})
+
+    queued, deferred = plan(reports, args.budget_minutes * 60)
+    print(json.dumps({
+        'checked': len(reports),
+        'queued': [{'ticker': r['ticker'], 'action': r['action'], 'reasons': r['reasons']} for r in queued],
+        'deferred': [r['ticker'] for r in deferred],
+        'budget_cpu_seconds': args.budget_minutes * 60,
+        'planned_cpu_seconds': sum(r['cpu_seconds'] for r in queued),
+        'tickers': reports,
+    }, ensure_ascii=False, indent=2), flush=True)
+
+    if args.dry_run or not queued:
+        return 0
+    return 1 if retrain(queued, args.max_parallel, args.threads_per_job) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,461 @@
+# -*- coding: utf-8 -*-
+"""Загрузка модели и пошаговый прогноз.
+
+pandas, scikit-learn и TensorFlow импортируются только там, где они нужны:
+прогноз по снимку с NumPy-движком и JSON-параметрами scaler'а обходится без них.
+"""
+
+import os
+import time
+import warnings
+from datetime import datetime
+
+import numpy as np
+
+from ml import paths
+from ml.paths import snapshot_exists, snapshot_version_file
+from ml.results import DEFAULT_QUANTILES, ROLLOUTS, ForecastError, band_key, build_result, check_model_exists, log
+from ml.scaler import load_scaler
+from ml.snapshot import read_snapshot
+from ml.timings import Timings
+from ml.trading_calendar import format_dates, trading_days
+from ml.windowing import make_windows
+
+# Сколько шагов прогноза обрабатывается и отдается потребителю за раз
+EMIT_CHUNK = 21
+
+
+def load_keras_model(model_path):
+    from tensorflow.keras.models import load_model
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        # Загружаем модель без компиляции (чтобы избежать ошибок совместимости версий)
+        try:
+            return load_model(model_path, compile=False)
+        except Exception:
+            # Если не удалось загрузить без компиляции, пробуем с компиляцией
+            try:
+                return load_model(model_path, compile=True)
+            except Exception as e2:
+                error_msg = str(e2)
+                if 'deserialize' in error_msg or 'KerasSaveable' in error_msg:
+                    error_msg = "Ошибка совместимости версий TensorFlow. Модель была сохранена с другой версией. Попробуйте переобучить модель."
+                raise ForecastError(f'Ошибка при загрузке модели: {error_msg}')
+
+
+def load_snapshot(ticker):
+    """Загружает снимок данных; при ошибке возвращает None (тогда используется CSV)."""
+    try:
+        data_snapshot = read_snapshot(ticker)
+        log({'info': f'Используется снимок данных от {data_snapshot.get("timestamp", "unknown")}'})
+        return data_snapshot
+    except Exception as e:
+        log({'warning': f'Не удалось загрузить снимок данных: {str(e)}. Используется CSV.'})
+        return None
+
+
+def load_model_for_engine(ticker, engine='keras'):
+    """Возвращает (model, engine). Движок numpy при невозможности откатывается на Keras."""
+    if engine == 'numpy':
+        try:
+            from ml.numpy_lstm import load_numpy_model
+            return load_numpy_model(paths.model_path(ticker), paths.weights_path(ticker)), 'numpy'
+        except Exception as e:
+            log({'warning': f'NumPy-движок недоступен для {ticker}: {str(e)}. Используется Keras.'})
+
+    return load_keras_model(paths.model_path(ticker)), 'keras'
+
+
+class ModelArtifacts:
+    """Загруженные модель, scaler и снимок данных одного тикера.
+
+    direct - прямая модель горизонта (ml/direct.py), если она обучена и актуальна.
+    """
+
+    def __init__(self, ticker, model, scaler, snapshot=None, engine='keras', direct=None):
+        self.ticker = ticker
+        self.model = model
+        self.scaler = scaler
+        self.snapshot = snapshot
+        self.engine = engine
+        self.direct = direct
+        self._numpy_model = None
+
+    @classmethod
+    def load(cls, ticker, with_snapshot=True, engine='keras', timings=None, with_direct=True):
+        timings = timings or Timings()
+        check_model_exists(ticker)
+
+        with timings.stage('model_load'):
+            model, engine = load_model_for_engine(ticker, engine)
+        with timings.stage('scaler_load'):
+            scaler = load_scaler(paths.scaler_path(ticker))
+
+        snapshot = None
+        if with_snapshot and snapshot_exists(ticker):
+            with timings.stage('snapshot_load'):
+                snapshot = load_snapshot(ticker)
+
+        direct = None
+        if with_direct and os.path.exists(paths.direct_meta_path(ticker)):
+            from ml.direct import load_direct
+
+            with timings.stage('direct_load'):
+                direct = load_direct(ticker, engine)
+
+        return cls(ticker, model, scaler, snapshot, engine, direct)
+
+    def predict_next(self, seq):
+        return self.model.predict(seq.reshape(1, seq.shape[0], seq.shape[1]), verbose=0)
+
+    def numpy_model(self, with_dropout=False):
+        """Модель для NumPy-инференса; у Keras-движка - копия весов загруженной модели."""
+        from ml.numpy_lstm import NumpyLSTMModel
+
+        if self.engine != 'numpy':
+            if self._numpy_model is None:
+                self._numpy_model = NumpyLSTMModel.from_keras_model(self.model)
+            return self._numpy_model
+        if with_dropout and not self.model.has_dropout:
+            # Старый sidecar .npz без слоев Dropout - архитектура есть в .h5
+            self.model = NumpyLSTMModel.from_h5(paths.model_path(self.ticker))
+        return self.model
+
+    def predict_samples(self, seqs, rng):
+        """Один проход по K последовательностям (K, lookback, 1) с включенным dropout."""
+        if self.engine == 'numpy':
+            return self.numpy_model(with_dropout=True).predict(seqs, rng=rng)
+        return np.asarray(self.model(seqs, training=True))
+
+    def start_stateful(self, seqs, rng=None):
+        """StatefulRollout по окнам (K, lookback, 1); с rng dropout активен, как в predict_samples."""
+        from ml.numpy_lstm import StatefulRollout
+
+        return StatefulRollout(self.numpy_model(with_dropout=rng is not None), seqs, rng)
+
+
+def _date_to_str(last_date_raw):
+    if hasattr(last_date_raw, 'strftime'):
+        try:
+            return last_date_raw.strftime('%Y-%m-%d %H:%M:%S')
+        except Exception:
+            return str(last_date_raw)
+    if hasattr(last_date_raw, 'to_pydatetime'):
+        try:
+            return last_date_raw.to_pydatetime().strftime('%Y-%m-%d %H:%M:%S')
+        except Exception:
+            return str(last_date_raw)
+    return str(last_date_raw)
+
+
+def _parse_last_date(last_date_str):
+    # Формат снимка и CSV разбирается без pandas
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(last_date_str, fmt)
+        except (TypeError, ValueError):
+            continue
+
+    import pandas as pd
+    try:
+        pd_date = pd.to_datetime(last_date_str)
+        if hasattr(pd_date, 'to_pydatetime'):
+            return pd_date.to_pydatetime()
+        return datetime.strptime(str(pd_date), '%Y-%m-%d %H:%M:%S')
+    except Exception:
+        for fmt in ('%Y-%m-%d', '%Y-%m-%d %H:%M:%S'):
+            try:
+                return datetime.strptime(last_date_str, fmt)
+            except Exception:
+                continue
+    return datetime.now()
+
+
+def prepare_pattern_data_local(df, lookback: int = 60, forecast_days: int = 1, scaler_to_use=None):
+    """Подготовка данных для LSTM - та же логика, что в stock.py"""
+    df_close = df[['close']].dropna().reset_index(drop=True)
+
+    if len(df_close) < lookback + forecast_days:
+        return None, None
+
+    # Используем тот же scaler, что был при обучении (уже загружен)
+    scaled = scaler_to_use.transform(df_close.values)
+
+    return make_windows(scaled, lookback=lookback, forecast_days=forecast_days)
+
+
+def load_history_csv(ticker):
+    csv_path = paths.csv_path(ticker)
+    if not os.path.exists(csv_path):
+        raise ForecastError(f'CSV файл не найден: {csv_path}')
+
+    from ml.price_store import load_history
+
+    # Ряд уже отсортирован и очищен от дублей в бинарном хранилище (ml/price_store.py);
+    # из CSV дочитываются только строки, добавленные с прошлого запуска.
+    # Важно: прогнозные данные (будущие даты) отброшены, используем только реальную историю
+    return load_history(ticker).to_dataframe(time_as_str=True)
+
+
+def _state_from_snapshot(data_snapshot):
+    # ВАЖНО: Используем именно те данные, которые были при обучении
+    last_sequence = data_snapshot.last_sequence
+    last_date_str = _date_to_str(data_snapshot['last_date'])
+    current_price = data_snapshot['last_price']
+    records_count = data_snapshot.records_count
+
+    log({'debug_info': {
+        'snapshot_used': True,
+        'snapshot_version': data_snapshot.get('version', 1),
+        'snapshot_timestamp': str(data_snapshot.get('timestamp')) if data_snapshot.get('timestamp') else None,
+        'records_count': records_count,
+        'last_date': str(last_date_str),
+        'last_price': float(current_price),
+        'last_sequence_shape': list(last_sequence.shape),
+        'lookback': int(data_snapshot['lookback']),
+        'forecast_days': int(data_snapshot['forecast_days'])
+    }})
+    log({'info': f'Снимок данных: {records_count} записей, последняя дата: {last_date_str}, последняя цена: {current_price:.2f}, размер last_sequence: {last_sequence.shape}'})
+
+    return last_sequence, last_date_str, current_price, data_snapshot.avg_volume(30)
+
+
+def _state_from_csv(ticker, scaler, timings):
+    with timings.stage('csv_parse'):
+        df = load_history_csv(ticker)
+
+    # Окно той длины, на которой обучалась модель: stock.py пишет ее в снимок
+    lookback = 60
+    if snapshot_exists(ticker):
+        lookback = int(read_snapshot(ticker).get('lookback', lookback))
+    forecast_days = 1
+
+    # Подготавливаем паттерны (как при обучении), используя загруженный scaler
+    with timings.stage('windows'):
+        X_pat, _ = prepare_pattern_data_local(df, lookback=lookback, forecast_days=forecast_days,
+                                              scaler_to_use=scaler)
+
+    if X_pat is None or len(X_pat) == 0:
+        raise ForecastError(f'Недостаточно данных: нужно минимум {lookback + forecast_days} записей для создания паттернов')
+
+    # Берем последний паттерн из подготовленных данных (как в stock.ipynb)
+    last_sequence = X_pat[-1]
+    last_date_str = df['time'].iloc[-1]
+    current_price = float(df['close'].iloc[-1])
+
+    # volume можно оставить 0 или использовать средний объем
+    avg_volume = int(df['volume'].tail(30).mean()) if 'volume' in df.columns else 0
+
+    return last_sequence, last_date_str, current_price, avg_volume
+
+
+def _prediction_events(scaler, raw, dates, first_step, avg_volume, sample_raw=None, quantiles=DEFAULT_QUANTILES):
+    """События 'prediction' для пачки шагов: денормализация и OHLC одним проходом."""
+    prices = scaler.inverse_transform(raw.reshape(-1, 1)).reshape(-1)
+    closes = prices.tolist()
+    highs = (prices * 1.02).tolist()
+    lows = (prices * 0.98).tolist()
+
+    bands = None
+    if sample_raw is not None:
+        sample_prices = scaler.inverse_transform(sample_raw.reshape(-1, 1)).reshape(sample_raw.shape)
+        # (len(quantiles), шаги): перцентили по путям Monte Carlo для каждого шага
+        bands = np.percentile(sample_prices, quantiles, axis=1).T.tolist()
+        keys = [band_key(q) for q in quantiles]
+
+    events = []
+    for i, close in enumerate(closes):
+        event = {
+            'type': 'prediction',
+            'step': first_step + i,
+            'time': dates[i],
+            'open': close,
+            'high': highs[i],
+            'low': lows[i],
+            'close': close,
+            'volume': avg_volume
+        }
+        if bands is not None:
+            event['bands'] = dict(zip(keys, bands[i]))
+            event['low'] = bands[i][0]
+            event['high'] = bands[i][-1]
+        events.append(event)
+    return events
+
+
+def forecast_events(artifacts, days=252, use_snapshot=True, timings=None, samples=0, quantiles=DEFAULT_QUANTILES,
+                    seed=0, rollout='window', recursive=False):
+    """Прогноз по шагам: событие 'meta', затем 'prediction' на каждый торговый день.
+
+    Позволяет отдавать шаги потребителю по мере вычисления (--output ndjson) -
+    пачками по EMIT_CHUNK шагов. Даты - торговые дни по ml/trading_calendar.py.
+    В timings попадают этапы подготовки и время каждого шага без учета потребителя.
+
+    samples > 0 включает Monte Carlo dropout: параллельно с основным путем идут
+    samples случайных путей, сложенных по оси батча, - на шаг один проход модели
+    по всем путям. Каждый прогноз получает bands (перцентили quantiles цены
+    закрытия по путям), а low/high - крайние из этих перцентилей вместо +-2%.
+
+    rollout='stateful' вместо повторного прогона окна на каждом шаге переносит
+    состояния LSTM (ml/numpy_lstm.py, StatefulRollout): шаг в lookback раз
+    дешевле, но результат приближенный.
+
+    Если у тикера есть прямая модель горизонта (artifacts.direct, ml/direct.py),
+    а режим ее допускает - без samples, rollout='window', days не больше ее
+    горизонта, - весь прогноз считается одним проходом; режим - в forecast_mode.
+    recursive=True - пошаговый прогноз и при наличии прямой модели (--recursive).
+    """
+    if rollout not in ROLLOUTS:
+        raise ForecastError(f'Неизвестный режим прогноза: {rollout}')
+    timings = timings or Timings()
+    ticker = artifacts.ticker
+    scaler = artifacts.scaler
+    snapshot_path = snapshot_version_file(ticker)
+    snapshot_available = snapshot_exists(ticker)
+
+    log({'debug': {
+        'snapshot_requested': use_snapshot,
+        'snapshot_exists': snapshot_available,
+        'snapshot_path': snapshot_path
+    }})
+
+    data_snapshot = artifacts.snapshot if use_snapshot else None
+    if use_snapshot and not snapshot_available:
+        log({'warning': f'Снимок данных не найден по пути: {snapshot_path}. Используется CSV.'})
+
+    if data_snapshot:
+        with timings.stage('snapshot_read'):
+            last_sequence, last_date_str, current_price, avg_volume = _state_from_snapshot(data_snapshot)
+    else:
+        data_snapshot = None
+        last_sequence, last_date_str, current_price, avg_volume = _state_from_csv(ticker, scaler, timings)
+
+    current_seq = last_sequence.copy()  # shape: (lookback, 1)
+
+    last_date_str = str(last_date_str)
+    last_date = _parse_last_date(last_date_str)
+
+    model_accuracy = None
+    if data_snapshot and 'accuracy' in data_snapshot:
+        model_accuracy = float(data_snapshot['accuracy'])
+
+    direct = artifacts.direct
+    if direct is not None and (recursive or samples or rollout != 'window' or days > direct.max_horizon
+                               or direct.lookback != len(current_seq)):
+        direct = None
+
+    quantiles = sorted(float(q) for q in quantiles)
+    rng = np.random.default_rng(seed)
+    # Пути Monte Carlo: (samples, lookback, 1), все стартуют с того же окна
+    sample_seqs = np.repeat(current_seq[None], samples, axis=0).astype(np.float32) if samples else None
+
+    yield {
+        'type': 'meta',
+        'ticker': ticker,
+        'current_price': current_price,
+        'last_historical_date': last_date_str,
+        'used_snapshot': data_snapshot is not None,
+        'snapshot_timestamp': str(data_snapshot.get('timestamp')) if (data_snapshot and data_snapshot.get('timestamp')) else None,
+        'data_source': 'snapshot' if data_snapshot is not None else 'csv',
+        'model_accuracy': model_accuracy,
+        'engine': artifacts.engine,
+        'snapshot_info': {
+            'exists': snapshot_available,
+            'requested': use_snapshot
+        } if data_snapshot is None else None,
+        'uncertainty': {
+            'method': 'mc_dropout',
+            'samples': samples,
+            'quantiles': quantiles,
+            'seed': seed,
+        } if samples else None,
+        'rollout': rollout if rollout != 'window' else None,
+        'forecast_mode': direct.mode if direct is not None else 'recursive',
+    }
+
+    warnings.filterwarnings('ignore')
+
+    # Даты всех шагов - одним проходом по торговому календарю, а не день за днем в цикле
+    with timings.stage('calendar'):
+        dates = format_dates(trading_days(last_date, days))
+
+    if direct is not None:
+        with timings.stage('direct'):
+            raw = direct.forecast(current_seq, days)
+        with timings.stage('postprocess'):
+            events = _prediction_events(scaler, raw, dates, 1, avg_volume)
+        yield from events
+        return
+
+    # В цикле только модель: сырые выходы копятся в массивах, цены, OHLC и полосы
+    # считаются векторно пачками по EMIT_CHUNK шагов, после чего события отдаются потребителю
+    raw = None
+    sample_raw = np.empty((days, samples), dtype=np.float32) if samples else None
+    emitted = 0
+
+    stepper = sample_stepper = None
+    if rollout == 'stateful':
+        # Окно прогоняется один раз, дальше каждый шаг - один временной шаг LSTM
+        with timings.stage('warmup'):
+            stepper = artifacts.start_stateful(current_seq[None])
+            sample_stepper = artifacts.start_stateful(sample_seqs, rng) if samples else None
+
+    for step in range(days):
+        step_started = time.perf_counter()
+        if stepper is None:
+            next_scaled = artifacts.predict_next(current_seq)
+            # Сдвиг окна на месте, без новых массивов на каждом шаге
+            current_seq[:-1] = current_seq[1:]
+            current_seq[-1, 0] = next_scaled[0, 0]
+        elif step == 0:
+            next_scaled = stepper.output
+        else:
+            next_scaled = stepper.step(next_scaled)
+        if raw is None:
+            raw = np.empty(days, dtype=next_scaled.dtype)
+        raw[step] = next_scaled[0, 0]
+
+        if samples:
+            if sample_stepper is None:
+                sample_scaled = np.asarray(artifacts.predict_samples(sample_seqs, rng), dtype=np.float32).reshape(-1)
+                sample_seqs[:, :-1] = sample_seqs[:, 1:]
+                sample_seqs[:, -1, 0] = sample_scaled
+            elif step == 0:
+                sample_scaled = sample_stepper.output.reshape(-1)
+            else:
+                sample_scaled = sample_stepper.step(sample_scaled.reshape(-1, 1)).reshape(-1)
+            sample_raw[step] = sample_scaled
+
+        elapsed = time.perf_counter() - step_started
+        timings.step(elapsed)
+        timings.add('rollout', elapsed)
+
+        if step + 1 - emitted >= EMIT_CHUNK or step + 1 == days:
+            with timings.stage('postprocess'):
+                chunk = slice(emitted, step + 1)
+                events = _prediction_events(scaler, raw[chunk], dates[chunk], emitted + 1, avg_volume,
+                                            sample_raw[chunk] if samples else None, quantiles)
+            emitted = step + 1
+            yield from events
+
+
+def run_forecast(artifacts, days=252, use_snapshot=True, on_event=None, timings=None, samples=0,
+                 quantiles=DEFAULT_QUANTILES, seed=0, rollout='window', recursive=False):
+    """Строит прогноз на days торговых дней и возвращает результат в формате CLI.
+
+    on_event, если задан, вызывается для каждого события forecast_events по мере вычисления.
+    Замеры этапов пишутся в timings (ml/timings.py), в сам результат они не входят.
+    """
+    meta = None
+    predictions = []
+    for event in forecast_events(artifacts, days=days, use_snapshot=use_snapshot, timings=timings, samples=samples,
+                                 quantiles=quantiles, seed=seed, rollout=rollout, recursive=recursive):
+        if on_event is not None:
+            on_event(event)
+        if event['type'] == 'meta':
+            meta = event
+        else:
+            predictions.append({k: v for k, v in event.items() if k not in ('type', 'step')})
+
+    return build_result(meta, predictions)
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""Хранилище прогнозов отдельно от CSV с историей котировок.
+
+storage/app/private/forecasts/
+    index.json         - по каждому тикеру список запусков (от старых к новым):
+                         run_id, хэш модели, итоговые поля результата, колонки,
+                         файл данных, смещение и длина блока
+    <TICKER>.<gen>.bin - блоки запусков подряд; блок - колонки по points значений
+                         little-endian: time int64 (секунды, время как в CSV),
+                         open/high/low/close float64, volume int64, band_<pN> float64
+
+Один запуск читается одним seek + read по смещению из индекса, последний
+запуск - последняя запись тикера в индексе. Хранится не больше keep_runs
+запусков на тикер: при удалении старых файл тикера переписывается под новым
+номером поколения, поэтому читатель со старым индексом не получит чужие байты.
+Хранится только прогноз, который показывает график (is_default_run): 252 дня,
+--rollout window, без Monte Carlo dropout и без принудительного --recursive.
+CSV в securities/ остаются только с реальными свечами. NumPy импортируется только
+при записи и чтении блоков: проверка индекса при попадании в кэш результатов без него.
+
+    python -m ml.forecast_store SBER [--run RUN_ID] [--list]
+"""
+
+import json
+import os
+import sys
+from datetime import datetime
+
+from ml import paths
+from ml.locks import locked
+
+STORE_VERSION = 1
+INDEX_FILE = 'index.json'
+DEFAULT_KEEP_RUNS = 10
+DEFAULT_DAYS = 252
+PRICE_COLUMNS = ('open', 'high', 'low', 'close')
+# Итоговые поля результата, которые хранятся в индексе: их можно отдать без чтения блока
+SUMMARY_FIELDS = (
+    'current_price', 'predicted_price_252d', 'change_252d', 'change_252d_percent', 'last_historical_date',
+    'first_prediction_date', 'last_prediction_date', 'used_snapshot', 'snapshot_timestamp', 'data_source',
+    'model_accuracy', 'engine', 'uncertainty', 'rollout', 'model', 'forecast_mode',
+)
+
+
+def encode_columns(predictions):
+    """Прогнозы результата -> (имена колонок, массивы) в порядке хранения."""
+    import numpy as np
+
+    times = np.array([p['time'] for p in predictions], dtype='datetime64[s]').astype(np.int64)
+    columns = {'time': times}
+    for name in PRICE_COLUMNS:
+        columns[name] = np.array([p[name] for p in predictions], dtype='<f8')
+    columns['volume'] = np.array([p.get('volume', 0) for p in predictions], dtype='<i8')
+    band_keys = list(predictions[0].get('bands', {})) if predictions else []
+    for key in band_keys:
+        columns[f'band_{key}'] = np.array([p['bands'][key] for p in predictions], dtype='<f8')
+    return list(columns), columns
+
+
+def column_dtype(name):
+    import numpy as np
+
+    return np.dtype('<i8') if name in ('time', 'volume') else np.dtype('<f8')
+
+
+def decode_predictions(columns):
+    """Колонки блока -> список прогнозов в формате результата predict_future.py."""
+    import numpy as np
+
+    times = np.datetime_as_string(columns['time'].astype('datetime64[s]'), unit='s')
+    band_keys = [name[len('band_'):] for name in columns if name.startswith('band_')]
+    predictions = []
+    for i, time_value in enumerate(times.tolist()):
+        point = {'time': time_value.replace('T', ' ')}
+        for name in PRICE_COLUMNS:
+            point[name] = float(columns[name][i])
+        point['volume'] = int(columns['volume'][i])
+        if band_keys:
+            point['bands'] = {key: float(columns[f'band_{key}'][i]) for key in band_keys}
+        predictions.append(point)
+    return predictions
+
+
+class ForecastStore:
+
+    def __init__(self, directory=None, keep_runs=None):
+        self.directory = directory or paths.forecast_store_dir
+        if keep_runs is None:
+            keep_runs = os.environ.get('FORECAST_STORE_KEEP_RUNS') or DEFAULT_KEEP_RUNS
+        self.keep_runs = max(1, int(keep_runs))
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, INDEX_FILE)
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == STORE_VERSION:
+                return data.get('tickers', {})
+        except (OSError, ValueError):
+            pass
+        return {}
+
+    def _save_index(self, tickers):
+        tmp_path = f'{self.index_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': STORE_VERSION, 'tickers': tickers}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def runs(self, ticker):
+        """Запуски тикера из индекса, от старых к новым."""
+        return self._load_index().get(ticker.upper(), [])
+
+    def latest(self, ticker):
+        return self._find(ticker, None)
+
+    def _find(self, ticker, run_id):
+        runs = self.runs(ticker)
+        if run_id is None:
+            return runs[-1] if runs else None
+        return next((r for r in reversed(runs) if r['run_id'] == run_id), None)
+
+    def read(self, ticker, run_id=None):
+        """(запись индекса, колонки) одного запуска; по умолчанию последнего. None - запуска нет."""
+        for attempt in range(2):
+            entry = self._find(ticker, run_id)
+            if entry is None:
+                return None
+            try:
+                with open(os.path.join(self.directory, entry['file']), 'rb') as f:
+                    f.seek(entry['offset'])
+                    data = f.read(entry['length'])
+                break
+            except FileNotFoundError:
+                # Индекс прочитан до уплотнения, а файл уже удален - перечитываем индекс
+                if attempt:
+                    raise
+
+        import numpy as np
+
+        columns = {}
+        position = 0
+        for name in entry['columns']:
+            dtype = column_dtype(name)
+            size = entry['points'] * dtype.itemsize
+            columns[name] = np.frombuffer(data, dtype=dtype, count=entry['points'], offset=position)
+            position += size
+        return entry, columns
+
+    def put(self, result, model_hash=None, run_id=None, result_key=None):
+        """Сохраняет результат прогноза как новый запуск; возвращает его запись индекса.
+
+        result_key - ключ кэша результатов (модель, данные, параметры), по нему store_result
+        узнает уже сохраненный прогноз.
+        """
+        ticker = result['ticker'].upper()
+        names, columns = encode_columns(result['predictions'])
+        block = b''.join(columns[name].tobytes() for name in names)
+        created = datetime.now()
+        entry = {
+            'run_id': run_id or f'{created:%Y%m%dT%H%M%S}-{os.urandom(4).hex()}',
+            'model_hash': model_hash,
+            'result_key': result_key,
+            'created_at': created.isoformat(timespec='seconds'),
+            'points': len(result['predictions']),
+            'columns': names,
+            **{field: result[field] for field in SUMMARY_FIELDS if field in result},
+        }
+
+        os.makedirs(self.directory, exist_ok=True)
+        with locked(self.index_path + '.lock'):
+            tickers = self._load_index()
+            runs = tickers.get(ticker, [])
+            data_file = runs[-1]['file'] if runs else f'{ticker}.0.bin'
+
+            with open(os.path.join(self.directory, data_file), 'ab') as f:
+                entry.update(file=data_file, offset=f.tell(), length=len(block))
+                f.write(block)
+
+            runs = runs + [entry]
+            stale_file = None
+            if len(runs) > self.keep_runs:
+                runs = self._compact(ticker, runs[-self.keep_runs:], data_file)
+                stale_file = data_file
+            tickers[ticker] = runs
+            self._save_index(tickers)
+
+            # Старый файл удаляется только после записи индекса, который на него уже не ссылается
+            if stale_file:
+                try:
+                    os.remove(os.path.join(self.directory, stale_file))
+                except OSError:
+                    pass
+        return runs[-1]
+
+    def _compact(self, ticker, runs, old_file):
+        """Переписывает блоки оставшихся запусков в файл следующего поколения."""
+        generation = int(old_file.rsplit('.', 2)[-2]) + 1
+        new_file = f'{ticker}.{generation}.bin'
+        kept = []
+        with open(os.path.join(self.directory, old_file), 'rb') as src, \
+                open(os.path.join(self.directory, new_file), 'wb') as dst:
+            for entry in runs:
+                src.seek(entry['offset'])
+                kept.append({**entry, 'file': new_file, 'offset': dst.tell()})
+                dst.write(src.read(entry['length']))
+        return kept
+
+
+def is_default_run(days, samples=0, rollout='window', recursive=False):
+    """Режим прогноза, который показывает график; прогнозы других режимов не сохраняются,
+    иначе последним запуском тикера стал бы, например, прогноз на 30 дней."""
+    return int(days) == DEFAULT_DAYS and not samples and rollout == 'window' and not recursive
+
+
+def store_result(result, store=None, model_hash=None):
+    """Сохраняет результат прогноза; возвращает run_id или None, если записать не удалось.
+
+    model_hash по умолчанию - хэш модели тикера (общая модель передает свой).
+    Результат из кэша с тем же ключом, что у последнего запуска, повторно не пишется.
+    Ошибка записи не должна ронять прогноз - она уходит в stderr.
+    """
+    from ml.result_cache import file_digest
+
+    result_key = (result.get('cache') or {}).get('key')
+    try:
+        store = store or ForecastStore()
+        latest = store.latest(result['ticker'])
+        if result_key and latest and latest.get('result_key') == result_key:
+            return latest['run_id']
+        if model_hash is None:
+            model_hash = file_digest(paths.model_path(result['ticker']))
+        entry = store.put(result, model_hash=model_hash, result_key=result_key)
+        return entry['run_id']
+    except (OSError, ValueError, KeyError) as e:
+        print(json.dumps({'warning': f'Не удалось сохранить прогноз: {str(e)}'}, ensure_ascii=False), file=sys.stderr)
+        return None
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m ml.forecast_store', description='Сохраненные прогнозы тикера')
+    parser.add_argument('ticker')
+    parser.add_argument('--run', default=None, help='run_id запуска (по умолчанию последний)')
+    parser.add_argument('--list', action='store_true', help='Только список запусков из индекса')
+    args = parser.parse_args(argv)
+
+    store = ForecastStore()
+    if args.list:
+        print(json.dumps(store.runs(args.ticker), ensure_ascii=False, indent=2))
+        return 0
+
+    found = store.read(args.ticker, args.run)
+    if found is None:
+        print(json.dumps({'error': f'Нет сохраненного прогноза для {args.ticker.upper()}'}, ensure_ascii=False))
+        return 1
+    entry, columns = found
+    print(json.dumps({**entry, 'ticker': args.ticker.upper(), 'predictions': decode_predictions(columns)},
+                     ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,470 @@
+# -*- coding: utf-8 -*-
+"""Общая модель для всех тикеров: одно обучение, один файл, прогноз пачкой тикеров.
+
+Обучение идет на окнах всех тикеров вместе; ряд каждого тикера нормализуется
+своим MinMax-scaler'ом (как в stock.py), разбиение на обучение, валидацию и
+тест - по тикеру, в тех же долях, что в stock.py. С --embedding-dim > 0 модель
+получает обучаемый вектор тикера (ml/model_factory.py, build_global_model).
+Номер 0 - "неизвестный тикер": на нем обучается доля окон UNKNOWN_RATE, и
+тикер без собственного обучения (новый листинг) прогнозируется с ним и со
+scaler'ом по своей истории.
+
+Артефакты: models/lstm_global.h5 (Keras), lstm_global.npz (веса NumPy-движка
+и таблица векторов тикеров), lstm_global.json (номера тикеров, параметры
+scaler'ов, метрики на тестовой части).
+
+Прогноз (predict_future.py --model global) строит окна всех запрошенных
+тикеров и на каждом шаге делает один вызов модели на всю пачку, поэтому
+прогноз по всем тикерам стоит почти столько же, сколько по одному.
+В хранилище прогнозов (ml/forecast_store.py) результаты общей модели пишутся
+только с --store: иначе они заменили бы на графике прогноз модели тикера.
+
+    python -m ml.global_model all [--embedding-dim 8] [--epochs 80]
+    python predict_future.py --model global --tickers SBER,GAZP --engine numpy
+"""
+
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+from ml import paths
+from ml.hyperparams import DEFAULTS
+from ml.results import ROLLOUTS, ForecastError, build_result, error_payload, forecast_options
+from ml.scaler import ArrayScaler
+from ml.timings import Timings
+
+META_VERSION = 1
+DEFAULT_EMBEDDING_DIM = 8
+# Доля обучающих окон с номером "неизвестный тикер"
+UNKNOWN_RATE = 0.1
+# Тикеры с меньшим числом окон в обучение не берутся
+MIN_WINDOWS = 50
+EARLY_STOPPING_PATIENCE = 10
+
+
+def fit_scaler(close):
+    """MinMax по всей истории тикера, как MinMaxScaler в stock.py."""
+    close = np.asarray(close, dtype=np.float64)
+    return ArrayScaler([close.min()], [close.max()])
+
+
+def load_meta():
+    try:
+        with open(paths.global_meta_path(), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except OSError:
+        raise ForecastError('Общая модель не обучена: запустите python -m ml.global_model all')
+    except ValueError as e:
+        raise ForecastError(f'Поврежден файл общей модели: {str(e)}')
+    if meta.get('version') != META_VERSION:
+        raise ForecastError(f'Неподдерживаемая версия общей модели: {meta.get("version")}')
+    return meta
+
+
+def _history(ticker):
+    from ml.forecast import load_history_csv
+
+    return load_history_csv(ticker)
+
+
+def _numpy_core(keras_model):
+    """LSTM/Dropout/Dense общей модели для NumPy-движка; вектор тикера подается как часть входа."""
+    from ml.numpy_lstm import NumpyLSTMModel
+
+    layers = [l for l in keras_model.layers if l.__class__.__name__ in ('LSTM', 'Dropout', 'Dense')]
+    return NumpyLSTMModel.from_keras_config(
+        {'layers': [{'class_name': l.__class__.__name__, 'config': l.get_config()} for l in layers]},
+        {l.name: l.get_weights() for l in layers},
+    )
+
+
+def _embedding_table(keras_model):
+    try:
+        return np.asarray(keras_model.get_layer('ticker_embedding').get_weights()[0], dtype=np.float32)
+    except ValueError:
+        return None
+
+
+class GlobalModel:
+    """Загруженная общая модель: predict и пошаговый прогноз пачки окон разных тикеров."""
+
+    def __init__(self, meta, model, embedding=None, engine='numpy'):
+        self.meta = meta
+        self.model = model
+        self.embedding = embedding
+        self.engine = engine
+        self.lookback = int(meta['lookback'])
+        self._core = model if engine == 'numpy' else None
+
+    @classmethod
+    def load(cls, engine='numpy', timings=None):
+        timings = timings or Timings()
+        meta = load_meta()
+        with timings.stage('model_load'):
+            weights_path, model_path = paths.global_weights_path(), paths.global_model_path()
+            if engine == 'numpy' and os.path.exists(weights_path) and (
+                    not os.path.exists(model_path) or os.path.getmtime(weights_path) >= os.path.getmtime(model_path)):
+                from ml.numpy_lstm import NumpyLSTMModel
+
+                with np.load(weights_path, allow_pickle=False) as data:
+                    embedding = data['embedding'] if 'embedding' in data else None
+                return cls(meta, NumpyLSTMModel.from_npz(weights_path), embedding, 'numpy')
+
+            from ml.forecast import load_keras_model
+
+            model = load_keras_model(model_path)
+            return cls(meta, model, _embedding_table(model), 'keras')
+
+    def ticker_id(self, ticker):
+        if self.embedding is None:
+            return 0
+        return int(self.meta['tickers'].get(ticker.upper(), {}).get('id', 0))
+
+    def scaler_for(self, ticker, close):
+        """Scaler обучения; у тикера, которого не было в обучении, - по его истории."""
+        entry = self.meta['tickers'].get(ticker.upper())
+        if entry:
+            return ArrayScaler.from_dict(entry['scaler'])
+        return fit_scaler(close)
+
+    def _with_embedding(self, x, ids):
+        """К каждому шагу входа (batch, steps, 1) дописывается вектор тикера."""
+        if self.embedding is None:
+            return x
+        vectors = self.embedding[ids][:, None, :]
+        return np.concatenate([x, np.broadcast_to(vectors, (len(x), x.shape[1], vectors.shape[-1]))], axis=-1)
+
+    def predict(self, windows, ids):
+        if self.engine == 'numpy':
+            return self.model.predict(self._with_embedding(windows, ids))
+        inputs = [windows, ids[:, None].astype(np.int32)] if self.embedding is not None else windows
+        return np.asarray(self.model.predict(inputs, verbose=0))
+
+    def rollout(self, windows, ids, steps, rollout='window', timings=None):
+        """Масштабированные прогнозы (тикеры, steps): на шаг один вызов модели на все тикеры."""
+        from ml.numpy_lstm import StatefulRollout
+
+        timings = timings or Timings()
+        ids = np.asarray(ids, dtype=np.int64)
+        seqs = np.array(windows, dtype=np.float32)
+        out = np.empty((len(seqs), steps), dtype=np.float32)
+
+        stepper = None
+        if rollout == 'stateful':
+            if self._core is None:
+                self._core = _numpy_core(self.model)
+            with timings.stage('warmup'):
+                stepper = StatefulRollout(self._core, self._with_embedding(seqs, ids))
+
+        for step in range(steps):
+            step_started = time.perf_counter()
+            if stepper is None:
+                pred = self.predict(seqs, ids)
+                seqs[:, :-1] = seqs[:, 1:]
+                seqs[:, -1, 0] = pred[:, 0]
+            elif step == 0:
+                pred = stepper.output
+            else:
+                pred = stepper.step(self._with_embedding(pred[:, None, :], ids)[:, 0, :])
+            out[:, step] = pred[:, 0]
+            elapsed = time.perf_counter() - step_started
+            timings.step(elapsed)
+            timings.add('rollout', elapsed)
+        return out
+
+
+def ticker_state(model, ticker):
+    """Последнее окно и параметры прогноза тикера по его CSV."""
+    df = _history(ticker)
+    close = df['close'].to_numpy(dtype=np.float64)
+    if len(close) < model.lookback:
+        raise ForecastError(f'Недостаточно данных: нужно минимум {model.lookback} записей, есть {len(close)}')
+    scaler = model.scaler_for(ticker, close)
+    return {
+        'scaler': scaler,
+        'window': scaler.transform(close[-model.lookback:].reshape(-1, 1)).astype(np.float32),
+        'last_date': str(df['time'].iloc[-1]),
+        'current_price': float(close[-1]),
+        'avg_volume': int(df['volume'].tail(30).mean()) if 'volume' in df.columns else 0,
+    }
+
+
+def forecast_tickers(model, tickers, days=252, rollout='window', timings=None):
+    """Прогнозы по тикерам одной пачкой; {тикер: результат в формате CLI или payload ошибки}."""
+    from ml.forecast import _parse_last_date, _prediction_events
+    from ml.trading_calendar import format_dates, trading_days
+
+    if rollout not in ROLLOUTS:
+        raise ForecastError(f'Неизвестный режим прогноза: {rollout}')
+    timings = timings or Timings()
+
+    results, states = {}, {}
+    with timings.stage('csv_parse'):
+        for ticker in tickers:
+            try:
+                states[ticker] = ticker_state(model, ticker)
+            except Exception as e:
+                results[ticker] = {'ticker': ticker, **error_payload(e)}
+    if not states:
+        return results
+
+    batch = list(states)
+    raw = model.rollout(np.stack([states[t]['window'] for t in batch]),
+                        [model.ticker_id(t) for t in batch], days, rollout, timings)
+
+    with timings.stage('postprocess'):
+        for row, ticker in enumerate(batch):
+            state = states[ticker]
+            entry = model.meta['tickers'].get(ticker, {})
+            dates = format_dates(trading_days(_parse_last_date(state['last_date']), days))
+            events = _prediction_events(state['scaler'], raw[row], dates, 1, state['avg_volume'])
+            meta = {
+                'ticker': ticker,
+                'current_price': state['current_price'],
+                'last_historical_date': state['last_date'],
+                'used_snapshot': False,
+                'snapshot_timestamp': None,
+                'data_source': 'csv',
+                'model_accuracy': entry.get('accuracy'),
+                'engine': model.engine,
+                'snapshot_info': None,
+                'rollout': rollout if rollout != 'window' else None,
+                # Тикер без собственного номера прогнозируется как "неизвестный"
+                'model': 'global' if entry else 'global_unknown',
+            }
+            predictions = [{k: v for k, v in e.items() if k not in ('type', 'step')} for e in events]
+            results[ticker] = build_result(meta, predictions)
+    return results
+
+
+def run_global_forecasts(tickers, days=252, engine='numpy', rollout='window', use_cache=True, store=False,
+                         timings=None):
+    """Прогнозы общей моделью в порядке tickers; готовые берутся из кэша результатов,
+    остальные считаются одной пачкой. store=True - сохранить их в хранилище прогнозов
+    вместо последних прогнозов моделей тикеров."""
+    from ml.result_cache import ResultCache, file_digest
+
+    timings = timings or Timings()
+    tickers = [t.upper() for t in tickers]
+    meta_digest = file_digest(paths.global_meta_path())
+    if meta_digest is None:
+        error = error_payload(ForecastError('Общая модель не обучена: запустите python -m ml.global_model all'))
+        return [{'ticker': t, **error} for t in tickers]
+
+    # Версия общей модели - хэш ее метаданных: они переписываются при каждом обучении
+    options = {**(forecast_options(0, None, 0, rollout) or {}), 'model': 'global', 'global_model': meta_digest}
+    cache = ResultCache() if use_cache else None
+    results, keys = {}, {}
+    if cache is not None:
+        for ticker in tickers:
+            key, _ = cache.key_for(ticker, days, False, engine, options)
+            keys[ticker] = key
+            cached = cache.get(key)
+            if cached is not None:
+                cached['cache'] = {'hit': True, 'key': key}
+                results[ticker] = cached
+
+    missing = [t for t in tickers if t not in results]
+    if missing:
+        try:
+            model = GlobalModel.load(engine, timings)
+            computed = forecast_tickers(model, missing, days=days, rollout=rollout, timings=timings)
+        except Exception as e:
+            computed = {t: {'ticker': t, **error_payload(e)} for t in missing}
+        for ticker, result in computed.items():
+            if cache is not None and 'error' not in result:
+                cache.put(keys[ticker], result)
+                result['cache'] = {'hit': False, 'key': keys[ticker]}
+            results[ticker] = result
+
+    from ml.forecast_store import is_default_run, store_result
+
+    if store and is_default_run(days, rollout=rollout):
+        with timings.stage('store'):
+            for result in results.values():
+                if 'error' not in result:
+                    store_result(result, model_hash=meta_digest)
+    return [results[t] for t in tickers]
+
+
+def _split(n_windows):
+    """Границы обучения, валидации и теста - как в stock.py: 64% / 16% / 20% окон."""
+    train_size = int(n_windows * 0.8)
+    return int(train_size * 0.8), train_size
+
+
+def train_global(tickers, embedding_dim=DEFAULT_EMBEDDING_DIM, lookback=DEFAULTS['lookback'],
+                 units=DEFAULTS['units'], lstm_layers=DEFAULTS['lstm_layers'], dropout=DEFAULTS['dropout'],
+                 batch_size=DEFAULTS['batch_size'], epochs=DEFAULTS['epochs'], seed=0, timings=None):
+    """Обучает общую модель и сохраняет ее артефакты; возвращает метаданные."""
+    import tensorflow as tf
+    from tensorflow.keras.callbacks import EarlyStopping
+
+    from ml.model_factory import build_global_model
+    from ml.tf_pipeline import ThroughputLogger, pooled_window_dataset
+
+    timings = timings or Timings()
+    tf.keras.utils.set_random_seed(seed)
+
+    parts, entries, skipped = [], {}, {}
+    fit, val, test = ([], []), ([], []), []
+    offset = 0
+    with timings.stage('windows'):
+        for ticker in tickers:
+            try:
+                df = _history(ticker)
+            except Exception as e:
+                skipped[ticker] = str(e)
+                continue
+            close = df['close'].to_numpy(dtype=np.float64)
+            n_windows = len(close) - lookback
+            if n_windows < MIN_WINDOWS:
+                skipped[ticker] = f'мало данных: {len(close)} записей'
+                continue
+
+            ticker_id = len(entries) + 1
+            scaler = fit_scaler(close)
+            parts.append(scaler.transform(close.reshape(-1, 1)).astype(np.float32).ravel())
+            fit_size, train_size = _split(n_windows)
+            starts = offset + np.arange(n_windows)
+            fit[0].append(starts[:fit_size])
+            fit[1].append(np.full(fit_size, ticker_id))
+            val[0].append(starts[fit_size:train_size])
+            val[1].append(np.full(train_size - fit_size, ticker_id))
+            test.append((ticker, starts[train_size:]))
+            entries[ticker] = {'id': ticker_id, 'scaler': scaler.to_dict(), 'records': int(len(close)),
+                               'last_date': str(df['time'].iloc[-1])}
+            offset += len(close)
+
+    if not entries:
+        raise ForecastError('Нет тикеров с достаточной историей для обучения общей модели')
+
+    series = np.concatenate(parts)
+    use_ids = embedding_dim > 0
+
+    def dataset(starts, ids, shuffle=False, unknown_rate=0.0):
+        return pooled_window_dataset(series, starts, ids if use_ids else None, lookback=lookback,
+                                     batch_size=batch_size, shuffle=shuffle, seed=seed, unknown_rate=unknown_rate)
+
+    fit_starts, fit_ids = np.concatenate(fit[0]), np.concatenate(fit[1])
+    val_starts, val_ids = np.concatenate(val[0]), np.concatenate(val[1])
+    print(f'Тикеров: {len(entries)}, окон обучения: {len(fit_starts)}, валидации: {len(val_starts)}')
+
+    model = build_global_model(lookback=lookback, n_tickers=len(entries), embedding_dim=embedding_dim, units=units,
+                               lstm_layers=lstm_layers, dropout=dropout)
+    model.compile(optimizer='adam', loss='mse', metrics=['mae'])
+    throughput = ThroughputLogger(samples_per_epoch=len(fit_starts))
+    with timings.stage('train'):
+        history = model.fit(
+            dataset(fit_starts, fit_ids, shuffle=True, unknown_rate=UNKNOWN_RATE if use_ids else 0.0),
+            validation_data=dataset(val_starts, val_ids),
+            epochs=epochs,
+            callbacks=[EarlyStopping(monitor='val_loss', patience=EARLY_STOPPING_PATIENCE, restore_best_weights=True),
+                       throughput],
+            verbose=2,
+        )
+    timings.epochs = throughput.epochs
+
+    # Метрики по тикеру на его тестовой части - те же, что stock.py пишет в снимок
+    with timings.stage('evaluate'):
+        test_starts = np.concatenate([starts for _, starts in test])
+        test_ids = np.concatenate([np.full(len(starts), entries[t]['id']) for t, starts in test])
+        predicted = model.predict(dataset(test_starts, test_ids), verbose=0).reshape(-1)
+        position = 0
+        for ticker, starts in test:
+            scaler = ArrayScaler.from_dict(entries[ticker]['scaler'])
+            pred = scaler.inverse_transform(predicted[position:position + len(starts)].reshape(-1, 1)).ravel()
+            actual = scaler.inverse_transform(series[starts + lookback].reshape(-1, 1)).ravel()
+            position += len(starts)
+            nonzero = actual != 0
+            mape = float(np.mean(np.abs((actual[nonzero] - pred[nonzero]) / actual[nonzero])) * 100) \
+                if nonzero.any() else None
+            entries[ticker].update(
+                mape=mape,
+                accuracy=max(0.0, min(100.0, 100 - mape)) if mape is not None else 0.0,
+                test_mae=float(np.mean(np.abs(actual - pred))) if len(actual) else None,
+            )
+
+    meta = {
+        'version': META_VERSION,
+        'trained_at': datetime.now().isoformat(),
+        'lookback': lookback,
+        'embedding_dim': embedding_dim,
+        'hyperparams': {'units': units, 'lstm_layers': lstm_layers, 'dropout': dropout, 'batch_size': batch_size,
+                        'epochs': epochs},
+        'epochs_run': len(history.history.get('loss', [])),
+        'tickers': entries,
+        'skipped': skipped,
+        'timings': timings.to_dict(),
+    }
+    save_global(model, meta)
+    return meta
+
+
+def save_global(model, meta):
+    """Keras-модель, веса NumPy-движка и метаданные; метаданные последними - по ним видна новая версия."""
+    os.makedirs(paths.models_dir, exist_ok=True)
+    try:
+        model.save(paths.global_model_path(), save_format='h5')
+    except (TypeError, ValueError):
+        model.save(paths.global_model_path())
+
+    embedding = _embedding_table(model)
+    _numpy_core(model).save_npz(paths.global_weights_path(),
+                                extra={'embedding': embedding} if embedding is not None else None)
+
+    meta_path = paths.global_meta_path()
+    tmp_path = f'{meta_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, meta_path)
+
+
+def main(argv=None):
+    import argparse
+
+    from ml.train_batch import all_tickers
+
+    parser = argparse.ArgumentParser(prog='python -m ml.global_model',
+                                     description='Обучение общей модели на окнах всех тикеров')
+    parser.add_argument('tickers', help='Тикеры через запятую или all - все тикеры, для которых есть CSV')
+    parser.add_argument('--embedding-dim', type=int, default=DEFAULT_EMBEDDING_DIM,
+                        help=f'Размер обучаемого вектора тикера, 0 - без него (по умолчанию {DEFAULT_EMBEDDING_DIM})')
+    parser.add_argument('--lookback', type=int, default=DEFAULTS['lookback'])
+    parser.add_argument('--units', type=int, default=DEFAULTS['units'])
+    parser.add_argument('--lstm-layers', type=int, default=DEFAULTS['lstm_layers'])
+    parser.add_argument('--dropout', type=float, default=DEFAULTS['dropout'])
+    parser.add_argument('--batch-size', type=int, default=DEFAULTS['batch_size'])
+    parser.add_argument('--epochs', type=int, default=DEFAULTS['epochs'])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.tickers.strip().lower() == 'all':
+        tickers = all_tickers()
+    else:
+        tickers = [t.strip().upper() for t in args.tickers.split(',') if t.strip()]
+    if not tickers:
+        parser.error('не указано ни одного тикера')
+
+    try:
+        meta = train_global(tickers, embedding_dim=max(0, args.embedding_dim), lookback=args.lookback,
+                            units=args.units, lstm_layers=args.lstm_layers, dropout=args.dropout,
+                            batch_size=args.batch_size, epochs=args.epochs, seed=args.seed)
+    except ForecastError as e:
+        print(f'Ошибка: {str(e)}', file=sys.stderr)
+        return 1
+
+    for ticker, entry in meta['tickers'].items():
+        print(f'{ticker}: точность {entry["accuracy"]:.2f}%')
+    for ticker, reason in meta['skipped'].items():
+        print(f'{ticker}: пропущен - {reason}')
+    print(f'Общая модель сохранена: {paths.global_model_path()}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
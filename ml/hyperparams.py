@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""Гиперпараметры обучения тикера: значения по умолчанию и результат подбора.
+
+python -m ml.sweep пишет лучшую найденную конфигурацию в
+models/hyperparams_<ticker>.json, stock.py берет ее оттуда при следующем
+обучении. Недостающие ключи (и тикеры без подбора) - DEFAULTS, то есть
+прежние зашитые в stock.py значения.
+"""
+
+import json
+import os
+from datetime import datetime
+
+from ml import paths
+from ml.model_factory import PATTERN_DROPOUT, PATTERN_LSTM_LAYERS, PATTERN_UNITS
+
+DEFAULTS = {
+    'lookback': 60,
+    'units': PATTERN_UNITS,
+    'lstm_layers': PATTERN_LSTM_LAYERS,
+    'dropout': PATTERN_DROPOUT,
+    'batch_size': 32,
+    'epochs': 80,
+}
+
+
+def load_hyperparams(ticker):
+    """DEFAULTS, переопределенные сохраненным результатом подбора (если он есть и читается)."""
+    params = dict(DEFAULTS)
+    try:
+        with open(paths.hyperparams_path(ticker), 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return params
+
+    for key, default in DEFAULTS.items():
+        if key in saved:
+            params[key] = type(default)(saved[key])
+    return params
+
+
+def save_hyperparams(ticker, params, **info):
+    """Пишет конфигурацию атомарно; info (val_loss, число испытаний и т.п.) - для справки."""
+    record = {key: params[key] for key in DEFAULTS if key in params}
+    record.update(info)
+    record['ticker'] = ticker.upper()
+    record['timestamp'] = datetime.now().isoformat()
+
+    path = paths.hyperparams_path(ticker)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""Дообучение существующей модели на новых свечах (stock.py <TICKER> --incremental).
+
+Модель и scaler берутся из models/, число записей на момент прошлого обучения -
+из снимка данных. Модель дообучается несколько эпох на окнах, захватывающих
+новые свечи, плюс случайная выборка старых обучающих окон (replay), чтобы не
+забыть историю. Последние окна новых свечей в дообучение не идут: вместе с
+тестовой частью прошлого обучения они - отложенная выборка, на которой
+stock.py считает метрики (MAPE снимка, с ним сравнивает ml/drift.py). Если новых свечей слишком много, цены вышли за диапазон scaler'а,
+история изменилась или ошибка на отложенной выборке выросла больше допустимого,
+возвращается отказ - stock.py тогда обучает модель с нуля.
+"""
+
+import os
+
+import numpy as np
+
+from ml import paths
+from ml.snapshot import read_snapshot
+from ml.windowing import make_windows
+
+DEFAULT_EPOCHS = 5
+DEFAULT_LEARNING_RATE = 1e-4
+# Допустимый рост MAE на отложенной выборке относительно модели до дообучения
+DEFAULT_MAX_DEGRADATION = 0.15
+# Если новых окон больше этой доли от всех, дешевле и надежнее обучить заново
+MAX_NEW_FRACTION = 0.2
+# Доля окон новых свечей (последних), которая откладывается для оценки
+NEW_HOLDOUT_FRACTION = 0.2
+REPLAY_FACTOR = 4
+MIN_REPLAY = 256
+
+
+class FullRetrainRequired(Exception):
+    """Дообучение невозможно или ухудшило модель - нужно полное обучение."""
+
+
+def _mae(model, scaler, X, y):
+    pred = model.predict(np.ascontiguousarray(X), verbose=0)
+    pred_actual = scaler.inverse_transform(pred.reshape(-1, 1))
+    y_actual = scaler.inverse_transform(np.asarray(y).reshape(-1, 1))
+    return float(np.mean(np.abs(pred_actual - y_actual)))
+
+
+def new_records_count(ticker, df):
+    """Число свечей, добавленных после прошлого обучения; None, если снимка нет.
+
+    Не требует TensorFlow: stock.py --incremental проверяет это до его импорта.
+    """
+    if not paths.snapshot_exists(ticker):
+        return None
+    return int(df['close'].notna().sum()) - read_snapshot(ticker).records_count
+
+
+def warm_start(ticker, df, lookback=60, forecast_days=1, epochs=DEFAULT_EPOCHS,
+               learning_rate=DEFAULT_LEARNING_RATE, max_degradation=DEFAULT_MAX_DEGRADATION, batch_size=32, seed=42):
+    """Дообучает сохраненную модель тикера.
+
+    Возвращает None, если новых данных нет, иначе словарь с model, scaler, X, y,
+    eval_idx - индексами окон отложенной выборки (модель на них не обучалась
+    ни при прошлом обучении, ни сейчас) и MAE на ней до и после дообучения.
+    При невозможности дообучения бросает FullRetrainRequired с причиной.
+    """
+    from ml.forecast import load_keras_model
+    # stock.py сохраняет scaler обратно в pickle, поэтому нужен исходный MinMaxScaler, а не JSON-копия
+    from ml.scaler import load_pickled
+
+    for path in (paths.model_path(ticker), paths.scaler_path(ticker)):
+        if not os.path.exists(path):
+            raise FullRetrainRequired(f'нет файла {path}')
+    if not paths.snapshot_exists(ticker):
+        raise FullRetrainRequired('нет снимка данных прошлого обучения')
+
+    snapshot = read_snapshot(ticker)
+    if snapshot.get('lookback', lookback) != lookback or snapshot.get('forecast_days', forecast_days) != forecast_days:
+        raise FullRetrainRequired('изменились параметры окон')
+
+    close = df['close'].dropna().to_numpy(dtype=np.float64)
+    old_count = snapshot.records_count
+    new_count = len(close) - old_count
+    if new_count < 0:
+        raise FullRetrainRequired('данных меньше, чем при прошлом обучении')
+    if new_count == 0:
+        return None
+
+    # Ряд должен продолжать тот, на котором обучалась модель
+    old_tail = np.asarray(snapshot.array('close')[-lookback:], dtype=np.float32)
+    if not np.array_equal(old_tail, close[old_count - lookback:old_count].astype(np.float32)):
+        raise FullRetrainRequired('история до новых свечей изменилась')
+
+    scaler = load_pickled(paths.scaler_path(ticker))
+    new_close = close[old_count:]
+    if new_close.min() < scaler.data_min_[0] or new_close.max() > scaler.data_max_[0]:
+        raise FullRetrainRequired(
+            f'цены вышли за диапазон scaler ({scaler.data_min_[0]:.2f} - {scaler.data_max_[0]:.2f})')
+
+    X, y = make_windows(scaler.transform(close.reshape(-1, 1)), lookback=lookback, forecast_days=forecast_days)
+
+    # Окна, цель которых попадает на новые свечи
+    new_start = max(0, old_count - lookback - forecast_days + 1)
+    if len(X) - new_start > MAX_NEW_FRACTION * len(X):
+        raise FullRetrainRequired(f'слишком много новых данных ({new_count} свечей)')
+
+    # Прошлое разбиение 80/20: обучающие окна - для replay, тестовые - для оценки;
+    # к ним добавляются последние окна новых свечей, на которых модель не дообучается
+    old_train_size = int(new_start * 0.8)
+    new_holdout = int((len(X) - new_start) * NEW_HOLDOUT_FRACTION)
+    new_end = len(X) - new_holdout
+    eval_idx = np.concatenate([np.arange(old_train_size, new_start), np.arange(new_end, len(X))])
+    if not len(eval_idx):
+        raise FullRetrainRequired('нет отложенных окон для оценки')
+
+    rng = np.random.default_rng(seed)
+    replay_size = min(old_train_size, max(REPLAY_FACTOR * (new_end - new_start), MIN_REPLAY))
+    replay_idx = rng.choice(old_train_size, size=replay_size, replace=False) if replay_size else np.empty(0, int)
+    fit_idx = np.concatenate([replay_idx, np.arange(new_start, new_end)])
+
+    from tensorflow.keras.optimizers import Adam
+
+    try:
+        model = load_keras_model(paths.model_path(ticker))
+    except Exception as e:
+        raise FullRetrainRequired(f'не удалось загрузить модель: {str(e)}')
+    model.compile(optimizer=Adam(learning_rate=learning_rate), loss='mse', metrics=['mae'])
+
+    mae_before = _mae(model, scaler, X[eval_idx], y[eval_idx])
+
+    print(f"Дообучение на {new_end - new_start} новых окнах и {replay_size} окнах replay, эпох: {epochs}; "
+          f"отложено для оценки: {len(eval_idx)} окон, из них новых {new_holdout}")
+    model.fit(np.ascontiguousarray(X[fit_idx]), y[fit_idx], batch_size=batch_size, epochs=epochs, shuffle=True, verbose=1)
+
+    mae_after = _mae(model, scaler, X[eval_idx], y[eval_idx])
+    print(f"MAE на отложенной выборке: до {mae_before:.4f}, после {mae_after:.4f}")
+    if mae_after > mae_before * (1 + max_degradation):
+        raise FullRetrainRequired(
+            f'MAE на отложенной выборке выросла на {(mae_after / mae_before - 1) * 100:.1f}%')
+
+    return {
+        'model': model,
+        'scaler': scaler,
+        'X': X,
+        'y': y,
+        'eval_idx': eval_idx,
+        'new_records': new_count,
+        'mae_before': mae_before,
+        'mae_after': mae_after,
+    }
@@ -0,0 +1,441 @@
+# -*- coding: utf-8 -*-
+"""Асинхронная загрузка дневных свечей MOEX ISS в CSV из storage/app/private/securities.
+
+Замена цикла UpdateSecuritiesCsv по тикерам: запросы идут параллельно (не больше
+--concurrency одновременно) через пул keep-alive соединений, страницы ISS
+(параметр start) дочитываются до конца. Для каждого тикера в
+securities/.store/ingest.json хранится время последней загруженной свечи,
+размер CSV после записи и отпечаток байтов перед этим смещением, поэтому CSV
+не перечитывается: новые строки одним блоком дописываются в конец в том же
+формате, что пишет SecurityCsvService.
+
+Если CSV с тех пор вырос, в него писал кто-то еще (UpdateSecuritiesCsv,
+SecurityCsvService): читаются только байты от сохраненного смещения до конца
+файла, и последней считается самая поздняя свеча из них. Весь CSV читается при
+первом запуске для тикера или если он переписан (стал короче или изменились
+байты перед смещением): тогда, как и в PHP, последней считается последняя дата
+в файле, а строки с уже известным временем пропускаются.
+
+    python -m ml.ingest SBER,GAZP [--concurrency 8] [--base-url http://127.0.0.1:9000/iss]
+
+Базовый адрес ISS задается и через MOEX_ISS_URL - например, для локального стенда.
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import ssl
+import sys
+import time
+from datetime import date, datetime, timedelta
+from urllib.parse import urlencode, urlsplit
+
+from ml import paths
+from ml.locks import locked
+
+DEFAULT_BASE_URL = 'https://iss.moex.com/iss'
+CANDLES_PATH = '/engines/stock/markets/shares/boards/TQBR/securities/{ticker}/candles.json'
+CSV_HEADER = 'ticker,time,open,high,low,close,volume\n'
+INDEX_VERSION = 2
+# Сколько байтов перед смещением сверяется, чтобы заметить перезапись CSV (как в ml/price_store.py)
+FINGERPRINT_BYTES = 256
+# ISS отдает не больше стольких свечей на страницу; короткая страница - последняя
+PAGE_SIZE = 500
+DEFAULT_CONCURRENCY = 8
+DEFAULT_TIMEOUT = 30
+# Как в UpdateSecuritiesCsv: без истории - 30 дней, --all - 2 года
+DEFAULT_DAYS = 30
+ALL_DAYS = 730
+
+
+class IngestError(Exception):
+    pass
+
+
+def base_url():
+    return os.environ.get('MOEX_ISS_URL') or DEFAULT_BASE_URL
+
+
+def index_path(csv_directory=None):
+    return os.path.join(csv_directory or paths.csv_dir, '.store', 'ingest.json')
+
+
+class HttpPool:
+    """Минимальный HTTP/1.1-клиент на asyncio со своим пулом keep-alive соединений к одному хосту."""
+
+    def __init__(self, url, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise IngestError(f'Неподдерживаемый адрес ISS: {url}')
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.ssl = ssl.create_default_context() if parts.scheme == 'https' else None
+        self.prefix = parts.path.rstrip('/')
+        self.host_header = parts.netloc
+        self.timeout = timeout
+        self._slots = asyncio.Semaphore(max(1, int(concurrency)))
+        self._idle = []
+        self.requests = 0
+        self.connections = 0
+
+    async def _connect(self):
+        self.connections += 1
+        return await asyncio.open_connection(self.host, self.port, ssl=self.ssl,
+                                             server_hostname=self.host if self.ssl else None)
+
+    async def _read_response(self, reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('Соединение закрыто сервером')
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    # Завершающие заголовки чанков не используются
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b''.join(chunks)
+            reusable = True
+        elif 'content-length' in headers:
+            body = await reader.readexactly(int(headers['content-length']))
+            reusable = True
+        else:
+            body = await reader.read()
+            reusable = False
+
+        if headers.get('content-encoding', '').lower() == 'gzip':
+            body = gzip.decompress(body)
+        if headers.get('connection', '').lower() == 'close':
+            reusable = False
+        return status, body, reusable
+
+    async def _exchange(self, target, connection):
+        """Соединение (если его нет в connection[0]), запрос и ответ."""
+        if connection[0] is None:
+            connection[0] = await self._connect()
+        reader, writer = connection[0]
+        writer.write((f'GET {target} HTTP/1.1\r\n'
+                      f'Host: {self.host_header}\r\n'
+                      'Accept: application/json\r\n'
+                      'Accept-Encoding: gzip\r\n'
+                      'Connection: keep-alive\r\n'
+                      'User-Agent: stock-ml-ingest\r\n\r\n').encode('latin-1'))
+        await writer.drain()
+        return await self._read_response(reader)
+
+    async def _request(self, target):
+        connection = [self._idle.pop() if self._idle else None]
+        reused = connection[0] is not None
+        try:
+            # Таймаут - на весь запрос: зависшее TCP/TLS-соединение не должно держать загрузку
+            status, body, reusable = await asyncio.wait_for(self._exchange(target, connection), self.timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, IndexError) as e:
+            self._discard(connection[0])
+            # Сервер мог закрыть простаивающее соединение - повторяем один раз на новом
+            if reused:
+                return await self._request(target)
+            raise IngestError(f'Ошибка соединения с {self.host}: {str(e) or type(e).__name__}')
+        except BaseException:
+            self._discard(connection[0])
+            raise
+
+        reader, writer = connection[0]
+        if reusable:
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+        return status, body
+
+    @staticmethod
+    def _discard(connection):
+        if connection is not None:
+            connection[1].close()
+
+    async def get_json(self, path, params):
+        target = f'{self.prefix}{path}?{urlencode(params)}'
+        async with self._slots:
+            self.requests += 1
+            status, body = await self._request(target)
+        if status != 200:
+            raise IngestError(f'HTTP {status}')
+        return json.loads(body)
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for _, writer in idle:
+            writer.close()
+        for _, writer in idle:
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+
+def load_index(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') == INDEX_VERSION:
+            return data.get('tickers', {})
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+def save_index(path, tickers):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': INDEX_VERSION, 'tickers': tickers}, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def scan_csv(csv_path, offset=0):
+    """Множество времен в CSV (начиная с байта offset) и последнее из них."""
+    times = set()
+    last = None
+    with open(csv_path, 'rb') as f:
+        f.seek(offset)
+        data = f.read().decode('utf-8')
+    for line in data.splitlines():
+        fields = line.split(',')
+        if len(fields) < 2 or fields[0].strip().lower() == 'ticker':
+            continue
+        time_value = fields[1].strip('"\' ')
+        if time_value:
+            times.add(time_value)
+            last = time_value
+    return times, last
+
+
+def fingerprint(csv_path, offset):
+    """Последние FINGERPRINT_BYTES байтов перед offset - по ним видно, что CSV не переписан."""
+    start = max(0, offset - FINGERPRINT_BYTES)
+    with open(csv_path, 'rb') as f:
+        f.seek(start)
+        return f.read(offset - start).hex()
+
+
+def ticker_state(ticker, index, csv_path):
+    """(последнее время, известные времена или None): из индекса, если CSV только дописывался."""
+    try:
+        size = os.path.getsize(csv_path)
+    except OSError:
+        return None, None
+
+    entry = index.get(ticker)
+    if entry and entry.get('last') and size >= entry.get('size', 0) \
+            and fingerprint(csv_path, entry['size']) == entry.get('fingerprint'):
+        if size == entry['size']:
+            return entry['last'], None
+        # CSV дописал другой процесс (UpdateSecuritiesCsv) - читаем только его строки
+        _, tail_last = scan_csv(csv_path, entry['size'])
+        return max(entry['last'], tail_last or ''), None
+
+    times, last = scan_csv(csv_path)
+    return last, times
+
+
+def start_date(last, load_all, today=None):
+    today = today or date.today()
+    if load_all:
+        return today - timedelta(days=ALL_DAYS)
+    if last is None:
+        return today - timedelta(days=DEFAULT_DAYS)
+    return datetime.strptime(last[:10], '%Y-%m-%d').date() + timedelta(days=1)
+
+
+def _number(value):
+    """Число как его пишет fputcsv в PHP: 285.0 -> 285, иначе кратчайшее представление."""
+    text = repr(float(value))
+    return text[:-2] if text.endswith('.0') else text
+
+
+def candle_rows(ticker, columns, data):
+    """Строки ISS -> [(time, строка CSV)]; строки без времени пропускаются."""
+    index = {name: columns.index(name) for name in ('begin', 'open', 'high', 'low', 'close', 'volume')
+             if name in columns}
+    if 'begin' not in index:
+        raise IngestError('В ответе ISS нет колонки begin')
+
+    def value(row, name):
+        position = index.get(name)
+        item = row[position] if position is not None and position < len(row) else None
+        return 0 if item is None else item
+
+    rows = []
+    for row in data:
+        time_value = row[index['begin']]
+        if not time_value:
+            continue
+        rows.append((time_value, f'{ticker},"{time_value}",{_number(value(row, "open"))},'
+                                 f'{_number(value(row, "high"))},{_number(value(row, "low"))},'
+                                 f'{_number(value(row, "close"))},{int(value(row, "volume"))}\n'))
+    return rows
+
+
+async def fetch_candles(http, ticker, start, interval=24):
+    """Все страницы свечей тикера начиная с даты start."""
+    columns = None
+    data = []
+    pages = 0
+    while True:
+        body = await http.get_json(CANDLES_PATH.format(ticker=ticker), {
+            'interval': interval,
+            'from': start.isoformat(),
+            'start': len(data),
+            'iss.meta': 'off',
+        })
+        pages += 1
+        candles = body.get('candles') or {}
+        columns = candles.get('columns') or columns or []
+        page = candles.get('data') or []
+        data.extend(page)
+        if len(page) < PAGE_SIZE:
+            return columns, data, pages
+
+
+def append_rows(csv_path, lines):
+    """Дописывает строки одним блоком; новый файл - с заголовком, недописанная строка закрывается."""
+    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+    with open(csv_path, 'ab+') as f:
+        if f.tell() == 0:
+            prefix = CSV_HEADER
+        else:
+            f.seek(-1, os.SEEK_END)
+            prefix = '' if f.read(1) == b'\n' else '\n'
+        f.seek(0, os.SEEK_END)
+        f.write((prefix + ''.join(lines)).encode('utf-8'))
+        return f.tell()
+
+
+async def ingest_ticker(http, ticker, index, csv_directory=None, load_all=False, interval=24):
+    csv_path = os.path.join(csv_directory or paths.csv_dir, f'{ticker.upper()}.csv')
+    started = time.perf_counter()
+    last, known = ticker_state(ticker, index, csv_path)
+    if load_all and known is None and last is not None:
+        # За 2 года придут и уже записанные свечи - сверяем со всем файлом, как PHP
+        known, _ = scan_csv(csv_path)
+    start = start_date(last, load_all)
+
+    columns, data, pages = await fetch_candles(http, ticker, start, interval)
+    rows = candle_rows(ticker, columns, data)
+    if known is not None:
+        rows = [row for row in rows if row[0] not in known]
+    elif last is not None:
+        rows = [row for row in rows if row[0] > last]
+
+    if rows:
+        size = append_rows(csv_path, [line for _, line in rows])
+        last = max(last or '', max(t for t, _ in rows))
+    else:
+        try:
+            size = os.path.getsize(csv_path)
+        except OSError:
+            size = 0
+    if last is not None:
+        index[ticker] = {'last': last, 'size': size, 'fingerprint': fingerprint(csv_path, size)}
+
+    return {
+        'ticker': ticker,
+        'added': len(rows),
+        'last': last,
+        'pages': pages,
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 3),
+    }
+
+
+async def ingest(tickers, url=None, concurrency=DEFAULT_CONCURRENCY, csv_directory=None, load_all=False,
+                 interval=24, timeout=DEFAULT_TIMEOUT, on_result=None):
+    """Загружает свечи тикеров; возвращает результаты в порядке завершения.
+
+    Индекс сохраняется один раз в конце. От второго одновременного запуска защищает
+    блокировкой run_ingest: ожидание блокировки остановило бы цикл событий, поэтому
+    берется она до его запуска, а корутину без нее вызывают только тесты.
+    """
+    path = index_path(csv_directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    index = load_index(path)
+    http = HttpPool(url or base_url(), concurrency=concurrency, timeout=timeout)
+
+    async def run(ticker):
+        try:
+            result = await ingest_ticker(http, ticker, index, csv_directory, load_all, interval)
+        except Exception as e:
+            result = {'ticker': ticker, 'error': f'Ошибка загрузки: {str(e)}'}
+        if on_result:
+            on_result(result)
+        return result
+
+    try:
+        results = await asyncio.gather(*(run(ticker) for ticker in tickers))
+    finally:
+        await http.close()
+        save_index(path, index)
+
+    return results, {'requests': http.requests, 'connections': http.connections}
+
+
+def run_ingest(tickers, csv_directory=None, **kwargs):
+    """ingest() в своем цикле событий под блокировкой записи CSV и индекса."""
+    path = index_path(csv_directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with locked(path + '.lock'):
+        return asyncio.run(ingest(tickers, csv_directory=csv_directory, **kwargs))
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m ml.ingest', description='Загрузка свечей MOEX ISS в CSV')
+    parser.add_argument('tickers', help='Тикеры через запятую или all - все тикеры, для которых есть CSV')
+    parser.add_argument('--base-url', default=None,
+                        help=f'Базовый адрес ISS (по умолчанию MOEX_ISS_URL или {DEFAULT_BASE_URL})')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f'Одновременных запросов (по умолчанию {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--interval', type=int, default=24, help='Интервал свечей ISS (24 = день)')
+    parser.add_argument('--all', dest='load_all', action='store_true',
+                        help='Загрузить последние 2 года, а не только новые свечи')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT,
+                        help='Таймаут запроса (соединение, отправка и ответ), секунд')
+    args = parser.parse_args(argv)
+
+    if args.tickers.strip().lower() == 'all':
+        from ml.train_batch import all_tickers
+        tickers = all_tickers()
+    else:
+        tickers = [t.strip().upper() for t in args.tickers.split(',') if t.strip()]
+    if not tickers:
+        parser.error('не указано ни одного тикера')
+
+    def on_result(result):
+        sys.stdout.write(json.dumps(result, ensure_ascii=False) + '\n')
+        sys.stdout.flush()
+
+    started = time.perf_counter()
+    results, stats = run_ingest(tickers, url=args.base_url, concurrency=args.concurrency, load_all=args.load_all,
+                                interval=args.interval, timeout=args.timeout, on_result=on_result)
+    failed = sum(1 for r in results if 'error' in r)
+    print(f'Тикеров: {len(results)}, ошибок: {failed}, новых свечей: {sum(r.get("added", 0) for r in results)}, '
+          f'запросов: {stats["requests"]}, соединений: {stats["connections"]}, '
+          f'{time.perf_counter() - started:.2f} с', file=sys.stderr)
+    return 1 if failed == len(results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Межпроцессные блокировки файлов (fcntl на POSIX, msvcrt на Windows).
+
+Блокировка снимается операционной системой при закрытии файла, в том числе
+при аварийном завершении процесса.
+
+msvcrt блокирует байты от текущей позиции файла, поэтому перед каждой
+блокировкой и разблокировкой позиция переводится на начало: иначе у файла,
+открытого в режиме 'a+' (позиция в конце) и дописанного владельцем, второй
+процесс заблокировал бы другой байт и тоже считал бы блокировку своей.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+
+
+def try_lock(f):
+    """Неблокирующая попытка взять исключительную блокировку открытого файла."""
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def lock(f):
+    if os.name == 'nt':
+        while not try_lock(f):
+            time.sleep(0.05)
+    else:
+        import fcntl
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def unlock(f):
+    """Снимает блокировку до закрытия файла (закрытие снимает ее и само)."""
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            f.flush()
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    except OSError:
+        pass
+
+
+@contextmanager
+def locked(path):
+    """Исключительная блокировка файла path на время блока with."""
+    with open(path, 'a+') as f:
+        lock(f)
+        try:
+            yield f
+        finally:
+            unlock(f)
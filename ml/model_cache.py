@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+from collections import OrderedDict
+
+from ml import paths
+from ml.forecast import ModelArtifacts
+from ml.results import log
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _artifact_mtimes(ticker):
+    return (
+        _mtime(paths.model_path(ticker)),
+        _mtime(paths.weights_path(ticker)),
+        _mtime(paths.scaler_path(ticker)),
+        _mtime(paths.snapshot_version_file(ticker)),
+        _mtime(paths.direct_model_path(ticker)),
+        _mtime(paths.direct_weights_path(ticker)),
+    )
+
+
+def estimate_size(artifacts):
+    """Грубая оценка занимаемой памяти в байтах: веса модели + массивы снимка."""
+    size = 0
+    try:
+        size += int(artifacts.model.count_params()) * 4
+        if artifacts.direct is not None:
+            size += int(artifacts.direct.model.count_params()) * 4
+    except Exception:
+        pass
+
+    if artifacts.snapshot is not None:
+        size += artifacts.snapshot.nbytes()
+
+    return size
+
+
+class ArtifactCache:
+    """LRU-кэш загруженных моделей с ограничением по памяти.
+
+    Запись перезагружается, если у файлов модели, scaler'а или снимка
+    изменилось время модификации (например, после переобучения stock.py).
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Загрузка идет под замком своего ключа: общий замок на время загрузки
+        # (секунды для Keras) не держится, попадания по другим тикерам не ждут.
+        # Замок ключа живет, пока его ждет или держит хотя бы один поток
+        self._loading = {}
+
+    def get(self, ticker, engine='keras'):
+        ticker = ticker.upper()
+        key = (ticker, engine)
+        mtimes = _artifact_mtimes(ticker)
+
+        with self._lock:
+            hit = self._hit(key, mtimes)
+            if hit is not None:
+                return hit
+            loading = self._loading.setdefault(key, {'lock': threading.Lock(), 'users': 0})
+            loading['users'] += 1
+
+        try:
+            with loading['lock']:
+                return self._load(key, mtimes)
+        finally:
+            with self._lock:
+                loading['users'] -= 1
+                if not loading['users']:
+                    del self._loading[key]
+
+    def _load(self, key, mtimes):
+        ticker, engine = key
+        with self._lock:
+            # Пока ждали замок ключа, модель мог загрузить другой поток
+            hit = self._hit(key, mtimes)
+            if hit is not None:
+                return hit
+            if key in self._entries:
+                log({'info': f'Модель {ticker} изменилась на диске, перезагрузка'})
+                del self._entries[key]
+
+        artifacts = ModelArtifacts.load(ticker, engine=engine)
+        entry = {
+            'artifacts': artifacts,
+            'mtimes': mtimes,
+            'size': estimate_size(artifacts),
+            # Keras-модель не гарантирует потокобезопасный predict
+            'lock': threading.Lock(),
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._evict()
+        return artifacts, entry['lock']
+
+    def _hit(self, key, mtimes):
+        entry = self._entries.get(key)
+        if entry is None or entry['mtimes'] != mtimes:
+            return None
+        self._entries.move_to_end(key)
+        return entry['artifacts'], entry['lock']
+
+    def _evict(self):
+        # Самая свежая запись остается, даже если одна превышает лимит
+        while len(self._entries) > 1 and self.total_bytes() > self.max_bytes:
+            (ticker, engine), _ = self._entries.popitem(last=False)
+            log({'info': f'Модель {ticker} ({engine}) вытеснена из кэша'})
+
+    def total_bytes(self):
+        return sum(entry['size'] for entry in self._entries.values())
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': [f'{ticker}:{engine}' for ticker, engine in self._entries.keys()],
+                'size_bytes': self.total_bytes(),
+                'max_bytes': self.max_bytes,
+            }
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""Архитектура LSTM-модели паттернов - общая для stock.py и бенчмарков.
+
+TensorFlow импортируется только внутри build_pattern_model, чтобы константы
+архитектуры можно было читать без него (NumPy-движок, бенчмарки).
+"""
+
+PATTERN_UNITS = 32
+PATTERN_LSTM_LAYERS = 3
+PATTERN_DROPOUT = 0.3
+
+
+def build_pattern_model(lookback=60, units=PATTERN_UNITS, lstm_layers=PATTERN_LSTM_LAYERS, dropout=PATTERN_DROPOUT,
+                        outputs=1):
+    """Модель Sequential: lstm_layers x (LSTM + Dropout) и Dense(outputs).
+
+    outputs > 1 - прямая модель горизонта (ml/direct.py): выход на каждый горизонт сразу.
+    """
+    from tensorflow.keras.layers import LSTM, Dense, Dropout
+    from tensorflow.keras.models import Sequential
+
+    layers = []
+    for i in range(lstm_layers):
+        return_sequences = i < lstm_layers - 1
+        if i == 0:
+            layers.append(LSTM(units, return_sequences=return_sequences, input_shape=(lookback, 1)))
+        else:
+            layers.append(LSTM(units, return_sequences=return_sequences))
+        layers.append(Dropout(dropout))
+    layers.append(Dense(outputs))
+
+    return Sequential(layers)
+
+
+def build_global_model(lookback=60, n_tickers=1, embedding_dim=8, units=PATTERN_UNITS,
+                       lstm_layers=PATTERN_LSTM_LAYERS, dropout=PATTERN_DROPOUT):
+    """Общая модель всех тикеров (ml/global_model.py).
+
+    embedding_dim > 0: входы [окно (lookback, 1), номер тикера (1,)]; обучаемый вектор
+    тикера повторяется вдоль окна и подается в первый LSTM вместе с ценой.
+    embedding_dim = 0 - та же архитектура, что build_pattern_model, с одним входом.
+    Номер 0 зарезервирован за тикерами, которых не было в обучении.
+    """
+    from tensorflow.keras import Model
+    from tensorflow.keras.layers import (LSTM, Concatenate, Dense, Dropout, Embedding, Flatten, Input,
+                                         RepeatVector)
+
+    window = Input(shape=(lookback, 1), name='window')
+    inputs = [window]
+    x = window
+    if embedding_dim > 0:
+        ticker_id = Input(shape=(1,), dtype='int32', name='ticker_id')
+        inputs.append(ticker_id)
+        embedded = Flatten()(Embedding(n_tickers + 1, embedding_dim, name='ticker_embedding')(ticker_id))
+        x = Concatenate(axis=-1)([window, RepeatVector(lookback)(embedded)])
+
+    for i in range(lstm_layers):
+        x = LSTM(units, return_sequences=i < lstm_layers - 1)(x)
+        x = Dropout(dropout)(x)
+    output = Dense(1)(x)
+
+    return Model(inputs=inputs, outputs=output)
@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""Инференс LSTM-модели из stock.py на чистом NumPy (float32), без импорта TensorFlow.
+
+Поддерживаются слои LSTM, Dropout (в инференсе - тождественный, с rng - случайный,
+для Monte Carlo dropout) и Dense. StatefulRollout - пошаговый прогноз с
+переносом состояний LSTM вместо повторного прогона всего окна.
+Веса читаются из sidecar-файла lstm_patterns_<ticker>.npz (его пишет stock.py)
+или напрямую из .h5 через h5py. Расхождение с model.predict Keras не превышает
+PARITY_ATOL в масштабированных единицах.
+"""
+
+import json
+import os
+
+import numpy as np
+
+PARITY_ATOL = 1e-5
+
+
+class UnsupportedModelError(Exception):
+    pass
+
+
+def _sigmoid(x):
+    # Численно устойчивая форма без переполнения exp
+    return 0.5 * (np.tanh(0.5 * x) + 1.0)
+
+
+def _hard_sigmoid(x):
+    return np.clip(0.2 * x + 0.5, 0.0, 1.0)
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    None: lambda x: x,
+    'tanh': np.tanh,
+    'sigmoid': _sigmoid,
+    'hard_sigmoid': _hard_sigmoid,
+    'relu': lambda x: np.maximum(x, 0.0),
+}
+
+
+def _activation(name):
+    if isinstance(name, dict):
+        name = name.get('config', {}).get('name', name.get('class_name'))
+    if name not in ACTIVATIONS:
+        raise UnsupportedModelError(f'Неподдерживаемая функция активации: {name}')
+    return ACTIVATIONS[name]
+
+
+class NumpyLSTMModel:
+    """Последовательная модель LSTM/Dropout/Dense с интерфейсом predict как у Keras."""
+
+    def __init__(self, layers):
+        # layers: список dict с ключами type, weights и параметрами слоя
+        self.layers = layers
+        for layer in self.layers:
+            layer['weights'] = [np.asarray(w, dtype=np.float32) for w in layer['weights']]
+            if layer['type'] == 'lstm':
+                layer['_act'] = _activation(layer.get('activation', 'tanh'))
+                layer['_rec_act'] = _activation(layer.get('recurrent_activation', 'sigmoid'))
+            elif layer['type'] == 'dense':
+                layer['_act'] = _activation(layer.get('activation', 'linear'))
+
+    @classmethod
+    def from_keras_config(cls, model_config, weights_by_layer):
+        """Собирает модель по конфигу Sequential и весам в порядке слоев."""
+        if isinstance(model_config, str):
+            model_config = json.loads(model_config)
+
+        config = model_config.get('config', model_config)
+        layer_configs = config['layers'] if isinstance(config, dict) else config
+
+        layers = []
+        for layer_config in layer_configs:
+            class_name = layer_config['class_name']
+            params = layer_config.get('config', {})
+            name = params.get('name')
+
+            if class_name == 'InputLayer':
+                continue
+            if class_name == 'Dropout':
+                # Весов нет; слой нужен только для Monte Carlo dropout
+                layers.append({
+                    'type': 'dropout',
+                    'name': name,
+                    'rate': float(params.get('rate', 0.0)),
+                    'weights': [],
+                })
+                continue
+            if class_name == 'LSTM':
+                if params.get('go_backwards') or params.get('stateful') or not params.get('use_bias', True):
+                    raise UnsupportedModelError(f'Неподдерживаемая конфигурация LSTM: {name}')
+                layers.append({
+                    'type': 'lstm',
+                    'name': name,
+                    'units': int(params['units']),
+                    'return_sequences': bool(params.get('return_sequences', False)),
+                    'activation': params.get('activation', 'tanh'),
+                    'recurrent_activation': params.get('recurrent_activation', 'sigmoid'),
+                    'weights': weights_by_layer[name],
+                })
+            elif class_name == 'Dense':
+                layers.append({
+                    'type': 'dense',
+                    'name': name,
+                    'activation': params.get('activation', 'linear'),
+                    'weights': weights_by_layer[name],
+                })
+            else:
+                raise UnsupportedModelError(f'Неподдерживаемый слой: {class_name}')
+
+        return cls(layers)
+
+    @classmethod
+    def from_h5(cls, path):
+        import h5py
+
+        with h5py.File(path, 'r') as f:
+            model_config = f.attrs['model_config']
+            if isinstance(model_config, bytes):
+                model_config = model_config.decode('utf-8')
+
+            group = f['model_weights'] if 'model_weights' in f else f
+            weights_by_layer = {}
+            for layer_name in group.attrs['layer_names']:
+                layer_name = layer_name.decode('utf-8') if isinstance(layer_name, bytes) else str(layer_name)
+                layer_group = group[layer_name]
+                weight_names = [
+                    n.decode('utf-8') if isinstance(n, bytes) else str(n)
+                    for n in layer_group.attrs.get('weight_names', [])
+                ]
+                weights_by_layer[layer_name] = [layer_group[n][()] for n in weight_names]
+
+        return cls.from_keras_config(model_config, weights_by_layer)
+
+    @classmethod
+    def from_npz(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            layers = json.loads(str(data['config']))
+            for i, layer in enumerate(layers):
+                layer['weights'] = [data[f'layer{i}_w{j}'] for j in range(layer.pop('n_weights'))]
+        return cls(layers)
+
+    @classmethod
+    def from_keras_model(cls, model):
+        return cls.from_keras_config(
+            {'layers': [{'class_name': l.__class__.__name__, 'config': l.get_config()} for l in model.layers]},
+            {l.name: l.get_weights() for l in model.layers},
+        )
+
+    def save_npz(self, path, extra=None):
+        """Веса и конфиг слоев в .npz; extra - дополнительные массивы, from_npz их не читает."""
+        arrays = dict(extra or {})
+        config = []
+        for i, layer in enumerate(self.layers):
+            meta = {k: v for k, v in layer.items() if k != 'weights' and not k.startswith('_')}
+            meta['n_weights'] = len(layer['weights'])
+            config.append(meta)
+            for j, w in enumerate(layer['weights']):
+                arrays[f'layer{i}_w{j}'] = w
+        arrays['config'] = np.array(json.dumps(config))
+
+        tmp_path = f'{path}.tmp.npz'
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, path)
+
+    @property
+    def has_dropout(self):
+        return any(layer['type'] == 'dropout' and layer['rate'] > 0 for layer in self.layers)
+
+    def count_params(self):
+        return sum(int(w.size) for layer in self.layers for w in layer['weights'])
+
+    def _lstm(self, layer, x, state=None):
+        """Прогон слоя по последовательности; возвращает выход и конечное состояние (h, c)."""
+        kernel, recurrent_kernel, bias = layer['weights']
+        units = layer['units']
+        act, rec_act = layer['_act'], layer['_rec_act']
+        batch, steps, _ = x.shape
+
+        # Входную проекцию считаем сразу для всех шагов одной матричной операцией
+        x_proj = x @ kernel + bias  # (batch, steps, 4 * units)
+
+        if state is None:
+            h = np.zeros((batch, units), dtype=np.float32)
+            c = np.zeros((batch, units), dtype=np.float32)
+        else:
+            h, c = state
+        outputs = np.empty((batch, steps, units), dtype=np.float32) if layer['return_sequences'] else None
+
+        for t in range(steps):
+            z = x_proj[:, t, :] + h @ recurrent_kernel
+            # Порядок гейтов Keras: input, forget, cell, output
+            i = rec_act(z[:, :units])
+            f = rec_act(z[:, units:2 * units])
+            g = act(z[:, 2 * units:3 * units])
+            o = rec_act(z[:, 3 * units:])
+            c = f * c + i * g
+            h = o * act(c)
+            if outputs is not None:
+                outputs[:, t, :] = h
+
+        return (outputs if outputs is not None else h), (h, c)
+
+    @staticmethod
+    def _dropout(layer, x, rng):
+        if rng is None or layer['rate'] <= 0:
+            return x
+        keep = rng.random(x.shape, dtype=np.float32) >= layer['rate']
+        return x * keep / np.float32(1.0 - layer['rate'])
+
+    def predict(self, x, verbose=0, rng=None):
+        """Как model.predict Keras; с rng dropout активен, как model(x, training=True)."""
+        out = np.asarray(x, dtype=np.float32)
+        for layer in self.layers:
+            if layer['type'] == 'lstm':
+                out, _ = self._lstm(layer, out)
+            elif layer['type'] == 'dropout':
+                out = self._dropout(layer, out, rng)
+            else:
+                kernel, bias = layer['weights']
+                out = layer['_act'](out @ kernel + bias)
+        return out
+
+
+class StatefulRollout:
+    """Пошаговый прогноз с переносом состояний LSTM: O(1) работы на шаг вместо O(lookback).
+
+    Окно один раз прогоняется через модель (output - прогноз следующего шага),
+    дальше step() подает в слои только новое значение ряда, продолжая состояния
+    h, c каждого слоя в заранее выделенных буферах. Скользящее окно каждый шаг
+    начинает с нулевого состояния и видит ровно lookback последних значений,
+    здесь же состояние помнит всю историю - результат поэтому немного
+    расходится с точным режимом (расхождение показывает benchmarks/forecast_bench.py).
+    """
+
+    def __init__(self, model, window, rng=None):
+        self.model = model
+        self.rng = rng
+        out = np.asarray(window, dtype=np.float32)
+        batch = out.shape[0]
+        self._states = {}
+        self._z = {}
+        self._zr = {}
+        for idx, layer in enumerate(model.layers):
+            if layer['type'] == 'lstm':
+                # Следующему слою нужна вся последовательность, чтобы прогреть и его состояние
+                out, (h, c) = model._lstm(layer, out)
+                self._states[idx] = (np.array(h), np.array(c))
+                self._z[idx] = np.empty((batch, 4 * layer['units']), dtype=np.float32)
+                self._zr[idx] = np.empty((batch, 4 * layer['units']), dtype=np.float32)
+            elif layer['type'] == 'dropout':
+                out = model._dropout(layer, out, rng)
+            else:
+                kernel, bias = layer['weights']
+                out = layer['_act'](out @ kernel + bias)
+        self.output = out
+
+    def step(self, x):
+        """Подает следующее значение ряда (batch, features); возвращает и запоминает прогноз (batch, 1)."""
+        out = np.asarray(x, dtype=np.float32)
+        for idx, layer in enumerate(self.model.layers):
+            if layer['type'] == 'lstm':
+                kernel, recurrent_kernel, bias = layer['weights']
+                units = layer['units']
+                act, rec_act = layer['_act'], layer['_rec_act']
+                h, c = self._states[idx]
+                z, zr = self._z[idx], self._zr[idx]
+                np.matmul(out, kernel, out=z)
+                z += bias
+                np.matmul(h, recurrent_kernel, out=zr)
+                z += zr
+                i = rec_act(z[:, :units])
+                f = rec_act(z[:, units:2 * units])
+                g = act(z[:, 2 * units:3 * units])
+                o = rec_act(z[:, 3 * units:])
+                c *= f
+                c += i * g
+                np.multiply(o, act(c), out=h)
+                out = h
+            elif layer['type'] == 'dropout':
+                out = self.model._dropout(layer, out, self.rng)
+            else:
+                kernel, bias = layer['weights']
+                out = layer['_act'](out @ kernel + bias)
+        self.output = out
+        return out
+
+
+def load_numpy_model(model_path, weights_path=None):
+    """Sidecar .npz используется, только если он не старше .h5."""
+    if weights_path and os.path.exists(weights_path) \
+            and os.path.getmtime(weights_path) >= os.path.getmtime(model_path):
+        return NumpyLSTMModel.from_npz(weights_path)
+    return NumpyLSTMModel.from_h5(model_path)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+script_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+models_dir = os.path.join(script_dir, 'models')
+csv_dir = os.path.join(script_dir, 'storage', 'app', 'private', 'securities')
+forecast_store_dir = os.path.join(script_dir, 'storage', 'app', 'private', 'forecasts')
+forecast_cache_dir = os.path.join(script_dir, 'storage', 'framework', 'cache', 'forecasts')
+logs_dir = os.path.join(script_dir, 'storage', 'logs')
+training_status_path = os.path.join(models_dir, 'training_status.json')
+training_slots_dir = os.path.join(models_dir, '.training_slots')
+default_holidays_path = os.path.join(script_dir, 'ml', 'data', 'moex_holidays.txt')
+
+
+def model_path(ticker):
+    return os.path.join(models_dir, f'lstm_patterns_{ticker.lower()}.h5')
+
+
+def weights_path(ticker):
+    return os.path.join(models_dir, f'lstm_patterns_{ticker.lower()}.npz')
+
+
+def scaler_path(ticker):
+    return os.path.join(models_dir, f'scaler_patterns_{ticker.lower()}.pkl')
+
+
+def direct_model_path(ticker):
+    return os.path.join(models_dir, f'lstm_direct_{ticker.lower()}.h5')
+
+
+def direct_weights_path(ticker):
+    return os.path.join(models_dir, f'lstm_direct_{ticker.lower()}.npz')
+
+
+def direct_meta_path(ticker):
+    """Горизонты, lookback и метрики прямой модели горизонта (ml/direct.py)."""
+    return os.path.join(models_dir, f'lstm_direct_{ticker.lower()}.json')
+
+
+def global_model_path():
+    return os.path.join(models_dir, 'lstm_global.h5')
+
+
+def global_weights_path():
+    return os.path.join(models_dir, 'lstm_global.npz')
+
+
+def global_meta_path():
+    """Тикеры и их номера, параметры scaler'ов и метрики общей модели (ml/global_model.py)."""
+    return os.path.join(models_dir, 'lstm_global.json')
+
+
+def hyperparams_path(ticker):
+    return os.path.join(models_dir, f'hyperparams_{ticker.lower()}.json')
+
+
+def snapshot_path(ticker):
+    return os.path.join(models_dir, f'data_snapshot_{ticker.lower()}.pkl')
+
+
+def snapshot_dir(ticker):
+    return os.path.join(models_dir, f'data_snapshot_{ticker.lower()}')
+
+
+def snapshot_header_path(ticker):
+    return os.path.join(snapshot_dir(ticker), 'header.json')
+
+
+def snapshot_exists(ticker):
+    return os.path.exists(snapshot_header_path(ticker)) or os.path.exists(snapshot_path(ticker))
+
+
+def snapshot_version_file(ticker):
+    """Файл, по которому отслеживается изменение снимка (mtime, хэш)."""
+    header_path = snapshot_header_path(ticker)
+    return header_path if os.path.exists(header_path) else snapshot_path(ticker)
+
+
+def csv_path(ticker):
+    return os.path.join(csv_dir, f'{ticker.upper()}.csv')
+
+
+def training_log_path(ticker):
+    return os.path.join(logs_dir, f'model_training_{ticker.lower()}.log')
+
+
+def holidays_path():
+    """Список неторговых дней биржи; MOEX_HOLIDAYS_FILE переопределяет файл по умолчанию."""
+    return os.environ.get('MOEX_HOLIDAYS_FILE') or default_holidays_path
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""Бинарное хранилище котировок рядом с CSV из storage/app/private/securities.
+
+securities/.store/<TICKER>/
+    index.json             - смещение в CSV, до которого данные уже разобраны,
+                             отпечаток байтов перед ним, количество строк и файлы колонок
+    time.<gen>.npy         - время свечей int64 (нс с эпохи), по возрастанию, без дублей
+    open/high/low/close/volume.<gen>.npy - float64
+
+Каждая запись пишет колонки в файлы нового поколения и последним заменяет
+index.json, как снимок (ml/snapshot.py): читатель по любому index.json видит
+колонки одной записи. Файлы предыдущего поколения удаляются следующей записью,
+поэтому их успевает дочитать процесс, открывший старый index.json.
+
+UpdateSecuritiesCsv только дописывает строки в конец CSV, поэтому при каждом
+чтении разбираются лишь байты после сохраненного смещения. Если CSV был
+переписан (стал короче или изменились байты перед смещением), хранилище
+строится заново. Дубли по времени схлопываются с сохранением последней строки,
+как drop_duplicates(keep='last') в прежнем коде.
+
+Старые версии predict_future.py дописывали прогноз строками в тот же CSV;
+такие строки (с датой позже текущей) удаляются один раз командой
+python -m ml.price_store --drop-future.
+
+Цены хранятся в float64: так ряд совпадает с тем, что давал pd.read_csv,
+и прогноз по CSV не меняется ни в одном знаке.
+"""
+
+import io
+import json
+import os
+import time as _time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from ml import paths
+
+STORE_VERSION = 1
+INDEX_FILE = 'index.json'
+CSV_COLUMNS = ['ticker', 'time', 'open', 'high', 'low', 'close', 'volume']
+VALUE_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+# Сколько байтов перед смещением сверяется, чтобы заметить перезапись CSV
+FINGERPRINT_BYTES = 256
+
+
+def store_dir(ticker, csv_directory=None):
+    return os.path.join(csv_directory or paths.csv_dir, '.store', ticker.upper())
+
+
+def _fingerprint(f, offset):
+    start = max(0, offset - FINGERPRINT_BYTES)
+    f.seek(start)
+    return f.read(offset - start).hex()
+
+
+def _parse_rows(data, skip_header):
+    """Разбор куска CSV; строки с неразборчивым временем или числами отбрасываются."""
+    df = pd.read_csv(io.BytesIO(data), header=None, names=CSV_COLUMNS, dtype=str,
+                     skiprows=1 if skip_header else 0, skip_blank_lines=True)
+    # Заголовок может встретиться и посреди файла (старые версии дописывали его повторно)
+    df = df[df['ticker'].str.strip().str.lower() != 'ticker']
+
+    time = pd.to_datetime(df['time'].str.strip(), errors='coerce')
+    columns = {'time': time.to_numpy(dtype='datetime64[ns]').astype(np.int64)}
+    valid = time.notna().to_numpy().copy()
+    for name in VALUE_COLUMNS:
+        values = pd.to_numeric(df[name], errors='coerce').to_numpy(dtype=np.float64)
+        columns[name] = values
+        valid &= ~np.isnan(values)
+
+    return {name: values[valid] for name, values in columns.items()}
+
+
+def _merge(existing, new):
+    """Добавляет new к отсортированному existing; пересортировывается только хвост.
+
+    Новые строки обычно идут после последней даты, но после прогнозных строк
+    (они тоже дописываются в CSV) свежая свеча оказывается раньше них -
+    тогда перестраивается участок, начиная с первой затронутой даты.
+    """
+    if len(new['time']) == 0:
+        return existing
+    if existing is None or len(existing['time']) == 0:
+        existing = {name: new[name][:0] for name in new}
+
+    start = int(np.searchsorted(existing['time'], new['time'].min(), side='left'))
+    tail = {name: np.concatenate([existing[name][start:], new[name]]) for name in new}
+
+    # Стабильная сортировка + последнее вхождение каждой даты = keep='last'
+    order = np.argsort(tail['time'], kind='stable')
+    times = tail['time'][order]
+    keep = np.ones(len(times), dtype=bool)
+    keep[:-1] = times[:-1] != times[1:]
+    order = order[keep]
+
+    return {name: np.concatenate([existing[name][:start], tail[name][order]]) for name in new}
+
+
+class PriceSeries:
+    """Очищенный ряд котировок: отсортирован по времени, без дублей."""
+
+    def __init__(self, ticker, columns):
+        self.ticker = ticker.upper()
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns['time'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def until(self, moment):
+        """Только строки с датой не позже moment (прогнозные строки CSV отбрасываются)."""
+        end = int(np.searchsorted(self.columns['time'], np.datetime64(moment, 'ns').astype(np.int64), side='right'))
+        return PriceSeries(self.ticker, {name: values[:end] for name, values in self.columns.items()})
+
+    def to_dataframe(self, time_as_str=False):
+        time = pd.to_datetime(np.asarray(self.columns['time']))
+        df = pd.DataFrame({
+            'ticker': self.ticker,
+            'time': time.strftime('%Y-%m-%d %H:%M:%S') if time_as_str else time,
+        })
+        for name in VALUE_COLUMNS:
+            df[name] = np.asarray(self.columns[name])
+        return df
+
+
+def _column_files(index):
+    # Хранилища до поколений держали колонки в <name>.npy
+    files = index.get('columns') or {}
+    return {name: files.get(name, f'{name}.npy') for name in ('time',) + VALUE_COLUMNS}
+
+
+class PriceStore:
+
+    def __init__(self, ticker, csv_directory=None):
+        self.ticker = ticker.upper()
+        self.csv_path = os.path.join(csv_directory or paths.csv_dir, f'{self.ticker}.csv')
+        self.directory = store_dir(ticker, csv_directory)
+
+    def _read_index(self):
+        try:
+            with open(os.path.join(self.directory, INDEX_FILE), 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return index if index.get('version') == STORE_VERSION else None
+
+    def _load_columns(self, index):
+        columns = {}
+        for name, file_name in _column_files(index).items():
+            try:
+                columns[name] = np.load(os.path.join(self.directory, file_name), mmap_mode='r')
+            except (OSError, ValueError):
+                return None
+            if len(columns[name]) != index['rows']:
+                # Поврежденный файл колонки - перестраиваем
+                return None
+        return columns
+
+    def _save(self, columns, offset, fingerprint, previous=None):
+        """Колонки - в файлы нового поколения, index.json - последним; затем удаляются
+        поколения старше previous (индекса, по которому шло чтение)."""
+        os.makedirs(self.directory, exist_ok=True)
+        generation = f'{_time.time_ns():x}'
+        files = {name: f'{name}.{generation}.npy' for name in columns}
+        for name, values in columns.items():
+            path = os.path.join(self.directory, files[name])
+            tmp_path = f'{path}.{os.getpid()}.tmp.npy'
+            np.save(tmp_path, np.ascontiguousarray(values))
+            os.replace(tmp_path, path)
+
+        index = {
+            'version': STORE_VERSION,
+            'offset': offset,
+            'fingerprint': fingerprint,
+            'rows': int(len(columns['time'])),
+            'columns': files,
+            'updated_at': datetime.now().isoformat(),
+        }
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        tmp_path = f'{index_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, index_path)
+
+        keep = set(files.values())
+        if previous is not None:
+            keep.update(_column_files(previous).values())
+        for name in os.listdir(self.directory):
+            if name.endswith('.npy') and name not in keep and '.tmp' not in name:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    # На Windows файл, открытый читателем через mmap, удалится следующей записью
+                    pass
+
+    def load(self):
+        """Возвращает PriceSeries, предварительно дочитав новые строки CSV."""
+        if not os.path.exists(self.csv_path):
+            raise FileNotFoundError(f'CSV файл не найден: {self.csv_path}')
+
+        index = self._read_index()
+        with open(self.csv_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+
+            columns = None
+            offset = 0
+            if index is not None and index['offset'] <= size \
+                    and _fingerprint(f, index['offset']) == index['fingerprint']:
+                columns = self._load_columns(index)
+                if columns is not None:
+                    offset = index['offset']
+
+            if offset == size and columns is not None:
+                return PriceSeries(self.ticker, columns)
+
+            f.seek(offset)
+            data = f.read(size - offset)
+            # Незавершенную последнюю строку оставляем до следующего раза
+            end = data.rfind(b'\n') + 1
+            data = data[:end]
+            new_offset = offset + end
+
+            if not data and columns is not None:
+                return PriceSeries(self.ticker, columns)
+
+            new = _parse_rows(data, skip_header=offset == 0)
+            existing = {name: np.asarray(values) for name, values in columns.items()} if columns else None
+            merged = _merge(existing, new)
+            if merged is None:
+                merged = {name: values[:0] for name, values in new.items()}
+            fingerprint = _fingerprint(f, new_offset)
+
+        try:
+            self._save(merged, new_offset, fingerprint, index)
+        except OSError:
+            # Хранилище - только ускорение; без прав на запись работаем из памяти
+            pass
+
+        return PriceSeries(self.ticker, merged)
+
+
+def load_prices(ticker, csv_directory=None):
+    return PriceStore(ticker, csv_directory).load()
+
+
+def load_history(ticker, csv_directory=None):
+    """Реальная история тикера: ряд без строк с датой позже текущей (прогнозных).
+
+    По ней обучается модель (stock.py, число свечей - records_count снимка), строится
+    прогноз по CSV и проверяется дрейф, поэтому число свечей везде считается одинаково.
+    """
+    return load_prices(ticker, csv_directory).until(datetime.now())
+
+
+def drop_future_rows(ticker, moment=None, csv_directory=None):
+    """Удаляет из CSV строки с временем позже moment (по умолчанию - сейчас); возвращает их число.
+
+    Остальные строки, включая заголовок, переписываются байт в байт.
+    """
+    csv_path = os.path.join(csv_directory or paths.csv_dir, f'{ticker.upper()}.csv')
+    limit = (moment or datetime.now()).strftime('%Y-%m-%d %H:%M:%S')
+    with open(csv_path, 'rb') as f:
+        lines = f.read().splitlines(keepends=True)
+
+    kept = []
+    for line in lines:
+        fields = line.split(b',')
+        time_value = fields[1].decode('utf-8', 'replace').strip('"\' \r\n') if len(fields) > 1 else ''
+        if time_value[:4].isdigit() and time_value > limit:
+            continue
+        kept.append(line)
+
+    dropped = len(lines) - len(kept)
+    if dropped:
+        tmp_path = f'{csv_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(b''.join(kept))
+        os.replace(tmp_path, csv_path)
+    return dropped
+
+
+def main(argv=None):
+    import argparse
+    import glob
+
+    parser = argparse.ArgumentParser(description='Обновление бинарного хранилища котировок из CSV')
+    parser.add_argument('tickers', nargs='*', help='Тикеры (по умолчанию - все CSV в каталоге securities)')
+    parser.add_argument('--drop-future', action='store_true',
+                        help='Сначала удалить из CSV строки с датой позже текущей (прогнозы старых версий)')
+    args = parser.parse_args(argv)
+
+    tickers = args.tickers or [
+        os.path.splitext(os.path.basename(p))[0]
+        for p in glob.glob(os.path.join(paths.csv_dir, '*.csv'))
+    ]
+
+    failed = 0
+    for ticker in tickers:
+        try:
+            if args.drop_future:
+                dropped = drop_future_rows(ticker)
+                if dropped:
+                    print(f'{ticker.upper()}: удалено строк прогноза из CSV: {dropped}')
+            series = load_prices(ticker)
+            print(f'{ticker.upper()}: {len(series)} записей')
+        except Exception as e:
+            failed += 1
+            print(f'{ticker.upper()}: ошибка обновления хранилища: {str(e)}')
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+
+
+def peak_rss_bytes():
+    """Пиковый резидентный объем памяти процесса в байтах (None, если узнать нельзя)."""
+    if os.name == 'nt':
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [
+                    ('cb', wintypes.DWORD),
+                    ('PageFaultCount', wintypes.DWORD),
+                    ('PeakWorkingSetSize', ctypes.c_size_t),
+                    ('WorkingSetSize', ctypes.c_size_t),
+                    ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                    ('PagefileUsage', ctypes.c_size_t),
+                    ('PeakPagefileUsage', ctypes.c_size_t),
+                ]
+
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            handle = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                return int(counters.PeakWorkingSetSize)
+        except Exception:
+            pass
+        return None
+
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдает килобайты, macOS - байты
+    return int(peak) if sys.platform == 'darwin' else int(peak) * 1024
+
+
+def process_start_time():
+    """Время запуска текущего процесса (секунды с эпохи) или None, если узнать нельзя."""
+    if os.name == 'nt':
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            creation, exit_, kernel, user = (wintypes.FILETIME() for _ in range(4))
+            handle = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.kernel32.GetProcessTimes(handle, ctypes.byref(creation), ctypes.byref(exit_),
+                                                      ctypes.byref(kernel), ctypes.byref(user)):
+                ticks = (creation.dwHighDateTime << 32) | creation.dwLowDateTime
+                # FILETIME - сотни наносекунд с 1601-01-01
+                return (ticks - 116444736000000000) / 1e7
+        except Exception:
+            pass
+        return None
+
+    try:
+        with open('/proc/self/stat', 'r') as f:
+            # Имя процесса в скобках может содержать пробелы - поля считаются после него
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime', 'r') as f:
+            uptime = float(f.read().split()[0])
+        # starttime - в тиках с загрузки системы; btime в /proc/stat округлен до секунды, поэтому через uptime
+        return time.time() - (uptime - int(fields[19]) / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def format_bytes(value):
+    if value is None:
+        return 'н/д'
+    return f'{value / (1024 * 1024):.1f} МБ'
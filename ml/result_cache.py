@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""Кэш готовых прогнозов, адресуемый содержимым входных файлов.
+
+Ключ - sha256 от хэшей модели, scaler'а, источника данных (снимок или CSV)
+и списка праздников биржи плюс days и движок. Переобучение меняет файлы, а значит и ключ, поэтому
+явная инвалидация не нужна: старые записи уходят по возрасту и размеру.
+Модуль не импортирует ни NumPy, ни TensorFlow - попадание в кэш обходится
+без тяжелых импортов.
+
+Одновременные промахи по одному ключу (несколько пользователей открыли одну
+бумагу) сводятся к одному расчету: первый процесс берет lease - блокировку
+файла <ключ>.lease - и считает, остальные ждут ее освобождения и берут
+результат из кэша. Блокировку процесса, упавшего во время расчета, снимает ОС;
+зависший владелец перестает считаться владельцем через lease_timeout секунд
+от начала его расчета - тогда ожидающие считают сами.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date
+
+from ml import paths
+from ml.locks import try_lock, unlock
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_AGE = 7 * 24 * 3600
+# Сколько ждать чужой расчет того же прогноза, считая от его начала
+DEFAULT_LEASE_TIMEOUT = 120
+LEASE_POLL_SECONDS = 0.05
+
+
+def file_digest(path):
+    if not os.path.exists(path):
+        return None
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ResultCache:
+
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES, max_age=DEFAULT_MAX_AGE, lease_timeout=None):
+        self.directory = directory or paths.forecast_cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        if lease_timeout is None:
+            lease_timeout = float(os.environ.get('FORECAST_LEASE_TIMEOUT') or DEFAULT_LEASE_TIMEOUT)
+        self.lease_timeout = lease_timeout
+
+    def key_for(self, ticker, days, use_snapshot, engine='keras', options=None):
+        source = 'snapshot' if use_snapshot and paths.snapshot_exists(ticker) else 'csv'
+        parts = {
+            'ticker': ticker.upper(),
+            'days': int(days),
+            'source': source,
+            'engine': engine,
+            'model': file_digest(paths.model_path(ticker)),
+            'scaler': file_digest(paths.scaler_path(ticker)),
+            # Прямая модель горизонта (ml/direct.py) меняет результат, если она есть
+            'direct': file_digest(paths.direct_meta_path(ticker)),
+            # Даты прогноза зависят от списка праздников биржи
+            'calendar': file_digest(paths.holidays_path()),
+        }
+        if options:
+            # Параметры, меняющие результат (например, Monte Carlo dropout)
+            parts['options'] = options
+        if source == 'snapshot':
+            # header.json переписывается при каждом сохранении снимка (timestamp)
+            parts['data'] = file_digest(paths.snapshot_version_file(ticker))
+        else:
+            parts['data'] = file_digest(paths.csv_path(ticker))
+            # Из CSV отбрасываются строки с датой позже текущей, поэтому результат зависит от дня
+            parts['today'] = date.today().isoformat()
+
+        digest = hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+        return digest, source
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.json')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if time.time() - os.path.getmtime(path) > self.max_age:
+            return None
+
+        # atime ненадежен (noatime), поэтому время доступа для LRU отмечаем сами
+        try:
+            os.utime(path, (time.time(), os.path.getmtime(path)))
+        except OSError:
+            pass
+        return result
+
+    def put(self, key, result):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.evict()
+
+    @contextmanager
+    def lease(self, key):
+        """Право считать прогноз key: dict held (получен ли lease), waited (был ли он занят), waited_ms.
+
+        held=False - владелец не уложился в lease_timeout, расчет идет без lease.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{key}.lease')
+        started = time.monotonic()
+        deadline = None
+        f = open(path, 'a+', encoding='utf-8')
+        try:
+            while not try_lock(f):
+                if deadline is None:
+                    deadline = started + self._remaining_lease(path)
+                if time.monotonic() >= deadline:
+                    f.close()
+                    f = None
+                    break
+                time.sleep(LEASE_POLL_SECONDS)
+
+            if f is not None:
+                # Ожидающие отсчитывают lease_timeout от записанного здесь начала расчета
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps({'pid': os.getpid(), 'started': time.time()}))
+                f.flush()
+            yield {'held': f is not None, 'waited': deadline is not None,
+                   'waited_ms': round((time.monotonic() - started) * 1000, 3)}
+        finally:
+            if f is not None:
+                unlock(f)
+                f.close()
+
+    def _remaining_lease(self, path):
+        """Секунд до истечения чужого lease по времени начала, записанному владельцем."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                holder_started = float(json.load(f)['started'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return self.lease_timeout
+        return max(0.0, holder_started + self.lease_timeout - time.time())
+
+    def evict(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+
+        now = time.time()
+        entries = []
+        for name in names:
+            if not name.endswith(('.json', '.lease')):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if name.endswith('.lease'):
+                # Файлы lease пустые по сути; удаляются только давно не использованные
+                if now - stat.st_mtime > self.max_age:
+                    self._remove(path)
+                continue
+            if now - stat.st_mtime > self.max_age:
+                self._remove(path)
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def cached_forecast(cache, ticker, days, use_snapshot, engine, compute, options=None):
+    """Возвращает прогноз из кэша или вычисляет его через compute() и сохраняет."""
+    if cache is None:
+        return compute()
+
+    key, source = cache.key_for(ticker, days, use_snapshot, engine, options)
+    result = cache.get(key)
+    if result is not None:
+        result['cache'] = {'hit': True, 'key': key}
+        return result
+
+    with cache.lease(key) as lease:
+        # Прогноз мог посчитать другой процесс - пока ждали lease или между промахом и lease
+        result = cache.get(key)
+        if result is not None:
+            result['cache'] = {'hit': True, 'key': key, 'coalesced': True, 'waited_ms': lease['waited_ms']}
+            return result
+
+        result = compute()
+        # Если снимок не прочитался и прогноз построен по CSV, ключ ему не соответствует
+        if result.get('data_source') == source:
+            cache.put(key, result)
+    result['cache'] = {'hit': False, 'key': key}
+    if lease['waited']:
+        # Владелец lease не уложился в lease_timeout или его прогноз не попал в кэш
+        result['cache']['waited_ms'] = lease['waited_ms']
+    return result
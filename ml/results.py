@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""Формат результата и ошибок прогноза - без NumPy, pandas и TensorFlow.
+
+predict_future.py импортирует этот модуль первым: ошибки (нет модели, неверные
+аргументы) и попадания в кэш обрабатываются до загрузки тяжелых модулей.
+"""
+
+import json
+import os
+import sys
+
+from ml import paths
+
+
+class ForecastError(Exception):
+    """Ошибка прогноза; payload уходит в stdout тем же JSON, что и раньше."""
+
+    def __init__(self, message, **extra):
+        super().__init__(message)
+        self.payload = {'error': message, **extra}
+
+
+def log(payload):
+    # Диагностика всегда идет в stderr, stdout остается чистым JSON
+    print(json.dumps(payload), file=sys.stderr)
+
+
+def parse_source(value):
+    return str(value).lower() in ['1', 'true', 'yes', 'snapshot']
+
+
+def check_model_exists(ticker):
+    model_path = paths.model_path(ticker)
+    scaler_path = paths.scaler_path(ticker)
+
+    if not os.path.exists(model_path) or not os.path.exists(scaler_path):
+        raise ForecastError(
+            f'Модель для тикера {ticker} не найдена. Сначала обучите модель.',
+            model_exists=os.path.exists(model_path),
+            scaler_exists=os.path.exists(scaler_path),
+        )
+
+
+ENGINES = ('keras', 'numpy')
+# window - точный прогноз скользящим окном, stateful - перенос состояний LSTM (--rollout)
+ROLLOUTS = ('window', 'stateful')
+
+
+# Перцентили полос неопределенности по умолчанию (--quantiles)
+DEFAULT_QUANTILES = (5, 50, 95)
+
+
+def band_key(q):
+    return f'p{q:g}'
+
+
+def parse_quantiles(value):
+    """'5,50,95' -> (5.0, 50.0, 95.0); ValueError при значениях вне [0, 100]."""
+    quantiles = tuple(sorted({float(q) for q in str(value).split(',') if q.strip()}))
+    if not quantiles or any(q < 0 or q > 100 for q in quantiles):
+        raise ValueError(f'Перцентили должны быть в диапазоне 0..100: {value}')
+    return quantiles
+
+
+def uncertainty_options(samples, quantiles, seed):
+    """Параметры Monte Carlo dropout для ключа кэша (None, если режим выключен)."""
+    if not samples:
+        return None
+    return {'samples': int(samples), 'quantiles': [float(q) for q in quantiles], 'seed': int(seed)}
+
+
+def forecast_options(samples, quantiles, seed, rollout='window', recursive=False):
+    """Все параметры, меняющие результат, для ключа кэша (None - все по умолчанию).
+
+    recursive - пошаговый прогноз в обход прямой модели горизонта (--recursive).
+    """
+    options = uncertainty_options(samples, quantiles, seed) or {}
+    if rollout != 'window':
+        options['rollout'] = rollout
+    if recursive:
+        options['forecast_mode'] = 'recursive'
+    return options or None
+
+
+def build_result(meta, predictions):
+    """Собирает полный результат CLI из события 'meta' и списка прогнозов."""
+    current_price = meta['current_price']
+    future_price = predictions[-1]['close'] if predictions else current_price
+
+    result = {
+        'ticker': meta['ticker'],
+        'current_price': current_price,
+        'predicted_price_252d': future_price,
+        'change_252d': future_price - current_price,
+        'change_252d_percent': ((future_price / current_price - 1) * 100) if current_price > 0 else 0,
+        'first_prediction': None,
+        'predictions': predictions,
+        'count': len(predictions),
+        'last_historical_date': meta['last_historical_date'],
+        'first_prediction_date': predictions[0]['time'] if predictions else None,
+        'last_prediction_date': predictions[-1]['time'] if predictions else None,
+        'used_snapshot': meta['used_snapshot'],
+        'snapshot_timestamp': meta['snapshot_timestamp'],
+        'data_source': meta['data_source'],
+        'model_accuracy': meta['model_accuracy'],
+        'engine': meta['engine'],
+        'snapshot_info': meta['snapshot_info']
+    }
+    if meta.get('uncertainty'):
+        result['uncertainty'] = meta['uncertainty']
+    if meta.get('rollout'):
+        result['rollout'] = meta['rollout']
+    if meta.get('model'):
+        result['model'] = meta['model']
+    if meta.get('forecast_mode'):
+        result['forecast_mode'] = meta['forecast_mode']
+    return result
+
+
+# Контрольные точки горизонта для --output summary: день, неделя, месяц, квартал, полгода, год
+CHECKPOINT_DAYS = (1, 5, 21, 63, 126, 252)
+
+SUMMARY_FIELDS = (
+    'ticker', 'current_price', 'predicted_price_252d', 'change_252d', 'change_252d_percent',
+    'count', 'last_historical_date', 'first_prediction_date', 'last_prediction_date',
+    'used_snapshot', 'snapshot_timestamp', 'data_source', 'model_accuracy', 'engine', 'uncertainty', 'rollout',
+    'model', 'forecast_mode', 'cache',
+)
+
+
+def summarize_result(result):
+    """Только заголовочные поля и контрольные точки горизонта - без 252 словарей прогнозов."""
+    if 'error' in result:
+        return result
+
+    predictions = result.get('predictions') or []
+    summary = {key: result[key] for key in SUMMARY_FIELDS if key in result}
+    summary['first_prediction'] = predictions[0]['close'] if predictions else None
+
+    days = [d for d in CHECKPOINT_DAYS if d < len(predictions)] + ([len(predictions)] if predictions else [])
+    summary['checkpoints'] = [
+        {'day': d, 'time': predictions[d - 1]['time'], 'close': predictions[d - 1]['close'],
+         **({'bands': predictions[d - 1]['bands']} if 'bands' in predictions[d - 1] else {})}
+        for d in days
+    ]
+    return summary
+
+
+def result_events(result):
+    """События 'meta'/'prediction'/'summary' из готового результата (например, из кэша)."""
+    meta = {key: result.get(key) for key in ('ticker', 'current_price', 'last_historical_date', 'used_snapshot',
+                                             'snapshot_timestamp', 'data_source', 'model_accuracy', 'engine',
+                                             'snapshot_info', 'uncertainty', 'rollout', 'model',
+                                             'forecast_mode')}
+    yield {'type': 'meta', **meta}
+    for step, prediction in enumerate(result.get('predictions') or [], start=1):
+        yield {'type': 'prediction', 'step': step, **prediction}
+    yield {'type': 'summary', **summarize_result(result)}
+
+
+def error_payload(e):
+    if isinstance(e, ForecastError):
+        return e.payload
+    return {
+        'error': f'Ошибка при генерации прогнозов: {str(e)}',
+        'traceback': str(e.__class__.__name__)
+    }
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""Параметры MinMaxScaler в JSON-sidecar и их применение на NumPy.
+
+Состояние MinMaxScaler - это минимум и масштаб, поэтому для прогноза незачем
+импортировать scikit-learn и распаковывать pickle. stock.py пишет рядом с
+scaler_patterns_<ticker>.pkl файл scaler_patterns_<ticker>.json; load_scaler
+берет его, если он не старше pickle, иначе читает pickle и создает sidecar.
+Перевести существующие модели заранее: python -m ml.scaler [TICKER ...]
+"""
+
+import json
+import os
+import pickle
+import sys
+
+import numpy as np
+
+from ml import paths
+
+SIDECAR_VERSION = 1
+
+
+class ArrayScaler:
+    """Подмножество интерфейса MinMaxScaler: transform / inverse_transform и атрибуты *_."""
+
+    def __init__(self, data_min, data_max, feature_range=(0, 1)):
+        self.data_min_ = np.asarray(data_min, dtype=np.float64).reshape(-1)
+        self.data_max_ = np.asarray(data_max, dtype=np.float64).reshape(-1)
+        self.feature_range = tuple(feature_range)
+        self.data_range_ = self.data_max_ - self.data_min_
+        # Как в sklearn: нулевой диапазон не масштабируется
+        data_range = np.where(self.data_range_ == 0.0, 1.0, self.data_range_)
+        self.scale_ = (self.feature_range[1] - self.feature_range[0]) / data_range
+        self.min_ = self.feature_range[0] - self.data_min_ * self.scale_
+
+    @classmethod
+    def from_sklearn(cls, scaler):
+        return cls(scaler.data_min_, scaler.data_max_, getattr(scaler, 'feature_range', (0, 1)))
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('version') != SIDECAR_VERSION:
+            raise ValueError(f'Неподдерживаемая версия параметров scaler: {data.get("version")}')
+        return cls(data['data_min'], data['data_max'], data.get('feature_range', (0, 1)))
+
+    def to_dict(self):
+        return {
+            'version': SIDECAR_VERSION,
+            'type': 'minmax',
+            'data_min': self.data_min_.tolist(),
+            'data_max': self.data_max_.tolist(),
+            'feature_range': list(self.feature_range),
+        }
+
+    @staticmethod
+    def _copy(X):
+        # Как check_array в sklearn: float32 остается float32, остальное - float64
+        X = np.asarray(X)
+        return np.array(X, dtype=X.dtype if X.dtype in (np.float32, np.float64) else np.float64)
+
+    def transform(self, X):
+        # Операции на месте повторяют sklearn бит в бит, включая округление во float32
+        X = self._copy(X)
+        X *= self.scale_
+        X += self.min_
+        return X
+
+    def inverse_transform(self, X):
+        X = self._copy(X)
+        X -= self.min_
+        X /= self.scale_
+        return X
+
+
+def sidecar_path(scaler_path):
+    return os.path.splitext(scaler_path)[0] + '.json'
+
+
+def save_sidecar(scaler, path):
+    params = scaler if isinstance(scaler, ArrayScaler) else ArrayScaler.from_sklearn(scaler)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(params.to_dict(), f)
+    os.replace(tmp_path, path)
+
+
+def _sidecar_is_fresh(scaler_path, json_path):
+    try:
+        return os.path.getmtime(json_path) >= os.path.getmtime(scaler_path)
+    except OSError:
+        # pickle нет, а sidecar есть - используем его
+        return os.path.exists(json_path)
+
+
+def load_pickled(scaler_path):
+    """Исходный MinMaxScaler из pickle (нужен scikit-learn)."""
+    with open(scaler_path, 'rb') as f:
+        return pickle.load(f)
+
+
+def load_scaler(scaler_path):
+    """ArrayScaler из JSON-sidecar; без него - pickle (и sidecar создается на будущее)."""
+    json_path = sidecar_path(scaler_path)
+    if _sidecar_is_fresh(scaler_path, json_path):
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                return ArrayScaler.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            pass
+
+    scaler = load_pickled(scaler_path)
+    try:
+        save_sidecar(scaler, json_path)
+    except (OSError, AttributeError):
+        pass
+    return scaler
+
+
+def convert(ticker):
+    path = paths.scaler_path(ticker)
+    save_sidecar(load_pickled(path), sidecar_path(path))
+    return sidecar_path(path)
+
+
+def main(argv=None):
+    import glob
+
+    argv = sys.argv[1:] if argv is None else argv
+    tickers = [t.upper() for t in argv]
+    if not tickers:
+        prefix = os.path.join(paths.models_dir, 'scaler_patterns_')
+        tickers = sorted(p[len(prefix):-len('.pkl')].upper() for p in glob.glob(f'{prefix}*.pkl'))
+
+    failed = 0
+    for ticker in tickers:
+        try:
+            print(f'{ticker}: {convert(ticker)}')
+        except Exception as e:
+            failed += 1
+            print(f'{ticker}: ошибка - {str(e)}', file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from ml.forecast import run_forecast
+from ml.forecast_store import is_default_run, store_result
+from ml.model_cache import ArtifactCache
+from ml.result_cache import ResultCache, cached_forecast
+from ml.results import (ENGINES, ROLLOUTS, ForecastError, check_model_exists, error_payload, forecast_options, log,
+                        parse_quantiles, parse_source, summarize_result)
+from ml.timings import Timings, write_metrics
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+
+class ForecastRequestHandler(BaseHTTPRequestHandler):
+    # Заполняется в serve()
+    cache = None
+    result_cache = None
+    default_engine = 'keras'
+    metrics_file = None
+    store = True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+
+        if url.path == '/health':
+            self._send(200, {'status': 'ok', 'cache': self.cache.stats()})
+            return
+
+        if url.path != '/forecast':
+            self._send(404, {'error': f'Неизвестный путь: {url.path}'})
+            return
+
+        query = parse_qs(url.query)
+        ticker = (query.get('ticker') or [''])[0].strip().upper()
+        if not ticker:
+            self._send(400, {'error': 'Не указан тикер'})
+            return
+
+        try:
+            days = int((query.get('days') or ['252'])[0])
+        except ValueError:
+            self._send(400, {'error': 'Некорректное количество дней'})
+            return
+
+        use_snapshot = parse_source((query.get('source') or ['snapshot'])[0])
+
+        engine = (query.get('engine') or [self.default_engine])[0]
+        if engine not in ENGINES:
+            self._send(400, {'error': f'Неизвестный движок: {engine}'})
+            return
+
+        output = (query.get('output') or ['full'])[0]
+        if output not in ('full', 'summary'):
+            self._send(400, {'error': f'Неизвестный формат ответа: {output}'})
+            return
+
+        rollout = (query.get('rollout') or ['window'])[0]
+        if rollout not in ROLLOUTS:
+            self._send(400, {'error': f'Неизвестный режим прогноза: {rollout}'})
+            return
+
+        try:
+            samples = max(0, int((query.get('samples') or ['0'])[0]))
+            quantiles = parse_quantiles((query.get('quantiles') or ['5,50,95'])[0])
+            seed = int((query.get('seed') or ['0'])[0])
+        except ValueError as e:
+            self._send(400, {'error': f'Некорректные параметры неопределенности: {str(e)}'})
+            return
+
+        recursive = (query.get('recursive') or ['0'])[0].strip().lower() in ('1', 'true', 'yes')
+
+        timings = Timings()
+
+        def compute():
+            with timings.stage('model_load'):
+                artifacts, lock = self.cache.get(ticker, engine)
+            with lock:
+                return run_forecast(artifacts, days=days, use_snapshot=use_snapshot, timings=timings,
+                                    samples=samples, quantiles=quantiles, seed=seed, rollout=rollout,
+                                    recursive=recursive)
+
+        try:
+            check_model_exists(ticker)
+            result = cached_forecast(self.result_cache, ticker, days, use_snapshot, engine, compute,
+                                     forecast_options(samples, quantiles, seed, rollout, recursive))
+            if self.store and is_default_run(days, samples, rollout, recursive):
+                # Графики читают прогноз из хранилища: просмотр страницы обновляет его, как CLI
+                with timings.stage('store'):
+                    store_result(result)
+        except ForecastError as e:
+            self._send(422, e.payload)
+            return
+        except Exception as e:
+            self._send(500, error_payload(e))
+            return
+
+        payload = summarize_result(result) if output == 'summary' else result
+        report = timings.to_dict()
+        if self.metrics_file:
+            write_metrics(self.metrics_file, report, 'predict_future_server', ticker)
+        self._send(200, {**payload, 'timings': report})
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log({'access': format % args})
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, cache_mb=512, engine='keras', use_result_cache=True,
+          metrics_file=None, store=True):
+    """Долгоживущий процесс прогнозирования: TensorFlow и модели загружаются один раз.
+
+    store - сохранять прогнозы режима по умолчанию (is_default_run) в хранилище прогнозов.
+    """
+    ForecastRequestHandler.cache = ArtifactCache(max_bytes=cache_mb * 1024 * 1024)
+    ForecastRequestHandler.result_cache = ResultCache() if use_result_cache else None
+    ForecastRequestHandler.default_engine = engine
+    ForecastRequestHandler.metrics_file = metrics_file
+    ForecastRequestHandler.store = store
+
+    server = ThreadingHTTPServer((host, port), ForecastRequestHandler)
+    server.daemon_threads = True
+    log({'info': f'Сервис прогнозирования запущен на http://{host}:{port}'})
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
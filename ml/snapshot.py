@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""Компактный снимок данных обучения (версия 2).
+
+models/data_snapshot_<ticker>/
+    header.json              - скаляры: дата, цена, lookback, точность, длина ряда и т.д.,
+                               в arrays - имена файлов массивов этой записи
+    last_sequence.<gen>.npy  - последнее окно (lookback, 1) float32, с которого начинается прогноз
+    close.<gen>.npy          - цены закрытия float32
+    volume.<gen>.npy         - объемы float32
+    time.<gen>.npy           - время свечей int64 (нс с эпохи)
+
+Каждая запись кладет массивы в новые файлы (<gen> - поколение записи) и
+только потом заменяет header.json, поэтому читатель всегда видит массивы
+своего заголовка, а не смесь старой и новой записи. Файлы предыдущего
+поколения остаются для читателей, открывших снимок до замены; более старые
+удаляются.
+
+Массивы открываются через mmap и читаются только по мере надобности,
+поэтому загрузка снимка не зависит от длины истории. X_pat не хранится
+и при необходимости строится заново из close.npy и scaler'а.
+
+Старые data_snapshot_<ticker>.pkl читаются как раньше и переводятся в новый
+формат командой: python -m ml.snapshot [TICKER ...]
+"""
+
+import json
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+
+from ml import paths
+from ml.windowing import make_windows
+
+SNAPSHOT_VERSION = 2
+HEADER_FILE = 'header.json'
+ARRAY_FILES = ('last_sequence', 'close', 'volume', 'time')
+
+
+def _atomic_save(path, array):
+    tmp_path = f'{path}.{os.getpid()}.tmp.npy'
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+def _array_files(header):
+    # Снимки до поколений хранили массивы как <name>.npy
+    files = (header or {}).get('arrays') or {}
+    return {name: files.get(name, f'{name}.npy') for name in ARRAY_FILES}
+
+
+def _read_header(directory):
+    try:
+        with open(os.path.join(directory, HEADER_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_snapshot(directory, df, last_sequence, meta):
+    """Записывает снимок; header.json заменяется последним и указывает на массивы своей записи."""
+    os.makedirs(directory, exist_ok=True)
+    previous = _read_header(directory)
+    generation = f'{time.time_ns():x}'
+
+    arrays = {
+        'last_sequence': np.asarray(last_sequence, dtype=np.float32).reshape(-1, 1),
+        'close': df['close'].to_numpy(dtype=np.float32),
+        'volume': df['volume'].to_numpy(dtype=np.float32) if 'volume' in df.columns else np.zeros(len(df), np.float32),
+        'time': df['time'].to_numpy(dtype='datetime64[ns]').astype(np.int64) if 'time' in df.columns
+        else np.zeros(len(df), np.int64),
+    }
+    files = {name: f'{name}.{generation}.npy' for name in arrays}
+    for name, array in arrays.items():
+        _atomic_save(os.path.join(directory, files[name]), array)
+
+    header = dict(meta)
+    header['version'] = SNAPSHOT_VERSION
+    header['records_count'] = int(len(df))
+    header['arrays'] = files
+
+    header_path = os.path.join(directory, HEADER_FILE)
+    tmp_path = f'{header_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(header, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, header_path)
+
+    keep = set(files.values())
+    if previous is not None:
+        keep.update(_array_files(previous).values())
+    for name in os.listdir(directory):
+        if name.endswith('.npy') and name not in keep and '.tmp' not in name:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+class Snapshot:
+    """Снимок данных обучения с ленивой загрузкой рядов."""
+
+    def __init__(self, header, directory=None, arrays=None):
+        self.header = header
+        self.directory = directory
+        self._arrays = dict(arrays or {})
+
+    @classmethod
+    def open(cls, directory):
+        with open(os.path.join(directory, HEADER_FILE), 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        if header.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f'Неподдерживаемая версия снимка: {header.get("version")}')
+        return cls(header, directory)
+
+    @classmethod
+    def from_legacy(cls, data_snapshot):
+        """Обертка над словарем из data_snapshot_<ticker>.pkl."""
+        df = data_snapshot['df']
+        header = {k: v for k, v in data_snapshot.items() if k not in ('df', 'X_pat', 'last_sequence')}
+        header['last_date'] = str(header.get('last_date'))
+        header['records_count'] = int(len(df))
+        arrays = {
+            'last_sequence': np.asarray(data_snapshot['last_sequence']),
+            'close': df['close'].to_numpy(dtype=np.float32),
+            'volume': df['volume'].to_numpy(dtype=np.float32) if 'volume' in df.columns else np.zeros(len(df), np.float32),
+            'time': df['time'].to_numpy(dtype='datetime64[ns]').astype(np.int64) if 'time' in df.columns
+            else np.zeros(len(df), np.int64),
+        }
+        return cls(header, arrays=arrays)
+
+    def array(self, name):
+        if name not in self._arrays:
+            path = os.path.join(self.directory, _array_files(self.header)[name])
+            self._arrays[name] = np.load(path, mmap_mode='r')
+        return self._arrays[name]
+
+    def get(self, key, default=None):
+        return self.header.get(key, default)
+
+    def __contains__(self, key):
+        return key in self.header
+
+    def __getitem__(self, key):
+        return self.header[key]
+
+    @property
+    def records_count(self):
+        return int(self.header['records_count'])
+
+    @property
+    def last_sequence(self):
+        return np.array(self.array('last_sequence'))
+
+    def avg_volume(self, n=30):
+        tail = self.array('volume')[-n:]
+        return int(np.asarray(tail, dtype=np.float64).mean()) if len(tail) else 0
+
+    def build_patterns(self, scaler):
+        """X_pat, y_pat по сохраненному ряду - только когда это действительно нужно."""
+        scaled = scaler.transform(np.asarray(self.array('close'), dtype=np.float64).reshape(-1, 1))
+        return make_windows(scaled, lookback=self.header['lookback'], forecast_days=self.header['forecast_days'])
+
+    def to_dataframe(self):
+        import pandas as pd
+        return pd.DataFrame({
+            'time': pd.to_datetime(np.asarray(self.array('time'))),
+            'close': np.asarray(self.array('close')),
+            'volume': np.asarray(self.array('volume')),
+        })
+
+    def nbytes(self):
+        # Массивы, открытые через mmap, резидентную память не занимают
+        return sum(a.nbytes for a in self._arrays.values() if not isinstance(a, np.memmap))
+
+
+def read_snapshot(ticker):
+    """Снимок версии 2, а если его нет - старый pickle."""
+    if os.path.exists(paths.snapshot_header_path(ticker)):
+        return Snapshot.open(paths.snapshot_dir(ticker))
+
+    with open(paths.snapshot_path(ticker), 'rb') as f:
+        data_snapshot = pickle.load(f)
+
+    if 'X_pat' in data_snapshot and not np.array_equal(data_snapshot['last_sequence'], data_snapshot['X_pat'][-1]):
+        print(json.dumps({'warning': 'last_sequence из снимка не соответствует X_pat[-1]. Используется last_sequence из снимка.'}),
+              file=sys.stderr)
+
+    return Snapshot.from_legacy(data_snapshot)
+
+
+def convert_legacy(ticker, remove_legacy=False):
+    with open(paths.snapshot_path(ticker), 'rb') as f:
+        data_snapshot = pickle.load(f)
+
+    meta = {k: v for k, v in data_snapshot.items() if k not in ('df', 'X_pat', 'last_sequence')}
+    meta['last_date'] = str(meta.get('last_date'))
+    write_snapshot(paths.snapshot_dir(ticker), data_snapshot['df'], data_snapshot['last_sequence'], meta)
+
+    if remove_legacy:
+        os.remove(paths.snapshot_path(ticker))
+
+
+def main(argv=None):
+    import argparse
+    import glob
+
+    parser = argparse.ArgumentParser(description='Перевод снимков data_snapshot_<ticker>.pkl в формат версии 2')
+    parser.add_argument('tickers', nargs='*', help='Тикеры (по умолчанию - все найденные .pkl)')
+    parser.add_argument('--remove-legacy', action='store_true', help='Удалить .pkl после конвертации')
+    args = parser.parse_args(argv)
+
+    tickers = args.tickers or [
+        os.path.basename(p)[len('data_snapshot_'):-len('.pkl')]
+        for p in glob.glob(os.path.join(paths.models_dir, 'data_snapshot_*.pkl'))
+    ]
+
+    failed = 0
+    for ticker in tickers:
+        try:
+            convert_legacy(ticker, remove_legacy=args.remove_legacy)
+            print(f'{ticker.upper()}: снимок переведен в {paths.snapshot_dir(ticker)}')
+        except Exception as e:
+            failed += 1
+            print(f'{ticker.upper()}: ошибка конвертации: {str(e)}')
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""Подбор гиперпараметров stock.py по тикеру: параллельные испытания с ранней отсечкой.
+
+Испытание - обучение модели stock.py с одной комбинацией lookback, units,
+dropout и batch_size на том же разбиении, что в stock.py (обучение на первых
+64% окон, валидация на следующих 16%), но не дольше --max-epochs эпох.
+Испытания идут в пуле процессов с ограничением потоков на процесс. После
+--prune-after эпох испытание останавливается, если его лучшая val_loss хуже
+медианы других испытаний того же тикера на той же эпохе (как MedianPruner в
+Optuna): слабые конфигурации не доучиваются до конца. Ряд тикера читается и
+нормализуется один раз на процесс и переиспользуется всеми его испытаниями.
+
+Лучшая конфигурация пишется в models/hyperparams_<ticker>.json (ml/hyperparams.py),
+stock.py использует ее при следующем обучении.
+
+    python -m ml.sweep SBER,GAZP [--trials 12] [--max-epochs 30] [--max-parallel 2]
+"""
+
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from ml.hyperparams import DEFAULTS, save_hyperparams
+
+DEFAULT_SPACE = {
+    'lookback': [30, 60, 90],
+    'units': [16, 32, 64],
+    'dropout': [0.2, 0.3],
+    'batch_size': [32, 64],
+}
+DEFAULT_TRIALS = 12
+DEFAULT_MAX_EPOCHS = 30
+DEFAULT_PRUNE_AFTER = 5
+DEFAULT_MAX_PARALLEL = 2
+TRIAL_PATIENCE = 5
+# stock.py обучает дольше и с EarlyStopping: запас эпох сверх лучшей эпохи испытания
+EPOCHS_MARGIN = 10
+# Меньше окон на валидацию - сравнение испытаний бессмысленно
+MIN_VALIDATION_WINDOWS = 20
+
+# Нормализованные ряды тикеров в процессе-воркере: общие для всех его испытаний
+_series_cache = {}
+
+
+def candidate_grid(space, seed=0, trials=None):
+    """Комбинации пространства поиска; конфигурация по умолчанию - первой, если она в пространстве.
+
+    trials меньше размера сетки - случайная выборка без повторов (seed).
+    """
+    import numpy as np
+
+    keys = sorted(space)
+    grid = [dict(zip(keys, values)) for values in itertools.product(*(space[k] for k in keys))]
+    baseline = {k: DEFAULTS[k] for k in keys if k in DEFAULTS}
+    rest = [params for params in grid if params != baseline]
+
+    if trials and trials < len(grid):
+        rng = np.random.default_rng(seed)
+        take = trials - 1 if baseline in grid else trials
+        rest = [rest[i] for i in sorted(rng.choice(len(rest), size=take, replace=False))]
+    return ([baseline] if baseline in grid else []) + rest
+
+
+def _training_series(ticker):
+    """Ряд close, нормализованный так же, как в stock.py (MinMaxScaler по всей истории)."""
+    if ticker not in _series_cache:
+        import numpy as np
+        from sklearn.preprocessing import MinMaxScaler
+
+        from ml.price_store import load_history
+
+        close = load_history(ticker).to_dataframe()[['close']].dropna().values
+        _series_cache[ticker] = MinMaxScaler(feature_range=(0, 1)).fit_transform(close).astype(np.float32).ravel()
+    return _series_cache[ticker]
+
+
+def should_prune(reports, key, epoch, warmup_epochs, min_trials=2):
+    """Лучшая val_loss испытания key к эпохе epoch хуже медианы других испытаний тикера."""
+    if epoch < warmup_epochs:
+        return False
+    ticker = key.split(':', 1)[0]
+    own = min(reports[key][:epoch])
+    others = sorted(min(losses[:epoch]) for other, losses in reports.items()
+                    if other != key and other.split(':', 1)[0] == ticker and len(losses) >= epoch)
+    if len(others) < min_trials:
+        return False
+    mid = len(others) // 2
+    median = others[mid] if len(others) % 2 else (others[mid - 1] + others[mid]) / 2
+    return own > median
+
+
+def run_trial(ticker, trial, params, max_epochs, warmup_epochs, reports, seed=0):
+    """Одно испытание в воркере; reports - общий для процессов dict 'ТИКЕР:номер' -> val_loss по эпохам."""
+    import tensorflow as tf
+    from tensorflow.keras.callbacks import EarlyStopping, LambdaCallback
+
+    from ml.model_factory import build_pattern_model
+    from ml.tf_pipeline import window_dataset
+
+    started = time.perf_counter()
+    config = {**DEFAULTS, **params}
+    lookback = config['lookback']
+    key = f'{ticker}:{trial}'
+
+    series = _training_series(ticker)
+    windows = len(series) - lookback
+    train_size = int(windows * 0.8)
+    fit_size = int(train_size * 0.8)
+    if train_size - fit_size < MIN_VALIDATION_WINDOWS:
+        return {'trial': trial, 'params': params, 'error': f'Недостаточно данных: {len(series)} записей'}
+
+    tf.keras.utils.set_random_seed(seed)
+    model = build_pattern_model(lookback=lookback, units=config['units'], lstm_layers=config['lstm_layers'],
+                                dropout=config['dropout'])
+    model.compile(optimizer='adam', loss='mse')
+
+    pruned = []
+
+    def on_epoch_end(epoch, logs):
+        # Прокси Manager().dict отдает копию списка - записываем обратно целиком
+        losses = reports.get(key, []) + [float(logs['val_loss'])]
+        reports[key] = losses
+        if should_prune(reports, key, epoch + 1, warmup_epochs):
+            pruned.append(epoch + 1)
+            model.stop_training = True
+
+    history = model.fit(
+        window_dataset(series, 0, fit_size, lookback=lookback, batch_size=config['batch_size'], shuffle=True,
+                       seed=seed),
+        validation_data=window_dataset(series, fit_size, train_size, lookback=lookback,
+                                       batch_size=config['batch_size']),
+        epochs=max_epochs,
+        callbacks=[EarlyStopping(monitor='val_loss', patience=TRIAL_PATIENCE),
+                   LambdaCallback(on_epoch_end=on_epoch_end)],
+        verbose=0,
+    )
+
+    val_loss = history.history['val_loss']
+    best_epoch = min(range(len(val_loss)), key=val_loss.__getitem__) + 1
+    return {
+        'trial': trial,
+        'params': params,
+        'val_loss': val_loss[best_epoch - 1],
+        'best_epoch': best_epoch,
+        'epochs_run': len(val_loss),
+        'pruned': bool(pruned),
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+
+
+def pick_winner(trials):
+    """Лучшее доученное испытание и конфигурация для stock.py (None, если доученных нет)."""
+    completed = [t for t in trials if 'error' not in t and not t['pruned']]
+    if not completed:
+        return None, None
+    best = min(completed, key=lambda t: t['val_loss'])
+    config = {**DEFAULTS, **best['params'],
+              'epochs': min(DEFAULTS['epochs'], best['best_epoch'] + EPOCHS_MARGIN)}
+    return best, config
+
+
+def run_sweep(tickers, space=None, trials=DEFAULT_TRIALS, max_epochs=DEFAULT_MAX_EPOCHS,
+              prune_after=DEFAULT_PRUNE_AFTER, max_parallel=DEFAULT_MAX_PARALLEL, threads_per_trial=None, seed=0,
+              save=True):
+    """Испытания всех тикеров в одном пуле; по JSON-строке на тикер в stdout.
+
+    Возвращает количество тикеров, для которых не нашлось ни одного доученного испытания.
+    """
+    from ml.batch import _init_worker, pool_thread_limits
+
+    space = space or DEFAULT_SPACE
+    cpu_count = os.cpu_count() or 1
+    threads = threads_per_trial or max(1, cpu_count // max_parallel)
+
+    started = time.perf_counter()
+    results = {ticker: [] for ticker in tickers}
+    # spawn: fork процесса с уже инициализированным TensorFlow небезопасен
+    context = multiprocessing.get_context('spawn')
+    with pool_thread_limits(threads), context.Manager() as manager, \
+            ProcessPoolExecutor(max_workers=max_parallel, mp_context=context,
+                                initializer=_init_worker, initargs=(threads, 'keras')) as pool:
+        reports = manager.dict()
+        futures = {}
+        for ticker in tickers:
+            for trial, params in enumerate(candidate_grid(space, seed, trials)):
+                future = pool.submit(run_trial, ticker, trial, params, max_epochs, prune_after, reports, seed)
+                futures[future] = (ticker, trial, params)
+
+        for future in as_completed(futures):
+            ticker, trial, params = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'trial': trial, 'params': params, 'error': f'Ошибка воркера: {str(e)}'}
+            results[ticker].append(result)
+            state = result.get('error') or (f"val_loss {result['val_loss']:.6f}, эпох {result['epochs_run']}"
+                                            + (', отсечено' if result['pruned'] else ''))
+            print(f"{ticker} #{trial} {json.dumps(params)}: {state}", file=sys.stderr, flush=True)
+
+    failed = 0
+    for ticker in tickers:
+        trials_done = sorted(results[ticker], key=lambda t: t['trial'])
+        best, config = pick_winner(trials_done)
+        record = {'ticker': ticker, 'trials': trials_done,
+                  'pruned': sum(1 for t in trials_done if t.get('pruned'))}
+        if best is None:
+            failed += 1
+            record['error'] = 'Ни одно испытание не завершилось'
+        else:
+            record.update(best=config, val_loss=best['val_loss'])
+            if save:
+                record['saved'] = save_hyperparams(ticker, config, val_loss=best['val_loss'],
+                                                   trials=len(trials_done), pruned=record['pruned'])
+        sys.stdout.write(json.dumps(record, ensure_ascii=False) + '\n')
+        sys.stdout.flush()
+
+    print(f'Подбор завершен за {time.perf_counter() - started:.1f} с', file=sys.stderr)
+    return failed
+
+
+def main(argv=None):
+    import argparse
+
+    from ml.train_batch import all_tickers
+
+    parser = argparse.ArgumentParser(prog='python -m ml.sweep',
+                                     description='Подбор гиперпараметров LSTM-модели stock.py по тикерам')
+    parser.add_argument('tickers', help='Тикеры через запятую или all - все тикеры, для которых есть CSV')
+    parser.add_argument('--space',
+                        help='JSON-файл пространства поиска {"lookback": [...], "units": [...], ...} '
+                             '(по умолчанию lookback 30/60/90, units 16/32/64, dropout 0.2/0.3, batch_size 32/64)')
+    parser.add_argument('--trials', type=int, default=DEFAULT_TRIALS,
+                        help=f'Испытаний на тикер; меньше размера сетки - случайная выборка (по умолчанию {DEFAULT_TRIALS})')
+    parser.add_argument('--max-epochs', type=int, default=DEFAULT_MAX_EPOCHS,
+                        help=f'Эпох на испытание не больше (по умолчанию {DEFAULT_MAX_EPOCHS})')
+    parser.add_argument('--prune-after', type=int, default=DEFAULT_PRUNE_AFTER,
+                        help=f'С какой эпохи отсекать слабые испытания (по умолчанию {DEFAULT_PRUNE_AFTER})')
+    parser.add_argument('--max-parallel', type=int, default=DEFAULT_MAX_PARALLEL,
+                        help=f'Испытаний одновременно (по умолчанию {DEFAULT_MAX_PARALLEL})')
+    parser.add_argument('--threads-per-trial', type=int, default=None,
+                        help='Потоков BLAS/TensorFlow на испытание (по умолчанию ядра / max-parallel)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed выборки комбинаций и обучения (по умолчанию 0)')
+    parser.add_argument('--dry-run', action='store_true', help='Не сохранять лучшую конфигурацию')
+    args = parser.parse_args(argv)
+
+    space = None
+    if args.space:
+        with open(args.space, 'r', encoding='utf-8') as f:
+            space = json.load(f)
+        # epochs подбирается по лучшей эпохе испытаний, а не перебором
+        unknown = sorted(set(space) - (set(DEFAULTS) - {'epochs'}))
+        if unknown:
+            parser.error(f'неизвестные параметры пространства поиска: {", ".join(unknown)}')
+
+    if args.tickers.strip().lower() == 'all':
+        tickers = all_tickers()
+    else:
+        tickers = [t.strip().upper() for t in args.tickers.split(',') if t.strip()]
+    if not tickers:
+        parser.error('не указано ни одного тикера')
+
+    failed = run_sweep(tickers, space=space, trials=args.trials, max_epochs=args.max_epochs,
+                       prune_after=args.prune_after, max_parallel=max(1, args.max_parallel),
+                       threads_per_trial=args.threads_per_trial, seed=args.seed, save=not args.dry_run)
+    return 1 if failed == len(tickers) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
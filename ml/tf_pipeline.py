@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""tf.data-конвейер обучения: окна строятся на лету из ряда float32.
+
+В памяти держится только нормализованный ряд цен (n значений), а не тензор
+окон (n x lookback): каждый батч собирается tf.gather по индексам начала окон.
+Значения окон совпадают с make_windows из ml/windowing.py.
+"""
+
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from ml.resources import format_bytes, peak_rss_bytes
+
+
+def configure_threads(intra_op=None, inter_op=None):
+    """Размеры пулов потоков TensorFlow; вызывать до первой операции."""
+    if intra_op:
+        tf.config.threading.set_intra_op_parallelism_threads(int(intra_op))
+    if inter_op:
+        tf.config.threading.set_inter_op_parallelism_threads(int(inter_op))
+
+
+def window_dataset(series, start, end, lookback=60, forecast_days=1, batch_size=32, shuffle=False, cache=False,
+                   seed=None, horizons=None):
+    """Батчи (X, y) для окон с номерами [start, end).
+
+    Окно i - series[i:i + lookback], цель - series[i + lookback + forecast_days - 1].
+    horizons - список горизонтов h в шагах: цель - вектор series[i + lookback + h - 1]
+    по всем h (прямая модель горизонта, ml/direct.py); forecast_days тогда не используется.
+    cache=True кэширует собранные окна после первой эпохи (быстрее, но окна
+    материализуются в памяти - имеет смысл для коротких историй). С shuffle
+    кэшируются сами окна, а перемешиваются и собираются в батчи они уже из кэша:
+    каждая эпоха идет в новом порядке, порядок тот же, что и без кэша.
+    """
+    values = tf.constant(np.asarray(series, dtype=np.float32).reshape(-1))
+    offsets = tf.range(lookback, dtype=tf.int64)
+    targets = None if horizons is None else tf.constant(np.asarray(horizons, dtype=np.int64) + lookback - 1)
+
+    def gather(idx):
+        X = tf.gather(values, idx[:, None] + offsets)[:, :, None]
+        if targets is not None:
+            return X, tf.gather(values, idx[:, None] + targets)
+        y = tf.gather(values, idx + lookback + forecast_days - 1)
+        return X, y
+
+    ds = tf.data.Dataset.range(start, end)
+    if cache and shuffle:
+        ds = ds.batch(batch_size).map(gather, num_parallel_calls=tf.data.AUTOTUNE).unbatch().cache()
+        ds = ds.shuffle(max(1, end - start), seed=seed, reshuffle_each_iteration=True).batch(batch_size)
+        return ds.prefetch(tf.data.AUTOTUNE)
+
+    if shuffle:
+        ds = ds.shuffle(max(1, end - start), seed=seed, reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size).map(gather, num_parallel_calls=tf.data.AUTOTUNE)
+    if cache:
+        ds = ds.cache()
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+
+class ThroughputLogger(tf.keras.callbacks.Callback):
+    """Печатает скорость обучения (примеров/с) и пиковую память после каждой эпохи."""
+
+    def __init__(self, samples_per_epoch):
+        super().__init__()
+        self.samples_per_epoch = samples_per_epoch
+        self.epochs = []
+        self._started = None
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._started = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        seconds = time.perf_counter() - self._started
+        record = {
+            'epoch': epoch + 1,
+            'seconds': round(seconds, 3),
+            'samples_per_sec': round(self.samples_per_epoch / seconds, 1) if seconds > 0 else None,
+            'peak_rss_bytes': peak_rss_bytes(),
+        }
+        self.epochs.append(record)
+        print(f"Эпоха {record['epoch']}: {record['seconds']:.2f} с, "
+              f"{record['samples_per_sec']} примеров/с, пиковая память {format_bytes(record['peak_rss_bytes'])}")
+
+
+def pooled_window_dataset(series, starts, ids=None, lookback=60, forecast_days=1, batch_size=32, shuffle=False,
+                          seed=None, unknown_rate=0.0):
+    """Батчи окон нескольких тикеров из одного сцепленного ряда (ml/global_model.py).
+
+    starts - индексы начала окон в series (окна не пересекают границы тикеров),
+    ids - номер тикера каждого окна; с ids батч - ((X, id), y), без - (X, y).
+    unknown_rate - доля окон, у которых номер заменяется на 0 ("неизвестный тикер"),
+    чтобы модель умела прогнозировать и тикеры, которых не было в обучении.
+    """
+    values = tf.constant(np.asarray(series, dtype=np.float32).reshape(-1))
+    offsets = tf.range(lookback, dtype=tf.int64)
+    starts = np.asarray(starts, dtype=np.int64)
+
+    if ids is None:
+        ds = tf.data.Dataset.from_tensor_slices(starts)
+    else:
+        ds = tf.data.Dataset.from_tensor_slices((starts, np.asarray(ids, dtype=np.int32)))
+    if shuffle:
+        ds = ds.shuffle(max(1, len(starts)), seed=seed, reshuffle_each_iteration=True)
+
+    def gather(idx, ticker_ids=None):
+        X = tf.gather(values, idx[:, None] + offsets)[:, :, None]
+        y = tf.gather(values, idx + lookback + forecast_days - 1)
+        if ticker_ids is None:
+            return X, y
+        if unknown_rate > 0:
+            ticker_ids = tf.where(tf.random.uniform(tf.shape(ticker_ids)) < unknown_rate, 0, ticker_ids)
+        return (X, ticker_ids[:, None]), y
+
+    ds = ds.batch(batch_size).map(gather, num_parallel_calls=tf.data.AUTOTUNE)
+    return ds.prefetch(tf.data.AUTOTUNE)
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""Замеры времени этапов прогноза и обучения.
+
+Timings собирает длительности этапов, время каждого шага прогноза и пиковую
+память; to_dict() попадает в результат под ключом "timings". write_metrics
+дополнительно пишет замеры в файл: *.prom - текстовый файл для textfile
+collector node_exporter (строки одного скрипта и тикера заменяются), любое
+другое расширение - JSONL, по строке на запуск.
+
+Модуль не импортирует NumPy, чтобы замерять и загрузку тяжелых модулей.
+"""
+
+import json
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+from ml.locks import locked
+from ml.resources import peak_rss_bytes, process_start_time
+
+STEP_PERCENTILES = (50, 90, 99)
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+def _percentile(sorted_values, p):
+    # Линейная интерполяция, как numpy.percentile по умолчанию
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class Timings:
+    """Длительности этапов в порядке выполнения; повторный этап суммируется."""
+
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.stages = OrderedDict()
+        self.steps = []
+        self.epochs = []
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_interpreter_startup(self, script_started_wall):
+        """Время от запуска процесса до первой строки скрипта (интерпретатор и site)."""
+        process_started = process_start_time()
+        if process_started is not None and script_started_wall >= process_started:
+            self.add('interpreter', script_started_wall - process_started)
+
+    def step(self, seconds):
+        self.steps.append(seconds)
+
+    def to_dict(self):
+        result = {
+            'stages_ms': {name: _ms(seconds) for name, seconds in self.stages.items()},
+            # Время интерпретатора прошло до started, поэтому прибавляется отдельно
+            'total_ms': _ms(time.perf_counter() - self.started + self.stages.get('interpreter', 0.0)),
+            'peak_rss_bytes': peak_rss_bytes(),
+        }
+        if self.steps:
+            steps = sorted(self.steps)
+            result['steps'] = {
+                'count': len(steps),
+                **{f'p{p}_ms': _ms(_percentile(steps, p)) for p in STEP_PERCENTILES},
+                'max_ms': _ms(steps[-1]),
+            }
+        if self.epochs:
+            result['epochs'] = self.epochs
+        return result
+
+
+def _prom_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_lines(timings, script, ticker):
+    labels = f'script="{_prom_label(script)}",ticker="{_prom_label(ticker)}"'
+    lines = []
+    for name, ms in timings.get('stages_ms', {}).items():
+        lines.append(f'forecast_stage_seconds{{{labels},stage="{_prom_label(name)}"}} {ms / 1000:.6f}')
+    for key, value in timings.get('steps', {}).items():
+        if key.endswith('_ms'):
+            quantile = {'max_ms': '1'}.get(key, f'0.{key[1:-3]}')
+            lines.append(f'forecast_step_seconds{{{labels},quantile="{quantile}"}} {value / 1000:.6f}')
+    lines.append(f'forecast_total_seconds{{{labels}}} {timings["total_ms"] / 1000:.6f}')
+    if timings.get('peak_rss_bytes') is not None:
+        lines.append(f'forecast_peak_rss_bytes{{{labels}}} {timings["peak_rss_bytes"]}')
+    lines.append(f'forecast_last_run_timestamp_seconds{{{labels}}} {time.time():.3f}')
+    return lines
+
+
+PROM_METRICS = OrderedDict([
+    ('forecast_stage_seconds', 'Длительность этапа прогноза или обучения'),
+    ('forecast_step_seconds', 'Квантили длительности одного шага прогноза'),
+    ('forecast_total_seconds', 'Полное время запуска'),
+    ('forecast_peak_rss_bytes', 'Пиковый резидентный объем памяти процесса'),
+    ('forecast_last_run_timestamp_seconds', 'Время последнего запуска'),
+])
+
+
+def _prom_text(samples):
+    # Формат textfile требует, чтобы строки одной метрики шли группой после HELP/TYPE
+    lines = []
+    for name, help_text in PROM_METRICS.items():
+        group = [line for line in samples if line.split('{', 1)[0] == name]
+        if group:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge'] + group
+    return '\n'.join(lines) + '\n'
+
+
+def write_metrics(path, timings, script, ticker):
+    """Пишет замеры в файл метрик; ошибки записи не должны ломать прогноз."""
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with locked(f'{path}.lock'):
+            if path.endswith('.prom'):
+                _write_prometheus(path, timings, script, ticker)
+            else:
+                record = {'timestamp': datetime.now().isoformat(), 'script': script, 'ticker': ticker, **timings}
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    except OSError as e:
+        return str(e)
+    return None
+
+
+def _write_prometheus(path, timings, script, ticker):
+    # Строки других тикеров сохраняются: один файл на все запуски скрипта
+    own = f'script="{_prom_label(script)}",ticker="{_prom_label(ticker)}"'
+    kept = []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            kept = [line.rstrip('\n') for line in f
+                    if line.strip() and not line.startswith('#') and f'{{{own}' not in line]
+    except OSError:
+        pass
+
+    # textfile collector может прочитать файл в любой момент - подменяем атомарно
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(_prom_text(kept + prometheus_lines(timings, script, ticker)))
+    os.replace(tmp_path, path)
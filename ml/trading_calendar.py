@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""Торговый календарь для дат прогноза.
+
+Даты всех шагов прогноза считаются одним вызовом numpy.busday_offset по
+календарю "будни минус праздники MOEX" (ml/data/moex_holidays.txt или
+MOEX_HOLIDAYS_FILE). Календарь строится один раз и перечитывается только при
+изменении файла - сервису прогнозов не нужно разбирать его на каждый запрос.
+"""
+
+import os
+from datetime import datetime
+
+import numpy as np
+
+from ml import paths
+
+WEEKMASK = '1111100'
+
+_calendars = {}
+
+
+def load_holidays(path):
+    """Даты из файла праздников; строки с # и пустые пропускаются, нет файла - нет праздников."""
+    holidays = []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.split('#', 1)[0].strip()
+                if not line:
+                    continue
+                try:
+                    holidays.append(np.datetime64(line, 'D'))
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return np.array(holidays, dtype='datetime64[D]')
+
+
+def business_calendar(path=None):
+    path = path or paths.holidays_path()
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+
+    cached = _calendars.get(path)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, np.busdaycalendar(weekmask=WEEKMASK, holidays=load_holidays(path)))
+        _calendars[path] = cached
+    return cached[1]
+
+
+def trading_days(last_date, count, calendar=None):
+    """count торговых дней после last_date (datetime), datetime64[s] с тем же временем суток.
+
+    Если last_date сам неторговый день, первым идет ближайший следующий торговый.
+    """
+    calendar = calendar if calendar is not None else business_calendar()
+    day = np.datetime64(last_date.date(), 'D')
+    # roll='backward': от выходного отсчитываем с предыдущего торгового дня, иначе пропустили бы понедельник
+    days = np.busday_offset(day, np.arange(1, count + 1), roll='backward', busdaycal=calendar)
+    time_of_day = last_date - datetime.combine(last_date.date(), datetime.min.time())
+    return days.astype('datetime64[s]') + np.timedelta64(int(time_of_day.total_seconds()), 's')
+
+
+def format_dates(dates):
+    """Строки 'YYYY-MM-DD HH:MM:SS', как в CSV и результате прогноза."""
+    return np.char.replace(np.datetime_as_string(dates, unit='s'), 'T', ' ').tolist()
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+"""Пакетное обучение моделей: stock.py --tickers SBER,GAZP --max-parallel 2
+
+Каждый тикер обучается отдельным процессом stock.py <TICKER> с ограниченным
+числом потоков BLAS/TensorFlow. Одновременно идет не больше max_parallel
+обучений - в том числе между независимыми запусками (например, при добавлении
+нескольких тикеров из админки): занятость определяется блокировками файлов
+models/.training_slots/slot_<n>.lock.
+
+Ход обучения пишется в models/training_status.json (его читает endpoint
+model-status), вывод stock.py - в storage/logs/model_training_<ticker>.log.
+"""
+
+import glob
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from ml import paths
+from ml.batch import THREAD_ENV_VARS
+from ml.locks import locked, try_lock, unlock
+
+DEFAULT_MAX_PARALLEL = 2
+SLOT_POLL_SECONDS = 2
+
+
+@contextmanager
+def training_slot(max_parallel, on_wait=None):
+    """Ждет свободный слот из max_parallel; слот освобождается и при аварийном завершении процесса."""
+    os.makedirs(paths.training_slots_dir, exist_ok=True)
+    waiting = False
+    while True:
+        for n in range(max_parallel):
+            f = open(os.path.join(paths.training_slots_dir, f'slot_{n}.lock'), 'a+')
+            if try_lock(f):
+                try:
+                    yield n
+                finally:
+                    unlock(f)
+                    f.close()
+                return
+            f.close()
+
+        if not waiting and on_wait is not None:
+            on_wait()
+        waiting = True
+        time.sleep(SLOT_POLL_SECONDS)
+
+
+def read_status():
+    try:
+        with open(paths.training_status_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'tickers': {}}
+
+
+def update_status(ticker, **fields):
+    """Обновляет запись тикера в общем файле статуса (read-modify-write под блокировкой)."""
+    os.makedirs(paths.models_dir, exist_ok=True)
+    with locked(f'{paths.training_status_path}.lock'):
+        status = read_status()
+        entry = status.setdefault('tickers', {}).setdefault(ticker, {})
+        entry.update(fields)
+        entry['updated_at'] = datetime.now().isoformat()
+        status['updated_at'] = entry['updated_at']
+
+        tmp_path = f'{paths.training_status_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(status, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, paths.training_status_path)
+
+
+def is_up_to_date(ticker):
+    """Модель и scaler новее CSV с данными и подобранных гиперпараметров - переобучать нечего."""
+    try:
+        data_mtime = os.path.getmtime(paths.csv_path(ticker))
+        if os.path.exists(paths.hyperparams_path(ticker)):
+            data_mtime = max(data_mtime, os.path.getmtime(paths.hyperparams_path(ticker)))
+        return min(os.path.getmtime(paths.model_path(ticker)), os.path.getmtime(paths.scaler_path(ticker))) > data_mtime
+    except OSError:
+        return False
+
+
+def all_tickers():
+    return sorted(os.path.splitext(os.path.basename(p))[0].upper()
+                  for p in glob.glob(os.path.join(paths.csv_dir, '*.csv')))
+
+
+def _train_ticker(ticker, max_parallel, threads, incremental=False, direct=None):
+    log_path = paths.training_log_path(ticker)
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+
+    env = dict(os.environ, PYTHONIOENCODING='utf-8', TF_CPP_MIN_LOG_LEVEL='2')
+    for name in THREAD_ENV_VARS:
+        env[name] = str(threads)
+    env['TF_NUM_INTEROP_THREADS'] = '1'
+
+    command = [sys.executable, os.path.join(paths.script_dir, 'stock.py'), ticker]
+    if incremental:
+        command.append('--incremental')
+    if direct:
+        command += ['--direct', direct]
+
+    with training_slot(max_parallel, on_wait=lambda: update_status(ticker, state='waiting')) as slot:
+        started = time.time()
+        update_status(ticker, state='running', slot=slot, pid=None, log=log_path, threads=threads,
+                      started_at=datetime.now().isoformat(), finished_at=None, returncode=None, error=None)
+        print(f'[{ticker}] обучение начато (слот {slot}, потоков {threads}), лог: {log_path}', flush=True)
+
+        with open(log_path, 'w', encoding='utf-8') as log_file:
+            process = subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT, env=env,
+                                       cwd=paths.script_dir)
+            update_status(ticker, pid=process.pid)
+            returncode = process.wait()
+
+    duration = round(time.time() - started, 1)
+    state = 'done' if returncode == 0 else 'failed'
+    update_status(ticker, state=state, pid=None, returncode=returncode, duration=duration,
+                  finished_at=datetime.now().isoformat())
+    print(f'[{ticker}] {"обучение завершено" if returncode == 0 else f"ошибка обучения (код {returncode})"} '
+          f'за {duration} с', flush=True)
+    return returncode == 0
+
+
+def run_training_batch(tickers, max_parallel=DEFAULT_MAX_PARALLEL, threads_per_job=None, force=False,
+                       incremental=False, direct=None):
+    """Обучает модели для списка тикеров очередью из max_parallel процессов.
+
+    incremental=True - дообучение существующих моделей (stock.py --incremental),
+    direct - режим горизонтов прямой модели (stock.py --direct, ml/direct.py).
+    Возвращает количество тикеров, завершившихся ошибкой.
+    """
+    max_parallel = max(1, max_parallel)
+    threads = threads_per_job or max(1, (os.cpu_count() or 1) // max_parallel)
+
+    jobs = queue.Queue()
+    for ticker in dict.fromkeys(t.upper() for t in tickers):
+        if not force and is_up_to_date(ticker):
+            update_status(ticker, state='skipped', reason='Модель новее данных')
+            print(f'[{ticker}] пропущен: модель новее данных', flush=True)
+            continue
+        update_status(ticker, state='queued', queued_at=datetime.now().isoformat(), reason=None, error=None)
+        jobs.put(ticker)
+
+    total = jobs.qsize()
+    failed = []
+    failed_lock = threading.Lock()
+
+    def worker():
+        while True:
+            try:
+                ticker = jobs.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                ok = _train_ticker(ticker, max_parallel, threads, incremental, direct)
+            except Exception as e:
+                update_status(ticker, state='failed', error=str(e), finished_at=datetime.now().isoformat())
+                print(f'[{ticker}] ошибка запуска обучения: {str(e)}', flush=True)
+                ok = False
+            if not ok:
+                with failed_lock:
+                    failed.append(ticker)
+
+    print(f'Обучение {total} моделей, параллельно: {max_parallel}, потоков на задачу: {threads}', flush=True)
+    workers = [threading.Thread(target=worker, daemon=True) for _ in range(min(max_parallel, total))]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+
+    print(f'Готово: успешно {total - len(failed)}, с ошибкой {len(failed)}'
+          + (f' ({", ".join(failed)})' if failed else ''), flush=True)
+    return len(failed)
+
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='stock.py', description='Пакетное обучение LSTM-моделей')
+    parser.add_argument('--tickers', required=True,
+                        help='Тикеры через запятую или all - все тикеры, для которых есть CSV')
+    parser.add_argument('--max-parallel', type=int, default=DEFAULT_MAX_PARALLEL,
+                        help=f'Сколько моделей обучается одновременно (по умолчанию {DEFAULT_MAX_PARALLEL})')
+    parser.add_argument('--threads-per-job', type=int, default=None,
+                        help='Потоков BLAS/TensorFlow на обучение (по умолчанию ядра / max-parallel)')
+    parser.add_argument('--force', action='store_true', help='Переобучить даже модели, которые новее данных')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Дообучить существующие модели на новых свечах вместо обучения с нуля')
+    parser.add_argument('--direct', nargs='?', const='full', choices=['full', 'checkpoints'], default=None,
+                        help='Обучить и прямую модель горизонта (см. python stock.py --help)')
+    args = parser.parse_args(argv)
+
+    if args.tickers.strip().lower() == 'all':
+        tickers = all_tickers()
+    else:
+        tickers = [t.strip().upper() for t in args.tickers.split(',') if t.strip()]
+
+    if not tickers:
+        print('Не указано ни одного тикера')
+        return 1
+
+    failed = run_training_batch(tickers, max_parallel=args.max_parallel, threads_per_job=args.threads_per_job,
+                                force=args.force, incremental=args.incremental, direct=args.direct)
+    return 1 if failed else 0
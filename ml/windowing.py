@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def make_windows(scaled, lookback: int = 60, forecast_days: int = 1, dtype=np.float32):
+    """Окна паттернов для LSTM без цикла и без копирования каждого окна.
+
+    Возвращает X формы (n, lookback, 1) и y формы (n,) - ровно те же значения,
+    что давал цикл X.append(scaled[i - lookback:i]), y.append(scaled[i + forecast_days - 1, 0]).
+    X - strided view над одной копией ряда в dtype; если потребителю нужна
+    непрерывная память, он сам вызывает np.ascontiguousarray.
+    """
+    values = np.asarray(scaled, dtype=dtype)
+    if values.ndim == 1:
+        values = values[:, None]
+
+    n = len(values) - lookback - forecast_days + 1
+    if n <= 0:
+        return (np.empty((0, lookback, values.shape[1]), dtype=values.dtype),
+                np.empty((0,), dtype=values.dtype))
+
+    # sliding_window_view дает форму (len - lookback + 1, features, lookback)
+    X = sliding_window_view(values, lookback, axis=0)[:n].transpose(0, 2, 1)
+    y = values[lookback + forecast_days - 1:lookback + forecast_days - 1 + n, 0]
+
+    return X, y
+
@@ -1,10 +1,17 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import time
+
+# Отсчет для timings: все, что ниже, включая импорты, попадает в замеры
+SCRIPT_STARTED = time.perf_counter()
+SCRIPT_STARTED_WALL = time.time()
+
 import sys
 import os
 import json
-from datetime import datetime, timedelta
+import argparse
+import contextlib
 
 if sys.platform == 'win32':
     import io
@@ -12,348 +19,221 @@ if sys.platform == 'win32':
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
 # Подавляем информационные сообщения TensorFlow
-import os
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'  # 0 = все, 1 = INFO, 2 = WARNING, 3 = ERROR
 
-if len(sys.argv) < 2:
-    print(json.dumps({'error': 'Не указан тикер'}))
-    sys.exit(1)
-
-ticker = sys.argv[1].upper()
-days = int(sys.argv[2]) if len(sys.argv) > 2 else 252  # По умолчанию 252 дня (год)
-
-# Опция использования снимка данных (по умолчанию True - используем снимок если есть)
-use_snapshot = True
-if len(sys.argv) > 3:
-    use_snapshot_arg = sys.argv[3].lower()
-    use_snapshot = use_snapshot_arg in ['1', 'true', 'yes', 'snapshot']
-
-script_dir = os.path.dirname(os.path.abspath(__file__))
-models_dir = os.path.join(script_dir, 'models')
-csv_dir = os.path.join(script_dir, 'storage', 'app', 'private', 'securities')
-
-# Проверяем наличие модели
-model_path = os.path.join(models_dir, f'lstm_patterns_{ticker.lower()}.h5')
-scaler_path = os.path.join(models_dir, f'scaler_patterns_{ticker.lower()}.pkl')
-data_snapshot_path = os.path.join(models_dir, f'data_snapshot_{ticker.lower()}.pkl')
-
-if not os.path.exists(model_path) or not os.path.exists(scaler_path):
-    print(json.dumps({
-        'error': f'Модель для тикера {ticker} не найдена. Сначала обучите модель.',
-        'model_exists': os.path.exists(model_path),
-        'scaler_exists': os.path.exists(scaler_path)
-    }))
-    sys.exit(1)
-
-try:
-    # Импортируем TensorFlow с подавлением вывода
-    import os
-    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
-    
-    import pandas as pd
-    import numpy as np
-    import pickle
-    from tensorflow.keras.models import load_model
-    from sklearn.preprocessing import MinMaxScaler
-    
-    # Перенаправляем stderr TensorFlow в /dev/null (или nul на Windows)
-    import warnings
-    warnings.filterwarnings('ignore')
-except ImportError as e:
-    print(json.dumps({'error': f'Ошибка импорта модулей: {str(e)}'}))
-    sys.exit(1)
-
-try:
-    # Подавляем вывод TensorFlow при загрузке модели
-    import warnings
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore")
-        # Загружаем модель без компиляции (чтобы избежать ошибок совместимости версий)
-        # compile=False позволяет загрузить модель без перекомпиляции метрик
-        try:
-            model = load_model(model_path, compile=False)
-        except Exception as e:
-            # Если не удалось загрузить без компиляции, пробуем с компиляцией
-            try:
-                model = load_model(model_path, compile=True)
-            except Exception as e2:
-                # Улучшенное сообщение об ошибке
-                error_msg = str(e2)
-                if 'deserialize' in error_msg or 'KerasSaveable' in error_msg:
-                    error_msg = "Ошибка совместимости версий TensorFlow. Модель была сохранена с другой версией. Попробуйте переобучить модель."
-                print(json.dumps({
-                    'error': f'Ошибка при загрузке модели: {error_msg}'
-                }))
-                sys.exit(1)
-    
-    with open(scaler_path, 'rb') as f:
-        scaler = pickle.load(f)
-    
-    # Пробуем использовать снимок данных, если доступен и опция включена
-    # ВАЖНО: Проверяем снимок ДО загрузки CSV, чтобы использовать его если доступен
-    data_snapshot = None
-    snapshot_available = os.path.exists(data_snapshot_path)
-    
-    # Выводим информацию о доступности снимка (это будет видно в JSON ответе, так как идет в stdout перед основным JSON)
-    print(json.dumps({
-        'debug': {
-            'snapshot_requested': use_snapshot,
-            'snapshot_exists': snapshot_available,
-            'snapshot_path': data_snapshot_path
-        }
-    }), file=sys.stderr)
-    
-    if use_snapshot and snapshot_available:
-        try:
-            with open(data_snapshot_path, 'rb') as f:
-                data_snapshot = pickle.load(f)
-            print(json.dumps({'info': f'Используется снимок данных от {data_snapshot.get("timestamp", "unknown")}'}), file=sys.stderr)
-        except Exception as e:
-            print(json.dumps({'warning': f'Не удалось загрузить снимок данных: {str(e)}. Используется CSV.'}), file=sys.stderr)
-            data_snapshot = None
-    elif use_snapshot and not snapshot_available:
-        print(json.dumps({'warning': f'Снимок данных не найден по пути: {data_snapshot_path}. Используется CSV.'}), file=sys.stderr)
-    
-    if data_snapshot:
-        # Используем сохраненный снимок данных
-        # ВАЖНО: Используем именно те данные, которые были при обучении
-        df = data_snapshot['df'].copy()
-        X_pat = data_snapshot['X_pat']
-        last_sequence = data_snapshot['last_sequence'].copy()  # Явно копируем для безопасности
-        last_date_raw = data_snapshot['last_date']
-        # Преобразуем дату в строку, если это Timestamp или другой объект
-        if hasattr(last_date_raw, 'strftime'):
-            # Это datetime или Timestamp объект
-            try:
-                last_date_str = last_date_raw.strftime('%Y-%m-%d %H:%M:%S')
-            except:
-                last_date_str = str(last_date_raw)
-        elif hasattr(last_date_raw, 'to_pydatetime'):
-            # Это pandas Timestamp
-            try:
-                last_date_str = last_date_raw.to_pydatetime().strftime('%Y-%m-%d %H:%M:%S')
-            except:
-                last_date_str = str(last_date_raw)
-        else:
-            last_date_str = str(last_date_raw)
-        
-        current_price = data_snapshot['last_price']
-        lookback = data_snapshot['lookback']
-        forecast_days = data_snapshot['forecast_days']
-        
-        # Проверяем, что last_sequence соответствует X_pat[-1]
-        # Это должно быть одинаково, но проверка не помешает
-        if not np.array_equal(last_sequence, X_pat[-1]):
-            print(json.dumps({'warning': 'last_sequence из снимка не соответствует X_pat[-1]. Используется last_sequence из снимка.'}), file=sys.stderr)
-        
-        # Выводим детальную информацию о снимке в stdout (чтобы было видно в JSON)
-        snapshot_info = {
-            'snapshot_used': True,
-            'snapshot_timestamp': str(data_snapshot.get('timestamp')) if data_snapshot.get('timestamp') else None,
-            'records_count': len(df),
-            'last_date': str(last_date_str),
-            'last_price': float(current_price),
-            'last_sequence_shape': list(last_sequence.shape),
-            'lookback': int(lookback),
-            'forecast_days': int(forecast_days)
-        }
-        print(json.dumps({'debug_info': snapshot_info}), file=sys.stderr)
-        
-        print(json.dumps({'info': f'Снимок данных: {len(df)} записей, последняя дата: {last_date_str}, последняя цена: {current_price:.2f}, размер last_sequence: {last_sequence.shape}'}), file=sys.stderr)
-    else:
-        # Загружаем данные из CSV (как раньше)
-        csv_path = os.path.join(csv_dir, f'{ticker}.csv')
-        if not os.path.exists(csv_path):
-            print(json.dumps({'error': f'CSV файл не найден: {csv_path}'}))
-            sys.exit(1)
-        
-        df = pd.read_csv(csv_path)
-    
-        # Убеждаемся, что колонки правильные
-        df.columns = [col.strip() for col in df.columns]
-        if 'time' not in df.columns or 'close' not in df.columns:
-            # Пропускаем заголовок если он есть
-            if len(df) > 0 and str(df.iloc[0, 0]).lower() == 'ticker':
-                df = df.iloc[1:].reset_index(drop=True)
-                df.columns = ['ticker', 'time', 'open', 'high', 'low', 'close', 'volume']
-        
-        # Важно: удаляем прогнозные данные (будущие даты) из CSV
-        # чтобы использовать только реальные исторические данные
-        # Также удаляем прогнозы, которые были добавлены ранее
-        try:
-            df['time_parsed'] = pd.to_datetime(df['time'])
-            now = datetime.now()
-            # Оставляем только данные до текущей даты (реальные исторические данные)
-            # Это гарантирует, что мы используем те же данные, что были доступны при обучении
-            df_historical = df[df['time_parsed'] <= now].copy()
-            
-            # Сортируем по дате и берем только уникальные даты (на случай дубликатов)
-            df_historical = df_historical.sort_values('time_parsed').drop_duplicates(subset='time_parsed', keep='last')
-            df = df_historical.drop('time_parsed', axis=1).reset_index(drop=True)
-        except Exception as e:
-            # Если не удалось распарсить даты, просто продолжаем с исходными данными
-            pass
-        
-        # Важно: убедимся, что данные отсортированы по дате (от старых к новым)
-        try:
-            df['time_sort'] = pd.to_datetime(df['time'])
-            df = df.sort_values('time_sort').drop('time_sort', axis=1).reset_index(drop=True)
-        except:
-            pass
-        
-        # Подготавливаем данные точно так же, как в stock.py/stock.ipynb
-        # Используем функцию prepare_pattern_data для согласованности
-        def prepare_pattern_data_local(df, lookback: int = 60, forecast_days: int = 1, scaler_to_use=None):
-            """Подготовка данных для LSTM - та же логика, что в stock.py"""
-            df_close = df[['close']].dropna().reset_index(drop=True)
-            
-            if len(df_close) < lookback + forecast_days:
-                return None, None
-            
-            # Используем тот же scaler, что был при обучении (уже загружен)
-            scaled = scaler_to_use.transform(df_close.values)
-            
-            X, y = [], []
-            for i in range(lookback, len(scaled) - forecast_days + 1):
-                X.append(scaled[i - lookback:i])
-                y.append(scaled[i + forecast_days - 1, 0])
-            
-            X = np.asarray(X)
-            y = np.asarray(y)
-            
-            return X, y
-        
-        lookback = 60
-        forecast_days = 1
-        
-        # Подготавливаем паттерны (как при обучении), используя загруженный scaler
-        X_pat, y_pat = prepare_pattern_data_local(df, lookback=lookback, forecast_days=forecast_days, scaler_to_use=scaler)
-        
-        if X_pat is None or len(X_pat) == 0:
-            print(json.dumps({'error': f'Недостаточно данных: нужно минимум {lookback + forecast_days} записей для создания паттернов'}))
-            sys.exit(1)
-        
-        # Берем последний паттерн из подготовленных данных (как в stock.ipynb)
-        last_sequence = X_pat[-1]  # shape: (lookback, 1) - уже правильная форма
-        
-        # Получаем последнюю дату и цену
-        last_date_str = df['time'].iloc[-1]
-        current_price = float(df['close'].iloc[-1])
-    
-    # Общая часть для обоих случаев (снимок или CSV)
-    # Генерируем прогнозы на будущие дни (точно так же, как в stock.ipynb)
-    predictions = []
-    current_seq = last_sequence.copy()  # shape: (lookback, 1)
-    
-    # Парсим последнюю дату
-    # ВАЖНО: Преобразуем last_date_str в строку, если это Timestamp или другой объект
-    last_date_str = str(last_date_str)
-    
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Прогноз цены акции по обученной LSTM-модели')
+    parser.add_argument('ticker', nargs='?', help='Тикер, например SBER')
+    parser.add_argument('days', nargs='?', type=int, default=252, help='Горизонт прогноза в днях (по умолчанию 252)')
+    parser.add_argument('source', nargs='?', default='snapshot',
+                        help='snapshot (по умолчанию) - использовать снимок данных, иначе CSV')
+    parser.add_argument('--engine', choices=['keras', 'numpy'], default='keras',
+                        help='Движок инференса: keras (TensorFlow) или numpy (без импорта TensorFlow)')
+    parser.add_argument('--output', choices=['full', 'summary', 'ndjson'], default='full',
+                        help='full - полный JSON (по умолчанию); summary - только итоговые поля и контрольные '
+                             'точки горизонта; ndjson - по одной компактной строке на шаг прогноза по мере расчета')
+    parser.add_argument('--samples', type=int, default=0,
+                        help='Число путей Monte Carlo dropout для полос неопределенности (по умолчанию 0 - выключено)')
+    parser.add_argument('--quantiles', default='5,50,95',
+                        help='Перцентили полос через запятую (по умолчанию 5,50,95)')
+    parser.add_argument('--seed', type=int, default=0, help='Seed случайных путей Monte Carlo (по умолчанию 0)')
+    parser.add_argument('--rollout', choices=['window', 'stateful'], default='window',
+                        help='window - точный прогноз скользящим окном (по умолчанию); stateful - перенос '
+                             'состояний LSTM между шагами, в lookback раз меньше работы на шаг, результат приближенный')
+    parser.add_argument('--recursive', action='store_true',
+                        help='Пошаговый прогноз даже при наличии прямой модели горизонта (stock.py --direct)')
+    parser.add_argument('--model', choices=['ticker', 'global'], default='ticker',
+                        help='ticker - модель тикера (по умолчанию); global - общая модель всех тикеров '
+                             '(python -m ml.global_model), тикеры --tickers считаются одной пачкой')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Не использовать кэш готовых прогнозов')
+    parser.add_argument('--no-store', action='store_true',
+                        help='Не сохранять прогноз в хранилище прогнозов (storage/app/private/forecasts); '
+                             'сохраняется только прогноз на 252 дня без --samples, --rollout stateful и --recursive')
+    parser.add_argument('--store', action='store_true',
+                        help='Для --model global: сохранить прогнозы общей модели в хранилище прогнозов '
+                             'вместо прогнозов моделей тикеров (без флага общая модель в хранилище не пишет)')
+    parser.add_argument('--tickers',
+                        help='Список тикеров через запятую: пакетный прогноз в пуле процессов, '
+                             'по одной JSON-строке на тикер (с --output ndjson - события тикера подряд)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Количество процессов для --tickers (по умолчанию - число ядер)')
+    parser.add_argument('--threads-per-worker', type=int, default=None,
+                        help='Потоков BLAS/TensorFlow на процесс (по умолчанию ядра / процессы)')
+    parser.add_argument('--serve', action='store_true',
+                        help='Запустить долгоживущий HTTP-сервис прогнозирования на loopback-интерфейсе')
+    parser.add_argument('--host', default='127.0.0.1', help='Адрес сервиса (по умолчанию 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='Порт сервиса (по умолчанию 8765)')
+    parser.add_argument('--cache-mb', type=int, default=512,
+                        help='Лимит памяти кэша моделей сервиса в МБ (по умолчанию 512)')
+    parser.add_argument('--metrics-file', default=os.environ.get('FORECAST_METRICS_FILE'),
+                        help='Дописать замеры этапов в файл: *.prom - textfile для node_exporter, '
+                             'иначе JSONL (по умолчанию FORECAST_METRICS_FILE)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    try:
+        import warnings
+        warnings.filterwarnings('ignore')
+
+        from ml.timings import Timings, write_metrics
+        timings = Timings(started=SCRIPT_STARTED)
+        timings.add_interpreter_startup(SCRIPT_STARTED_WALL)
+
+        # NumPy, pandas и TensorFlow импортируются только в compute(): ошибки и попадания
+        # в кэш результатов отвечают без них
+        from ml.result_cache import ResultCache, cached_forecast
+        from ml.results import (check_model_exists, error_payload, forecast_options, parse_quantiles, parse_source,
+                                result_events, summarize_result)
+    except ImportError as e:
+        print(json.dumps({'error': f'Ошибка импорта модулей: {str(e)}'}))
+        return 1
+
+    # Опция использования снимка данных (по умолчанию True - используем снимок если есть)
+    use_snapshot = parse_source(args.source)
+
+    try:
+        quantiles = parse_quantiles(args.quantiles)
+    except ValueError as e:
+        print(json.dumps({'error': str(e)}, ensure_ascii=False))
+        return 1
+    samples = max(0, args.samples)
+    options = forecast_options(samples, quantiles, args.seed, args.rollout, args.recursive)
+
+    if args.serve:
+        from ml.server import serve
+        serve(host=args.host, port=args.port, cache_mb=args.cache_mb, engine=args.engine,
+              use_result_cache=not args.no_cache, metrics_file=args.metrics_file, store=not args.no_store)
+        return 0
+
+    if args.model == 'global':
+        return run_global(args, samples, timings)
+
+    if args.tickers:
+        from ml.batch import run_batch
+        tickers = [t.strip().upper() for t in args.tickers.split(',') if t.strip()]
+        failed = run_batch(tickers, days=args.days, use_snapshot=use_snapshot, engine=args.engine,
+                           workers=args.workers, threads_per_worker=args.threads_per_worker,
+                           use_cache=not args.no_cache, output=args.output, metrics_file=args.metrics_file,
+                           samples=samples, quantiles=quantiles, seed=args.seed, rollout=args.rollout,
+                           recursive=args.recursive, store=not args.no_store)
+        return 1 if failed == len(tickers) else 0
+
+    if not args.ticker:
+        print(json.dumps({'error': 'Не указан тикер'}))
+        return 1
+
+    ticker = args.ticker.upper()
+    cache = None if args.no_cache else ResultCache()
+
+    # stdout - только результат: все, что по ошибке печатается во время расчета, уходит в stderr
+    out = sys.stdout
+    streamed = False
+
+    def emit(event):
+        nonlocal streamed
+        streamed = True
+        out.write(json.dumps(event, ensure_ascii=False) + '\n')
+        out.flush()
+
+    def compute():
+        with timings.stage('import'):
+            from ml.forecast import ModelArtifacts, run_forecast
+        artifacts = ModelArtifacts.load(ticker, with_snapshot=use_snapshot, engine=args.engine, timings=timings,
+                                        with_direct=not args.recursive)
+        return run_forecast(artifacts, days=args.days, use_snapshot=use_snapshot,
+                            on_event=emit if args.output == 'ndjson' else None, timings=timings,
+                            samples=samples, quantiles=quantiles, seed=args.seed, rollout=args.rollout)
+
+    def finish_timings():
+        report = timings.to_dict()
+        if args.metrics_file:
+            error = write_metrics(args.metrics_file, report, 'predict_future', ticker)
+            if error:
+                print(json.dumps({'warning': f'Не удалось записать метрики: {error}'}), file=sys.stderr)
+        return report
+
     try:
-        try:
-            # Пробуем через pandas, но преобразуем в обычный datetime
-            pd_date = pd.to_datetime(last_date_str)
-            # Преобразуем pandas Timestamp в обычный datetime
-            if hasattr(pd_date, 'to_pydatetime'):
-                last_date = pd_date.to_pydatetime()
-            elif hasattr(pd_date, 'to_datetime64'):
-                last_date = pd_date.to_pydatetime()
-            else:
-                last_date = datetime.strptime(str(pd_date), '%Y-%m-%d %H:%M:%S')
-        except:
-            try:
-                last_date = datetime.strptime(last_date_str, '%Y-%m-%d')
-            except:
-                try:
-                    last_date = datetime.strptime(last_date_str, '%Y-%m-%d %H:%M:%S')
-                except:
-                    last_date = datetime.now()
+        with contextlib.redirect_stdout(sys.stderr):
+            check_model_exists(ticker)
+            # При попадании в кэш модель и TensorFlow не загружаются
+            result = cached_forecast(cache, ticker, args.days, use_snapshot, args.engine, compute, options)
+            from ml.forecast_store import is_default_run, store_result
+            if not args.no_store and is_default_run(args.days, samples, args.rollout, args.recursive):
+                # Графики читают прогноз из хранилища, а не из CSV с историей
+                with timings.stage('store'):
+                    store_result(result)
     except Exception as e:
-        print(json.dumps({'error': f'Ошибка парсинга даты: {str(e)}'}), file=sys.stderr)
-        last_date = datetime.now()
-    
-    # current_price уже установлен выше (из снимка или из CSV)
-    future_price = current_price
-    
-    # Подавляем предупреждения при прогнозировании
-    warnings.filterwarnings('ignore')
-
-    first_prediction = None
-    
-    for i in range(days):
-        # Предсказываем следующее значение (формат такой же, как в stock.ipynb)
-        # verbose=0 подавляет вывод прогресса
-        next_scaled = model.predict(current_seq.reshape(1, current_seq.shape[0], current_seq.shape[1]), verbose=0)
-        
-        # Денормализуем в реальную цену
-        next_price = scaler.inverse_transform(next_scaled.reshape(-1, 1))[0, 0]
-        future_price = float(next_price)
-        
-        # Для CSV вычисляем дату (пропускаем выходные для реалистичности)
-        # Но для подсчета дней до 252-го прогноза это не влияет
-        if i == 0:
-            current_date = last_date
-        
-        current_date = current_date + timedelta(days=1)
-        # Если выходной, сдвигаем на следующий рабочий день
-        while current_date.weekday() >= 5:  # 5 = суббота, 6 = воскресенье
-            current_date += timedelta(days=1)
-        
-        # Используем прогнозную цену для всех полей (open, high, low, close)
-        # volume можно оставить 0 или использовать средний объем
-        avg_volume = int(df['volume'].tail(30).mean()) if 'volume' in df.columns else 0
-        
-        predictions.append({
-            'time': current_date.strftime('%Y-%m-%d %H:%M:%S'),
-            'open': float(next_price),
-            'high': float(next_price * 1.02),  # Небольшое отклонение
-            'low': float(next_price * 0.98),
-            'close': float(next_price),
-            'volume': avg_volume
-        })
-        
-        # Обновляем окно паттерна точно так же, как в stock.ipynb
-        # Используем np.vstack как в оригинале
-        new_row = np.array([[next_scaled[0, 0]]])  # shape: (1, 1)
-        current_seq = np.vstack([current_seq[1:], new_row])
-    
-    # Получаем точность модели из снимка данных
-    model_accuracy = None
-    if data_snapshot and 'accuracy' in data_snapshot:
-        model_accuracy = float(data_snapshot['accuracy'])
-    
-    # Возвращаем JSON
-    result = {
-        'ticker': ticker,
-        'current_price': current_price,
-        'predicted_price_252d': future_price,  # Цена через 252 дня (последний прогноз)
-        'change_252d': future_price - current_price,
-        'change_252d_percent': ((future_price / current_price - 1) * 100) if current_price > 0 else 0,
-        'first_prediction': first_prediction,  # Отладочная информация о первом прогнозе
-        'predictions': predictions,
-        'count': len(predictions),
-        'last_historical_date': last_date_str,
-        'first_prediction_date': predictions[0]['time'] if predictions else None,
-        'last_prediction_date': predictions[-1]['time'] if predictions else None,
-        # Важная информация о том, откуда взялись данные
-        'used_snapshot': data_snapshot is not None,  # Информация о том, использовался ли снимок
-        'snapshot_timestamp': str(data_snapshot.get('timestamp')) if (data_snapshot and data_snapshot.get('timestamp')) else None,
-        'data_source': 'snapshot' if data_snapshot is not None else 'csv',  # Откуда взялись данные
-        'model_accuracy': model_accuracy,  # Точность модели в процентах
-        'snapshot_info': {
-            'exists': snapshot_available,
-            'requested': use_snapshot
-        } if data_snapshot is None else None
-    }
-    
-    print(json.dumps(result, ensure_ascii=False, indent=2))
-    
-except Exception as e:
-    print(json.dumps({
-        'error': f'Ошибка при генерации прогнозов: {str(e)}',
-        'traceback': str(e.__class__.__name__)
-    }))
-    import traceback
-    traceback.print_exc()
-    sys.exit(1)
+        payload = {**error_payload(e), 'timings': finish_timings()}
+        if args.output == 'ndjson':
+            emit({'type': 'error', **payload})
+        else:
+            print(json.dumps(payload))
+        if not hasattr(e, 'payload'):
+            import traceback
+            traceback.print_exc()
+        return 1
+
+    if args.output == 'ndjson':
+        # Из кэша шаги не стримились - отдаем их из готового результата
+        events = [{'type': 'summary', **summarize_result(result)}] if streamed else result_events(result)
+        for event in events:
+            if event['type'] == 'summary':
+                event['timings'] = finish_timings()
+            emit(event)
+        return 0
+
+    payload = summarize_result(result) if args.output == 'summary' else result
+    indent = None if args.output == 'summary' else 2
+    # Замер сериализации - по результату без timings, сами timings добавляются следом
+    with timings.stage('serialize'):
+        json.dumps(payload, ensure_ascii=False, indent=indent)
+    print(json.dumps({**payload, 'timings': finish_timings()}, ensure_ascii=False, indent=indent))
+    return 0
+
+
+def run_global(args, samples, timings):
+    """Прогноз общей моделью: по строке JSON на тикер, для одного тикера - обычный вывод."""
+    from ml.global_model import run_global_forecasts
+    from ml.results import result_events, summarize_result
+    from ml.timings import write_metrics
+
+    tickers = [t.strip().upper() for t in (args.tickers or args.ticker or '').split(',') if t.strip()]
+    if not tickers:
+        print(json.dumps({'error': 'Не указан тикер'}))
+        return 1
+    if samples:
+        print(json.dumps({'error': 'Полосы неопределенности (--samples) для общей модели не поддерживаются'},
+                         ensure_ascii=False))
+        return 1
+
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run_global_forecasts(tickers, days=args.days, engine=args.engine, rollout=args.rollout,
+                                       use_cache=not args.no_cache, store=args.store and not args.no_store,
+                                       timings=timings)
+    report = timings.to_dict()
+    if args.metrics_file:
+        error = write_metrics(args.metrics_file, report, 'predict_future', 'global')
+        if error:
+            print(json.dumps({'warning': f'Не удалось записать метрики: {error}'}), file=sys.stderr)
+
+    indent = 2 if args.output == 'full' and not args.tickers else None
+    for result in results:
+        if 'error' in result:
+            events = [{'type': 'error', **result}] if args.output == 'ndjson' else [result]
+        elif args.output == 'ndjson':
+            events = list(result_events(result))
+        else:
+            events = [summarize_result(result) if args.output == 'summary' else result]
+        events[-1] = {**events[-1], 'timings': report}
+        for event in events:
+            print(json.dumps(event, ensure_ascii=False, indent=None if args.output == 'ndjson' else indent))
+    return 1 if all('error' in r for r in results) else 0
+
 
+if __name__ == '__main__':
+    sys.exit(main())
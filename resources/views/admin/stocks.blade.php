@@ -323,6 +323,12 @@ function checkModelStatus(ticker) {
                                 // Перезагружаем страницу для обновления списка
                                 window.location.reload();
                             }, 2000);
+                        } else if (data.training && data.training.state === 'failed') {
+                            clearInterval(checkInterval);
+                            trainingMessage.textContent = `Ошибка обучения модели для тикера ${ticker}. Подробности в логах сервера.`;
+                            resetForm();
+                        } else if (data.training && (data.training.state === 'queued' || data.training.state === 'waiting')) {
+                            trainingMessage.textContent = `Модель для тикера ${ticker} в очереди на обучение...`;
                         } else if (attempts >= maxAttempts) {
                             // Превышено максимальное время ожидания
                             clearInterval(checkInterval);
@@ -65,6 +65,7 @@
                 <th>Ценная бумага</th>
                 <th>Текущая цена</th>
                 <th>Прогноз на год</th>
+                <th>Интервал прогноза</th>
                 <th>Рекомендация</th>
             </tr>
         </thead>
@@ -77,6 +78,13 @@
                     <td>{{ $prediction['ticker'] }}</td>
                     <td>{{ number_format($prediction['current_price'], 2, ',', ' ') }} руб.</td>
                     <td>{{ number_format($price252d, 2, ',', ' ') }} руб.</td>
+                    <td>
+                        @if(isset($prediction['predicted_price_252d_low'], $prediction['predicted_price_252d_high']))
+                            {{ number_format($prediction['predicted_price_252d_low'], 2, ',', ' ') }} - {{ number_format($prediction['predicted_price_252d_high'], 2, ',', ' ') }} руб.
+                        @else
+                            -
+                        @endif
+                    </td>
                     <td class="recommendation-{{ 
                         $prediction['recommendation'] === 'Покупать' ? 'buy' : 
                         ($prediction['recommendation'] === 'Не покупать' ? 'sell' : 'hold') 
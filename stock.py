@@ -1,6 +1,12 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import time
+
+# Отсчет для timings: все, что ниже, включая импорты, попадает в замеры
+SCRIPT_STARTED = time.perf_counter()
+SCRIPT_STARTED_WALL = time.time()
+
 import sys
 import os
 
@@ -25,11 +31,60 @@ if sys.platform == 'win32':
     except (AttributeError, ValueError, OSError):
         pass
 
+if '--retrain-drifted' in sys.argv:
+    # Переобучение только устаревших и дрейфующих моделей в пределах бюджета CPU (ml/drift.py)
+    from ml.drift import main as drift_main
+    sys.exit(drift_main([arg for arg in sys.argv[1:] if arg != '--retrain-drifted']))
+
+if '--tickers' in sys.argv:
+    # Пакетный режим: очередь обучений с ограничением параллелизма (ml/train_batch.py)
+    from ml.train_batch import main as train_batch_main
+    sys.exit(train_batch_main(sys.argv[1:]))
+
 if len(sys.argv) < 2:
-    print("Использование: python stock.py <TICKER>")
+    print("Использование: python stock.py <TICKER> [--incremental] [--batch-size N] [--intra-op-threads N]"
+          " [--inter-op-threads N] [--cache-windows] [--direct [full|checkpoints]]")
+    print("               python stock.py --tickers SBER,GAZP|all [--max-parallel N] [--threads-per-job N] [--force]"
+          " [--incremental] [--direct [full|checkpoints]]")
+    print("               python stock.py --retrain-drifted [--tickers SBER,GAZP|all] [--budget-minutes N] [--dry-run]")
     sys.exit(1)
 
-ticker = sys.argv[1].upper()
+import argparse
+
+arg_parser = argparse.ArgumentParser(description='Обучение LSTM-модели для тикера')
+arg_parser.add_argument('ticker')
+arg_parser.add_argument('--incremental', action='store_true',
+                        help='Дообучить существующую модель на новых свечах вместо обучения с нуля')
+arg_parser.add_argument('--batch-size', type=int, default=None,
+                        help='Размер батча (по умолчанию из подбора python -m ml.sweep или 32)')
+arg_parser.add_argument('--default-hyperparams', action='store_true',
+                        help='Не использовать подобранные гиперпараметры models/hyperparams_<ticker>.json')
+arg_parser.add_argument('--intra-op-threads', type=int, default=None,
+                        help='Потоков TensorFlow внутри операции (по умолчанию TF_NUM_INTRAOP_THREADS или все ядра)')
+arg_parser.add_argument('--inter-op-threads', type=int, default=None,
+                        help='Потоков TensorFlow между операциями (по умолчанию TF_NUM_INTEROP_THREADS или авто)')
+arg_parser.add_argument('--cache-windows', action='store_true',
+                        help='Кэшировать собранные окна после первой эпохи (быстрее, но окна хранятся в памяти)')
+arg_parser.add_argument('--rollout', choices=['window', 'stateful'], default='window',
+                        help='Итоговый прогноз: window - скользящим окном (по умолчанию), stateful - с переносом '
+                             'состояний LSTM (быстрее, результат приближенный)')
+arg_parser.add_argument('--direct', nargs='?', const='full', choices=['full', 'checkpoints'], default=None,
+                        help='Обучить и прямую модель горизонта (ml/direct.py): весь прогноз за один проход; '
+                             'full - выход на каждый из 252 дней (по умолчанию), checkpoints - на 1/5/21/63/126/252 '
+                             'с интерполяцией между ними. Обучается с нуля и при --incremental')
+arg_parser.add_argument('--metrics-file', default=os.environ.get('FORECAST_METRICS_FILE'),
+                        help='Дописать замеры этапов в файл: *.prom - textfile для node_exporter, иначе JSONL '
+                             '(по умолчанию FORECAST_METRICS_FILE)')
+cli_args = arg_parser.parse_args()
+
+# Замеры этапов (ml/timings.py): попадают в header.json снимка и в --metrics-file
+from ml.timings import Timings, write_metrics
+
+timings = Timings(started=SCRIPT_STARTED)
+timings.add_interpreter_startup(SCRIPT_STARTED_WALL)
+
+ticker = cli_args.ticker.upper()
+incremental = cli_args.incremental
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
 csv_dir = os.path.join(script_dir, 'storage', 'app', 'private', 'securities')
@@ -37,6 +92,14 @@ csv_dir = csv_dir.replace('\\', '/')
 models_dir = os.path.join(script_dir, 'models')
 models_dir = models_dir.replace('\\', '/')
 
+# Без CSV обучать нечего: выходим до импорта pandas и TensorFlow
+csv_path = os.path.join(csv_dir, f"{ticker}.csv")
+if not os.path.exists(csv_path):
+    print(f"Файл {csv_path} не найден!")
+    print(f"Не удалось загрузить данные для тикера {ticker}")
+    sys.exit(1)
+
+imports_started = time.perf_counter()
 missing_modules = []
 
 try:
@@ -51,18 +114,14 @@ except ImportError:
 
 try:
     from sklearn.preprocessing import MinMaxScaler
-    from sklearn.model_selection import train_test_split
     from sklearn.metrics import mean_squared_error, mean_absolute_error
 except ImportError:
     missing_modules.append('scikit-learn')
 
-try:
-    import tensorflow as tf
-    from tensorflow.keras.models import Sequential
-    from tensorflow.keras.layers import LSTM, Dense, Dropout
-    from tensorflow.keras.callbacks import EarlyStopping
-    print("TensorFlow версия:", tf.__version__)
-except ImportError:
+# TensorFlow только проверяется: сам импорт занимает секунды и нужен лишь после
+# загрузки данных и проверки, что для --incremental есть новые свечи
+import importlib.util
+if importlib.util.find_spec('tensorflow') is None:
     missing_modules.append('tensorflow')
 
 if missing_modules:
@@ -76,7 +135,6 @@ if missing_modules:
     print(f"  {sys.executable} -m pip install pandas numpy scikit-learn tensorflow")
     sys.exit(1)
 
-from datetime import datetime
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -84,6 +142,7 @@ pd.set_option('display.max_columns', None)
 pd.set_option('display.width', None)
 
 print("Все библиотеки успешно импортированы!")
+timings.add('import', time.perf_counter() - imports_started)
 
 def load_ticker_data(ticker, csv_directory=csv_dir):
     file_path = os.path.join(csv_directory, f"{ticker.upper()}.csv")
@@ -93,43 +152,11 @@ def load_ticker_data(ticker, csv_directory=csv_dir):
         return None
     
     try:
-        df = pd.read_csv(file_path)
-        
-        expected_columns = ['ticker', 'time', 'open', 'high', 'low', 'close', 'volume']
-        
-        df.columns = [col.strip() for col in df.columns]
-        current_columns_lower = [col.lower() for col in df.columns]
-        expected_columns_lower = [col.lower() for col in expected_columns]
-        
-        if set(current_columns_lower) == set(expected_columns_lower):
-            column_mapping = {}
-            for expected_col in expected_columns:
-                for current_col in df.columns:
-                    if current_col.lower() == expected_col.lower():
-                        column_mapping[current_col] = expected_col
-                        break
-            
-            df = df.rename(columns=column_mapping)
-            df = df[expected_columns]
-        else:
-            if len(df.columns) == len(expected_columns):
-                if len(df) > 0:
-                    first_row_str = [str(val).strip().lower() for val in df.iloc[0].values]
-                    if first_row_str == expected_columns_lower:
-                        df = df.iloc[1:].reset_index(drop=True)
-                        df.columns = expected_columns
-        
-        df['time'] = pd.to_datetime(df['time'], errors='coerce')
-        
-        df = df.dropna(subset=['time'])
-        
-        numeric_columns = ['open', 'high', 'low', 'close', 'volume']
-        for col in numeric_columns:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-        
-        df = df.dropna(subset=numeric_columns)
-        
-        df = df.sort_values('time').reset_index(drop=True)
+        # Ряд из бинарного хранилища (ml/price_store.py): отсортирован, без дублей и
+        # неразборчивых строк; из CSV разбираются только строки, добавленные с прошлого раза.
+        # Строки с будущими датами (прогнозные) отброшены - так же ряд читают прогноз и ml/drift.py
+        from ml.price_store import load_history
+        df = load_history(ticker, csv_directory).to_dataframe()
         
         print(f"Загружено {len(df)} записей для тикера {ticker}")
         return df
@@ -140,17 +167,17 @@ def load_ticker_data(ticker, csv_directory=csv_dir):
         traceback.print_exc()
         return None
 
-df = load_ticker_data(ticker)
+with timings.stage('csv_parse'):
+    df = load_ticker_data(ticker)
 
 if df is None or len(df) == 0:
     print(f"Не удалось загрузить данные для тикера {ticker}")
     sys.exit(1)
 
-from sklearn.preprocessing import MinMaxScaler
-import numpy as np
-import os
 import pickle
 
+from ml.windowing import make_windows
+
 
 def prepare_pattern_data(df, lookback: int = 60, forecast_days: int = 1):
     df_close = df[['close']].dropna().reset_index(drop=True)
@@ -162,68 +189,135 @@ def prepare_pattern_data(df, lookback: int = 60, forecast_days: int = 1):
     scaler = MinMaxScaler(feature_range=(0, 1))
     scaled = scaler.fit_transform(df_close.values)
 
-    X, y = [], []
-    for i in range(lookback, len(scaled) - forecast_days + 1):
-        X.append(scaled[i - lookback:i])
-        y.append(scaled[i + forecast_days - 1, 0])
-
-    X = np.asarray(X)
-    y = np.asarray(y)
+    X, y = make_windows(scaled, lookback=lookback, forecast_days=forecast_days)
 
     print(f"Создано {len(X)} паттернов, форма X: {X.shape}, форма y: {y.shape}")
     return X, y, scaler
 
 
-lookback = 60
+# Гиперпараметры: подобранные python -m ml.sweep (models/hyperparams_<ticker>.json) или по умолчанию
+from ml.hyperparams import DEFAULTS as DEFAULT_HYPERPARAMS, load_hyperparams
+hyperparams = dict(DEFAULT_HYPERPARAMS) if cli_args.default_hyperparams else load_hyperparams(ticker)
+if cli_args.batch_size:
+    hyperparams['batch_size'] = cli_args.batch_size
+print("Гиперпараметры: " + ", ".join(f"{k}={v}" for k, v in hyperparams.items()))
+
+lookback = hyperparams['lookback']
 forecast_days = 1
 
-X_pat, y_pat, scaler_pat = prepare_pattern_data(df, lookback=lookback, forecast_days=forecast_days)
+model_pat = None
+training_mode = 'full'
 
-if X_pat is None:
-    print("Не удалось подготовить данные для обучения")
-    sys.exit(1)
+if incremental:
+    from ml.incremental import FullRetrainRequired, new_records_count, warm_start
+
+    if new_records_count(ticker, df) == 0:
+        print(f"Новых данных для {ticker} нет, модель актуальна")
+        sys.exit(0)
+
+with timings.stage('import'):
+    import tensorflow as tf
+    print("TensorFlow версия:", tf.__version__)
+    # Пулы потоков: из аргументов или из лимитов пакетного режима (stock.py --tickers)
+    from ml.tf_pipeline import configure_threads
+    configure_threads(cli_args.intra_op_threads or os.environ.get('TF_NUM_INTRAOP_THREADS'),
+                      cli_args.inter_op_threads or os.environ.get('TF_NUM_INTEROP_THREADS'))
+
+if incremental:
+    try:
+        with timings.stage('warm_start'):
+            warm = warm_start(ticker, df, lookback=lookback, forecast_days=forecast_days,
+                              batch_size=hyperparams['batch_size'])
+    except FullRetrainRequired as e:
+        print(f"Дообучение невозможно: {str(e)}. Выполняется полное обучение.")
+        warm = False
+
+    if warm is None:
+        print(f"Новых данных для {ticker} нет, модель актуальна")
+        sys.exit(0)
+
+    if warm:
+        model_pat = warm['model']
+        scaler_pat = warm['scaler']
+        X_pat, y_pat = warm['X'], warm['y']
+        training_mode = 'incremental'
+        print(f"Модель дообучена на {warm['new_records']} новых записях")
+
+if model_pat is None:
+    with timings.stage('windows'):
+        X_pat, y_pat, scaler_pat = prepare_pattern_data(df, lookback=lookback, forecast_days=forecast_days)
+
+    if X_pat is None:
+        print("Не удалось подготовить данные для обучения")
+        sys.exit(1)
 
 train_size = int(len(X_pat) * 0.8)
-X_train_pat, X_test_pat = X_pat[:train_size], X_pat[train_size:]
-y_train_pat, y_test_pat = y_pat[:train_size], y_pat[train_size:]
+if training_mode == 'incremental':
+    # Дообучение видело окна новых свечей: тестовая выборка - только отложенные им окна
+    test_idx = warm['eval_idx']
+    train_idx = np.setdiff1d(np.arange(len(X_pat)), test_idx)
+    X_train_pat, X_test_pat = X_pat[train_idx], X_pat[test_idx]
+    y_train_pat, y_test_pat = y_pat[train_idx], y_pat[test_idx]
+else:
+    X_train_pat, X_test_pat = X_pat[:train_size], X_pat[train_size:]
+    y_train_pat, y_test_pat = y_pat[:train_size], y_pat[train_size:]
 
 print(f"Обучающая выборка: {len(X_train_pat)} примеров")
 print(f"Тестовая выборка: {len(X_test_pat)} примеров")
 
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import LSTM, Dense, Dropout
-from tensorflow.keras.callbacks import EarlyStopping
-
-model_pat = Sequential([
-    LSTM(32, return_sequences=True, input_shape=(lookback, 1)),
-    Dropout(0.3),
-    LSTM(32, return_sequences=True),
-    Dropout(0.3),
-    LSTM(32),
-    Dropout(0.3),
-    Dense(1),
-])
-
-model_pat.compile(optimizer='adam', loss='mse', metrics=['mae'])
-
-print("Начало обучения модели...")
-early_stopping_pat = EarlyStopping(
-    monitor='val_loss',
-    patience=10,
-    restore_best_weights=True
-)
-
-history_pat = model_pat.fit(
-    X_train_pat, y_train_pat,
-    batch_size=32,
-    epochs=80,
-    validation_split=0.2,
-    callbacks=[early_stopping_pat],
-    verbose=1
-)
-
-train_pred_pat = model_pat.predict(X_train_pat)
-test_pred_pat = model_pat.predict(X_test_pat)
+# Обучение и оценка идут через tf.data: окна собираются батчами из нормализованного ряда
+# float32, тензор всех окон (в lookback раз больше ряда) в памяти не строится
+from ml.tf_pipeline import ThroughputLogger, window_dataset
+
+series_pat = scaler_pat.transform(df[['close']].dropna().values).astype(np.float32).ravel()
+batch_size = hyperparams['batch_size']
+
+
+def pattern_dataset(start, end, shuffle=False):
+    return window_dataset(series_pat, start, end, lookback=lookback, forecast_days=forecast_days,
+                          batch_size=batch_size, shuffle=shuffle, cache=cli_args.cache_windows)
+
+
+if model_pat is None:
+    from tensorflow.keras.callbacks import EarlyStopping
+    from ml.model_factory import build_pattern_model
+
+    # lstm_layers x (LSTM units + Dropout) + Dense 1, см. ml/model_factory.py
+    model_pat = build_pattern_model(lookback=lookback, units=hyperparams['units'],
+                                    lstm_layers=hyperparams['lstm_layers'], dropout=hyperparams['dropout'])
+
+    model_pat.compile(optimizer='adam', loss='mse', metrics=['mae'])
+
+    print("Начало обучения модели...")
+    early_stopping_pat = EarlyStopping(
+        monitor='val_loss',
+        patience=10,
+        restore_best_weights=True
+    )
+
+    # Последние 20% обучающих окон - валидация, как раньше делал validation_split=0.2
+    fit_size = int(train_size * 0.8)
+    throughput_pat = ThroughputLogger(samples_per_epoch=fit_size)
+
+    with timings.stage('train'):
+        history_pat = model_pat.fit(
+            pattern_dataset(0, fit_size, shuffle=True),
+            validation_data=pattern_dataset(fit_size, train_size),
+            epochs=hyperparams['epochs'],
+            callbacks=[early_stopping_pat, throughput_pat],
+            # Одна строка на эпоху: вывод обучения обычно пишется в лог-файл
+            verbose=2
+        )
+    timings.epochs = throughput_pat.epochs
+
+with timings.stage('evaluate'):
+    if training_mode == 'incremental':
+        # Окна дообучения уже в памяти (warm_start), выборки не непрерывны
+        train_pred_pat = model_pat.predict(np.ascontiguousarray(X_train_pat), verbose=0)
+        test_pred_pat = model_pat.predict(np.ascontiguousarray(X_test_pat), verbose=0)
+    else:
+        train_pred_pat = model_pat.predict(pattern_dataset(0, train_size), verbose=0)
+        test_pred_pat = model_pat.predict(pattern_dataset(train_size, len(X_pat)), verbose=0)
 
 train_pred_pat_actual = scaler_pat.inverse_transform(train_pred_pat.reshape(-1, 1))
 test_pred_pat_actual = scaler_pat.inverse_transform(test_pred_pat.reshape(-1, 1))
@@ -253,6 +347,7 @@ if not np.isnan(mape):
 else:
     print(f"MAPE: невозможно вычислить, Точность: {accuracy:.2f}%")
 
+save_started = time.perf_counter()
 os.makedirs(models_dir, exist_ok=True)
 model_path_pat = os.path.join(models_dir, f'lstm_patterns_{ticker.lower()}.h5')
 scaler_path_pat = os.path.join(models_dir, f'scaler_patterns_{ticker.lower()}.pkl')
@@ -263,12 +358,31 @@ except:
     model_pat.save(model_path_pat)
 with open(scaler_path_pat, 'wb') as f:
     pickle.dump(scaler_pat, f)
+# Параметры scaler'а в JSON: predict_future.py применяет их без scikit-learn (ml/scaler.py)
+from ml.scaler import save_sidecar, sidecar_path
+save_sidecar(scaler_pat, sidecar_path(scaler_path_pat))
+
+# Sidecar с весами для NumPy-движка predict_future.py (--engine numpy)
+weights_path_pat = os.path.join(models_dir, f'lstm_patterns_{ticker.lower()}.npz')
+# Итоговый прогноз ниже считается этой же NumPy-копией: 252 вызова Keras predict
+# занимают больше времени, чем само дообучение в режиме --incremental
+forecast_model = model_pat
+from ml.numpy_lstm import NumpyLSTMModel
+try:
+    forecast_model = NumpyLSTMModel.from_keras_model(model_pat)
+    forecast_model.save_npz(weights_path_pat)
+    print(f"Веса для NumPy-движка сохранены: {weights_path_pat}")
+except Exception as e:
+    print(f"Не удалось сохранить веса для NumPy-движка: {str(e)}")
+
+# Снимок версии 2: скаляры в header.json, ряды - float32 .npy (см. ml/snapshot.py).
+# X_pat не сохраняется - прогнозу нужно только последнее окно
+from ml.snapshot import write_snapshot
 
-data_snapshot_path = os.path.join(models_dir, f'data_snapshot_{ticker.lower()}.pkl')
-data_snapshot = {
-    'df': df.copy(),
-    'X_pat': X_pat,
-    'last_sequence': X_pat[-1],
+timings.add('save', time.perf_counter() - save_started)
+data_snapshot_path = os.path.join(models_dir, f'data_snapshot_{ticker.lower()}')
+legacy_snapshot_path = os.path.join(models_dir, f'data_snapshot_{ticker.lower()}.pkl')
+snapshot_meta = {
     'last_date': str(df['time'].iloc[-1]),
     'last_price': float(df['close'].iloc[-1]),
     'lookback': lookback,
@@ -276,11 +390,18 @@ data_snapshot = {
     'timestamp': pd.Timestamp.now().isoformat(),
     'accuracy': float(accuracy),
     'mape': float(mape) if (mape is not None and not np.isnan(mape)) else None,
-    'test_mae': float(test_mae_pat)
+    'test_mae': float(test_mae_pat),
+    'training_mode': training_mode,
+    # При дообучении архитектура остается от прошлого полного обучения
+    'hyperparams': hyperparams if training_mode == 'full' else None,
+    # Этапы обучения до сохранения снимка, включая каждую эпоху
+    'timings': timings.to_dict()
 }
 try:
-    with open(data_snapshot_path, 'wb') as f:
-        pickle.dump(data_snapshot, f)
+    write_snapshot(data_snapshot_path, df, X_pat[-1], snapshot_meta)
+    # Старый pickle устарел относительно нового снимка
+    if os.path.exists(legacy_snapshot_path):
+        os.remove(legacy_snapshot_path)
     print(f"\nМодель сохранена: {model_path_pat}")
     print(f"Scaler сохранен: {scaler_path_pat}")
     print(f"Снимок данных сохранен: {data_snapshot_path}")
@@ -293,6 +414,29 @@ except Exception as e:
     import traceback
     traceback.print_exc()
 
+# Прямая модель горизонта: тот же scaler и ряд, выход - сразу весь горизонт (ml/direct.py).
+# Сохраняется после модели тикера - predict_future.py берет ее, только если она не старше
+direct_model = None
+if cli_args.direct:
+    from ml import paths
+    from ml.direct import DirectModel, horizons_for, save_direct, train_direct
+
+    direct_horizons = horizons_for(cli_args.direct)
+    print(f"\nОбучение прямой модели горизонта ({cli_args.direct}, выходов: {len(direct_horizons)})...")
+    try:
+        with timings.stage('train_direct'):
+            direct_keras, direct_metrics = train_direct(series_pat, scaler_pat, lookback, direct_horizons, hyperparams,
+                                                        cache=cli_args.cache_windows)
+        direct_meta = {'mode': cli_args.direct, 'horizons': direct_horizons, 'lookback': lookback,
+                       'metrics': direct_metrics}
+        save_direct(ticker, direct_keras, direct_meta)
+        direct_model = DirectModel(direct_keras, direct_meta)
+        for h, h_mape in direct_metrics['mape'].items():
+            print(f"  Прямая модель, горизонт {h} д.: MAPE {h_mape:.2f}%")
+        print(f"Прямая модель сохранена: {paths.direct_model_path(ticker)}")
+    except Exception as e:
+        print(f"Прямая модель не обучена: {str(e)}")
+
 print("\n" + "="*60)
 print("ГЕНЕРАЦИЯ ПРОГНОЗА НА 252 ДНЯ ВПЕРЕД")
 print("="*60)
@@ -308,14 +452,42 @@ if df is not None and X_pat is not None:
     print(f"Текущая цена: {current_price:.2f} руб.")
     print(f"Генерация прогноза на {n_days} дней...")
     
-    for day in range(n_days):
-        next_scaled = model_pat.predict(current_seq.reshape(1, current_seq.shape[0], current_seq.shape[1]), verbose=0)
+    # --rollout stateful: окно прогоняется один раз, дальше шаг переносит состояния LSTM
+    stepper = None
+    n_steps = n_days
+    if direct_model is not None:
+        # Прямая модель: весь горизонт одним проходом, без цикла по дням
+        step_started = time.perf_counter()
+        direct_raw = direct_model.forecast(current_seq, n_days)
+        future_price = float(scaler_pat.inverse_transform(direct_raw[-1:].reshape(-1, 1))[0, 0])
+        timings.add('direct', time.perf_counter() - step_started)
+        print(f"Прогноз прямой моделью ({direct_model.mode}) за один проход")
+        n_steps = 0
+    elif cli_args.rollout == 'stateful':
+        if isinstance(forecast_model, NumpyLSTMModel):
+            from ml.numpy_lstm import StatefulRollout
+            stepper = StatefulRollout(forecast_model, current_seq[None])
+        else:
+            print("Режим stateful недоступен без NumPy-копии модели, используется скользящее окно")
+
+    for day in range(n_steps):
+        step_started = time.perf_counter()
+        if stepper is None:
+            next_scaled = forecast_model.predict(current_seq.reshape(1, current_seq.shape[0], current_seq.shape[1]), verbose=0)
+            # Сдвиг окна на месте, без нового массива на каждом шаге
+            current_seq[:-1] = current_seq[1:]
+            current_seq[-1, 0] = next_scaled[0, 0]
+        elif day == 0:
+            next_scaled = stepper.output
+        else:
+            next_scaled = stepper.step(next_scaled)
         
         next_price = scaler_pat.inverse_transform(next_scaled.reshape(-1, 1))[0, 0]
         future_price = float(next_price)
         
-        new_row = np.array([[next_scaled[0, 0]]])
-        current_seq = np.vstack([current_seq[1:], new_row])
+        step_seconds = time.perf_counter() - step_started
+        timings.step(step_seconds)
+        timings.add('rollout', step_seconds)
         
         if (day + 1) % 50 == 0:
             print(f"  Прогресс: {day + 1}/{n_days} дней, текущий прогноз: {future_price:.2f} руб.")
@@ -329,3 +501,11 @@ if df is not None and X_pat is not None:
 else:
     print("Не удалось сгенерировать прогноз: отсутствуют необходимые данные")
 
+import json
+
+timings_report = timings.to_dict()
+print("TIMINGS " + json.dumps(timings_report, ensure_ascii=False))
+if cli_args.metrics_file:
+    metrics_error = write_metrics(cli_args.metrics_file, timings_report, 'stock', ticker)
+    if metrics_error:
+        print(f"Не удалось записать метрики: {metrics_error}")
@@ -4,6 +4,7 @@
 
 use App\Services\PredictionService;
 use Illuminate\Support\Collection;
+use Illuminate\Support\Facades\Http;
 use Tests\TestCase;
 
 class PredictionServiceTest extends TestCase
@@ -16,4 +17,78 @@ public function test_get_predictions_returns_empty_array_for_empty_collection():
 
         $this->assertSame([], $result);
     }
+
+    public function test_get_predictions_uses_forecast_daemon_when_configured(): void
+    {
+        config(['services.forecast_daemon.url' => 'http://127.0.0.1:8765']);
+
+        Http::fake([
+            '127.0.0.1:8765/forecast*' => Http::response([
+                'ticker' => 'SBER',
+                'current_price' => 100.0,
+                'predicted_price_252d' => 120.0,
+                'first_prediction' => 101.0,
+                'checkpoints' => [
+                    ['day' => 1, 'time' => '2025-01-02 00:00:00', 'close' => 101.0],
+                    ['day' => 2, 'time' => '2025-01-03 00:00:00', 'close' => 120.0],
+                ],
+                'model_accuracy' => 95.5,
+                'data_source' => 'snapshot',
+                'used_snapshot' => true,
+            ], 200),
+        ]);
+
+        $service = new PredictionService;
+
+        $result = $service->getPredictions('SBER', collect([
+            ['time' => '2025-01-01 00:00:00', 'close' => 100.0],
+        ]));
+
+        $this->assertSame(101.0, $result[0]['predicted_price_1d']);
+        $this->assertSame(120.0, $result[0]['predicted_price_252d']);
+        $this->assertSame('Покупать', $result[0]['recommendation']);
+        $this->assertSame('snapshot', $result[0]['data_source']);
+
+        Http::assertSent(function ($request) {
+            return str_contains($request->url(), 'ticker=SBER')
+                && str_contains($request->url(), 'output=summary');
+        });
+    }
+
+    public function test_get_predictions_returns_monte_carlo_band_from_last_checkpoint(): void
+    {
+        config([
+            'services.forecast_daemon.url' => 'http://127.0.0.1:8765',
+            'services.forecast_uncertainty.samples' => 200,
+        ]);
+
+        Http::fake([
+            '127.0.0.1:8765/forecast*' => Http::response([
+                'ticker' => 'SBER',
+                'current_price' => 100.0,
+                'predicted_price_252d' => 110.0,
+                'first_prediction' => 101.0,
+                'checkpoints' => [
+                    ['day' => 1, 'time' => '2025-01-02 00:00:00', 'close' => 101.0,
+                        'bands' => ['p5' => 99.0, 'p50' => 101.0, 'p95' => 103.0]],
+                    ['day' => 252, 'time' => '2025-12-30 00:00:00', 'close' => 110.0,
+                        'bands' => ['p5' => 90.0, 'p50' => 109.0, 'p95' => 130.0]],
+                ],
+                'data_source' => 'snapshot',
+            ], 200),
+        ]);
+
+        $service = new PredictionService;
+
+        $result = $service->getPredictions('SBER', collect([
+            ['time' => '2025-01-01 00:00:00', 'close' => 100.0],
+        ]));
+
+        $this->assertSame(90.0, $result[0]['predicted_price_252d_low']);
+        $this->assertSame(130.0, $result[0]['predicted_price_252d_high']);
+
+        Http::assertSent(function ($request) {
+            return str_contains($request->url(), 'samples=200');
+        });
+    }
 }
@@ -3,6 +3,7 @@
 namespace Tests\Unit;
 
 use App\Services\SecurityCsvService;
+use Illuminate\Support\Carbon;
 use Illuminate\Support\Facades\Storage;
 use Tests\TestCase;
 
@@ -28,4 +29,29 @@ public function test_get_last_date_returns_null_when_no_file_or_no_data(): void
             'Для файла без данных также должна возвращаться null.'
         );
     }
+
+    public function test_forecast_rows_later_than_now_are_not_history(): void
+    {
+        config(['filesystems.default' => 'local']);
+        Storage::fake('local');
+        Carbon::setTestNow('2024-01-15 12:00:00');
+
+        Storage::disk('local')->put('securities/SBER.csv', implode("\n", [
+            'ticker,time,open,high,low,close,volume',
+            'SBER,"2024-01-10 00:00:00",100,101,99,100.5,10',
+            'SBER,"2024-01-11 00:00:00",101,102,100,101.5,10',
+            'SBER,"2024-01-20 00:00:00",0,0,0,105,0',
+            'SBER,"2024-01-21 00:00:00",0,0,0,106,0',
+        ])."\n");
+
+        $service = new SecurityCsvService;
+
+        $this->assertSame(
+            ['2024-01-10 00:00:00', '2024-01-11 00:00:00'],
+            $service->getAllData('SBER')->pluck('time')->all()
+        );
+        $this->assertSame('2024-01-11', $service->getLastDate('SBER')->toDateString());
+
+        Carbon::setTestNow();
+    }
 }
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Пакет ml/ лежит в корне репозитория рядом со stock.py и predict_future.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
@@ -0,0 +1,32 @@
+import numpy as np
+from sklearn.preprocessing import MinMaxScaler
+
+from benchmarks.forecast_bench import random_numpy_model, synthetic_prices
+from ml.backtest import run_backtest
+from ml.forecast import ModelArtifacts
+
+
+def test_batched_anchors_match_one_rollout_per_anchor():
+    df = synthetic_prices(200)
+    scaler = MinMaxScaler().fit(df[['close']].values)
+    model = random_numpy_model(seed=2)
+    artifacts = ModelArtifacts('BTTEST', model, scaler, None, 'numpy')
+
+    report = run_backtest(artifacts, df, horizons=(1, 5), start=df['time'].iloc[150], step=10)
+
+    anchors = [150, 160, 170, 180, 190]
+    assert report['anchors'] == len(anchors)
+    assert report['horizons']['5']['count'] == 5
+
+    # Тот же прогноз по одной точке за раз, как predict_future.py
+    scaled = scaler.transform(df[['close']].values).astype(np.float32)
+    errors = []
+    for anchor in anchors:
+        seq = scaled[anchor - 59:anchor + 1].copy()
+        for _ in range(5):
+            next_scaled = model.predict(seq[None])
+            seq = np.vstack([seq[1:], next_scaled])
+        predicted = scaler.inverse_transform(next_scaled)[0, 0]
+        errors.append(abs(predicted - df['close'].iloc[anchor + 5]))
+
+    np.testing.assert_allclose(report['horizons']['5']['mae'], np.mean(errors), rtol=1e-5)
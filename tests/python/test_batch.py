@@ -0,0 +1,117 @@
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ml import batch
+
+
+def _lines(capsys):
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_missing_models_give_one_error_line_each_and_parent_env_is_untouched(capsys, monkeypatch):
+    monkeypatch.delenv('OMP_NUM_THREADS', raising=False)
+    monkeypatch.setenv('OPENBLAS_NUM_THREADS', '7')
+
+    failed = batch.run_batch(['NOSUCH1', 'NOSUCH2', 'NOSUCH3'], engine='numpy', workers=2, threads_per_worker=1,
+                             use_cache=False, store=False)
+
+    lines = _lines(capsys)
+    assert failed == 3
+    assert sorted(line['ticker'] for line in lines) == ['NOSUCH1', 'NOSUCH2', 'NOSUCH3']
+    assert all(line['error'] and 'timings' in line for line in lines)
+    assert 'OMP_NUM_THREADS' not in os.environ
+    assert os.environ['OPENBLAS_NUM_THREADS'] == '7'
+
+
+def test_worker_crash_does_not_stop_the_batch(capsys, monkeypatch):
+    def pool(max_workers, mp_context, initializer, initargs):
+        return ThreadPoolExecutor(max_workers=max_workers)
+
+    def forecast(ticker, *args):
+        if ticker == 'BAD':
+            raise RuntimeError('boom')
+        return {'ticker': ticker, 'forecast': [1.0]}
+
+    monkeypatch.setattr(batch, 'ProcessPoolExecutor', pool)
+    monkeypatch.setattr(batch, '_forecast_ticker', forecast)
+
+    failed = batch.run_batch(['AAA', 'BAD', 'BBB'], workers=1, threads_per_worker=1)
+
+    lines = {line['ticker']: line for line in _lines(capsys)}
+    assert failed == 1
+    assert set(lines) == {'AAA', 'BAD', 'BBB'}
+    assert lines['BAD']['error'] == 'Ошибка воркера: boom'
+    assert 'error' not in lines['AAA'] and 'error' not in lines['BBB']
+
+
+@pytest.mark.parametrize('failed, code', [(0, 0), (1, 0), (2, 1)])
+def test_exit_code_is_an_error_only_when_every_ticker_failed(monkeypatch, failed, code):
+    import predict_future
+
+    monkeypatch.setattr(batch, 'run_batch', lambda tickers, **kwargs: failed)
+    monkeypatch.setattr(sys, 'argv', ['predict_future.py', '--tickers', 'AAA,BBB', '--engine', 'numpy'])
+
+    assert predict_future.main() == code
+
+
+def test_ndjson_output_gives_each_ticker_events_in_a_row(capsys, monkeypatch):
+    def pool(max_workers, mp_context, initializer, initargs):
+        return ThreadPoolExecutor(max_workers=max_workers)
+
+    def forecast(ticker, days, use_snapshot, engine, use_cache, output, *args):
+        assert output == 'ndjson'
+        if ticker == 'BAD':
+            return {'ticker': ticker, 'error': 'нет модели', 'timings': {}}
+        predictions = [{'time': f'2024-09-0{d} 00:00:00', 'close': 100.0 + d} for d in range(1, 3)]
+        return {'ticker': ticker, 'current_price': 100.0, 'predictions': predictions, 'timings': {'total_ms': 1}}
+
+    monkeypatch.setattr(batch, 'ProcessPoolExecutor', pool)
+    monkeypatch.setattr(batch, '_forecast_ticker', forecast)
+
+    failed = batch.run_batch(['AAA', 'BAD'], workers=1, threads_per_worker=1, output='ndjson')
+
+    lines = _lines(capsys)
+    assert failed == 1
+    assert [(line['type'], line.get('ticker')) for line in lines] == [
+        ('meta', 'AAA'), ('prediction', None), ('prediction', None), ('summary', 'AAA'), ('error', 'BAD')]
+    assert [line['step'] for line in lines[1:3]] == [1, 2]
+    assert lines[3]['timings'] == {'total_ms': 1} and 'timings' not in lines[0]
+
+
+def test_recursive_skips_direct_model_and_gets_its_own_cache_key(monkeypatch):
+    import ml.forecast
+    import ml.result_cache
+    import ml.results
+
+    loads, options = [], []
+    monkeypatch.setattr(ml.results, 'check_model_exists', lambda ticker: None)
+    monkeypatch.setattr(ml.forecast.ModelArtifacts, 'load',
+                        classmethod(lambda cls, ticker, **kwargs: loads.append(kwargs['with_direct'])))
+    monkeypatch.setattr(ml.forecast, 'run_forecast', lambda artifacts, **kwargs: {'ticker': 'SBER'})
+
+    def cached_forecast(cache, ticker, days, use_snapshot, engine, compute, forecast_options=None):
+        options.append(forecast_options)
+        return compute()
+
+    monkeypatch.setattr(ml.result_cache, 'cached_forecast', cached_forecast)
+
+    for recursive in (False, True):
+        result = batch._forecast_ticker('SBER', 252, True, 'numpy', False, store=False, recursive=recursive)
+        assert 'error' not in result
+    assert loads == [True, False]
+    assert options == [None, {'forecast_mode': 'recursive'}]
+
+
+def test_cli_passes_recursive_and_output_to_the_batch(monkeypatch):
+    import predict_future
+
+    calls = []
+    monkeypatch.setattr(batch, 'run_batch', lambda tickers, **kwargs: calls.append(kwargs) or 0)
+    monkeypatch.setattr(sys, 'argv', ['predict_future.py', '--tickers', 'AAA,BBB', '--recursive', '--output', 'ndjson'])
+
+    assert predict_future.main() == 0
+    assert calls[0]['recursive'] is True and calls[0]['output'] == 'ndjson'
@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+from sklearn.preprocessing import MinMaxScaler
+
+from benchmarks.forecast_bench import random_numpy_model
+from ml.direct import DirectModel, expand_horizons, horizons_for
+from ml.forecast import ModelArtifacts, run_forecast
+from ml.snapshot import Snapshot
+
+LOOKBACK = 60
+
+
+def test_checkpoint_horizons_end_at_requested_days():
+    assert horizons_for('checkpoints') == [1, 5, 21, 63, 126, 252]
+    assert horizons_for('checkpoints', 30) == [1, 5, 21, 30]
+    assert horizons_for('full', 3) == [1, 2, 3]
+
+
+def test_expand_horizons_keeps_full_outputs_and_interpolates_checkpoints():
+    values = np.linspace(0.1, 0.5, 5)
+    np.testing.assert_allclose(expand_horizons(values, [1, 2, 3, 4, 5], 3, 0.0), values[:3], rtol=1e-6)
+
+    # От последнего значения окна 0.0 к 0.4 на 4-м шаге, затем к 1.0 на 6-м
+    np.testing.assert_allclose(expand_horizons([0.4, 1.0], [4, 6], 6, 0.0), [0.1, 0.2, 0.3, 0.4, 0.7, 1.0],
+                               rtol=1e-6)
+
+
+class FixedOutputs:
+    """Модель прямого прогноза с заданными выходами по горизонтам."""
+
+    def __init__(self, values):
+        self.values = np.asarray(values, dtype=np.float32)
+
+    def predict(self, x, verbose=0):
+        return np.repeat(self.values[None], len(x), axis=0)
+
+
+def make_artifacts(horizons, values):
+    scaler = MinMaxScaler().fit(np.array([[50.0], [150.0]]))
+    snapshot = Snapshot({
+        'last_date': '2024-09-06 00:00:00',
+        'last_price': 100.0,
+        'lookback': LOOKBACK,
+        'forecast_days': 1,
+        'records_count': LOOKBACK,
+    }, arrays={'last_sequence': np.full((LOOKBACK, 1), 0.5, np.float32),
+               'volume': np.full(LOOKBACK, 1000, np.float32)})
+    direct = DirectModel(FixedOutputs(values), {'horizons': horizons, 'lookback': LOOKBACK}, 'numpy')
+    return ModelArtifacts('DIRECT', random_numpy_model(seed=2), scaler, snapshot, 'numpy', direct)
+
+
+def _closes(result):
+    return [p['close'] for p in result['predictions']]
+
+
+def test_forecast_uses_direct_model_within_its_horizon():
+    result = run_forecast(make_artifacts([1, 2, 3, 4, 5], [0.6, 0.7, 0.8, 0.9, 1.0]), days=4)
+    assert result['forecast_mode'] == 'direct'
+    np.testing.assert_allclose(_closes(result), [110.0, 120.0, 130.0, 140.0], rtol=1e-5)
+
+    # Между контрольными точками - интерполяция от последней цены окна (100)
+    result = run_forecast(make_artifacts([2, 4], [0.7, 0.9]), days=4)
+    assert result['forecast_mode'] == 'direct_checkpoints'
+    np.testing.assert_allclose(_closes(result), [110.0, 120.0, 130.0, 140.0], rtol=1e-5)
+
+
+@pytest.mark.parametrize('days, options', [
+    (6, {}), (5, {'samples': 8, 'quantiles': (5, 50, 95)}), (5, {'rollout': 'stateful'})])
+def test_forecast_falls_back_to_recursive_when_direct_does_not_apply(days, options):
+    artifacts = make_artifacts([1, 2, 3, 4, 5], [0.6, 0.7, 0.8, 0.9, 1.0])
+    result = run_forecast(artifacts, days=days, **options)
+
+    artifacts.direct = None
+    recursive = run_forecast(artifacts, days=days, **options)
+    assert result['forecast_mode'] == recursive['forecast_mode'] == 'recursive'
+    assert _closes(result) == _closes(recursive)
+
+
+def test_direct_metrics_compare_each_output_with_its_window_target(monkeypatch):
+    pytest.importorskip('tensorflow')
+    import ml.model_factory
+    from ml.direct import train_direct
+
+    class Oracle:
+        """Выдает ровно цели окон из window_dataset: MAPE 0 только при тех же индексах целей в метриках."""
+
+        def compile(self, **kwargs):
+            pass
+
+        def fit(self, *args, **kwargs):
+            return type('History', (), {'history': {'loss': [0.0]}})()
+
+        def predict(self, dataset, verbose=0):
+            return np.concatenate([y.numpy() for _, y in dataset])
+
+    monkeypatch.setattr(ml.model_factory, 'build_pattern_model', lambda **kwargs: Oracle())
+    series = np.random.default_rng(0).uniform(0.1, 1.0, 200).astype(np.float32)
+    horizons = [1, 5, 21, 30]
+    hyperparams = {'batch_size': 16, 'units': 4, 'lstm_layers': 1, 'dropout': 0.0, 'epochs': 1}
+
+    _, metrics = train_direct(series, MinMaxScaler().fit([[0.0], [1.0]]), 12, horizons, hyperparams)
+    assert set(metrics['mape']) == {'1', '5', '21', '30'}
+    assert all(value == pytest.approx(0.0, abs=1e-4) for value in metrics['mape'].values())
+
+
+def test_recursive_flag_skips_direct_model():
+    artifacts = make_artifacts([1, 2, 3, 4, 5], [0.6, 0.7, 0.8, 0.9, 1.0])
+    result = run_forecast(artifacts, days=4, recursive=True)
+
+    artifacts.direct = None
+    assert result['forecast_mode'] == 'recursive'
+    assert _closes(result) == _closes(run_forecast(artifacts, days=4))
@@ -0,0 +1,121 @@
+import pickle
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ml.forecast
+from ml import paths
+from ml.drift import check_ticker, plan, range_breach, recent_mape
+from ml.price_store import load_history
+from ml.scaler import ArrayScaler
+from ml.snapshot import write_snapshot
+
+LOOKBACK = 5
+TRAINED = 100
+
+
+class LastValueModel:
+    """Прогноз на шаг - последнее значение окна."""
+
+    def predict(self, X, verbose=0):
+        return X[:, -1, :]
+
+
+def test_range_breach_counts_prices_outside_scaler_range():
+    assert range_breach([], 10.0, 20.0) == (0, 0.0)
+    assert range_breach([12.0, 19.0], 10.0, 20.0) == (0, 0.0)
+    assert range_breach([21.0, 25.0, 8.0], 10.0, 20.0) == (3, 0.5)
+
+
+def test_recent_mape_uses_one_step_predictions_on_latest_prices():
+    close = np.array([100.0] * 10 + [110.0])
+    scaler = ArrayScaler([90.0], [120.0])
+
+    # Последняя цена 110 прогнозируется как 100, остальные - точно
+    assert np.isclose(recent_mape(LastValueModel(), scaler, close, lookback=5, window=4), 100 / 110 / 4 * 10)
+    assert recent_mape(LastValueModel(), scaler, close[:5], lookback=5) is None
+
+
+def test_plan_orders_by_severity_within_budget():
+    reports = [
+        {'ticker': 'OLD', 'action': 'incremental', 'reasons': ['stale'], 'new_rows': 30, 'cpu_seconds': 100},
+        {'ticker': 'OK', 'action': None, 'reasons': [], 'cpu_seconds': 100},
+        {'ticker': 'ERR', 'action': 'full', 'reasons': ['error'], 'error_ratio': 2.0, 'cpu_seconds': 100},
+        {'ticker': 'JUMP', 'action': 'full', 'reasons': ['range'], 'range': {'excess': 0.3}, 'cpu_seconds': 150},
+    ]
+
+    queued, deferred = plan(reports, budget_seconds=260)
+    assert [r['ticker'] for r in queued] == ['JUMP', 'ERR']
+    assert [r['ticker'] for r in deferred] == ['OLD']
+    # Первый тикер в очереди - даже сверх бюджета
+    assert [r['ticker'] for r in plan(reports, budget_seconds=10)[0]] == ['JUMP']
+
+
+def _write_csv(times, close):
+    pd.DataFrame({'ticker': 'ZZZ', 'time': pd.DatetimeIndex(times).strftime('%Y-%m-%d %H:%M:%S'), 'open': close,
+                  'high': close, 'low': close, 'close': close, 'volume': 1000}).to_csv(paths.csv_path('ZZZ'),
+                                                                                        index=False)
+
+
+@pytest.fixture
+def trained(tmp_path, monkeypatch):
+    """Модель ZZZ обучена на TRAINED свечах; в CSV при обучении уже была прогнозная строка с будущей датой."""
+    monkeypatch.setattr(paths, 'models_dir', str(tmp_path / 'models'))
+    monkeypatch.setattr(paths, 'csv_dir', str(tmp_path / 'securities'))
+    (tmp_path / 'models').mkdir()
+    (tmp_path / 'securities').mkdir()
+    monkeypatch.setattr(ml.forecast, 'load_model_for_engine', lambda ticker, engine: (LastValueModel(), 'numpy'))
+
+    close = 100 + np.cumsum(np.random.default_rng(0).normal(0, 0.5, TRAINED + 10))
+    close[TRAINED:] = np.clip(close[TRAINED:], close[:TRAINED].min(), close[:TRAINED].max())
+    times = pd.bdate_range(datetime.now() - timedelta(days=400), periods=TRAINED + 10)
+    future = datetime.now() + timedelta(days=30)
+    _write_csv(list(times[:TRAINED]) + [future], np.append(close[:TRAINED], 150.0))
+
+    # Как stock.py: снимок по ряду load_history, records_count - его длина
+    df = load_history('ZZZ').to_dataframe()
+    scaler = ArrayScaler([df['close'].min()], [df['close'].max()])
+    with open(paths.scaler_path('ZZZ'), 'wb') as f:
+        pickle.dump(scaler, f)
+    open(paths.model_path('ZZZ'), 'w').close()
+    train_mape = recent_mape(LastValueModel(), scaler, close[:TRAINED], LOOKBACK)
+    write_snapshot(paths.snapshot_dir('ZZZ'), df, close[TRAINED - LOOKBACK:TRAINED],
+                   {'lookback': LOOKBACK, 'forecast_days': 1, 'mape': train_mape})
+    return times, close
+
+
+def test_check_ticker_ignores_forecast_rows_and_flags_new_candles(trained):
+    times, close = trained
+    report = check_ticker('ZZZ')
+    assert report['new_rows'] == 0 and report['action'] is None and report['reasons'] == []
+
+    _write_csv(times, close)
+    report = check_ticker('ZZZ', error_window=10)
+    assert report['new_rows'] == 10 and report['range']['outside'] == 0
+    assert (report['action'], report['reasons']) == ('incremental', ['stale'])
+
+
+def test_check_ticker_full_retrain_on_range_error_and_changed_history(trained):
+    times, close = trained
+    jumped = close.copy()
+    jumped[-1] = close.max() * 1.5
+    _write_csv(times, jumped)
+    report = check_ticker('ZZZ', error_window=10)
+    assert report['range']['outside'] == 1 and report['range']['excess'] > 0
+    assert report['action'] == 'full' and report['reasons'][0] == 'range'
+
+    # В диапазоне scaler'а, но ошибка на шаг вперед - в разы выше, чем при обучении
+    noisy = close.copy()
+    noisy[TRAINED::2] = close[:TRAINED].max()
+    noisy[TRAINED + 1::2] = close[:TRAINED].min()
+    _write_csv(times, noisy)
+    report = check_ticker('ZZZ', error_window=10)
+    assert report['range']['outside'] == 0 and report['error_ratio'] > 1.5
+    assert (report['action'], report['reasons']) == ('full', ['error'])
+
+    _write_csv(times[:TRAINED - 3], close[:TRAINED - 3])
+    report = check_ticker('ZZZ')
+    assert report['new_rows'] == -3
+    assert (report['action'], report['reasons']) == ('full', ['history_changed'])
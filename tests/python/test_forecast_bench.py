@@ -0,0 +1,32 @@
+import copy
+
+from benchmarks.forecast_bench import compare, run_size
+from ml import paths
+
+
+def test_run_size_measures_every_stage_in_temp_dir():
+    models_dir = paths.models_dir
+    result = run_size(300, repeat=1, days=5)
+
+    assert paths.models_dir == models_dir
+    assert set(result['stages']) == {
+        'csv_parse_cold', 'csv_load_store', 'snapshot_load', 'scaler_load', 'windows',
+        'model_load_numpy', 'rollout_numpy', 'rollout_numpy_stateful', 'serialize_full', 'serialize_summary',
+    }
+    assert result['drift']['numpy']['max_rel_pct'] >= 0
+    for record in result['stages'].values():
+        assert record['wall_ms']['min'] <= record['wall_ms']['median'] <= record['wall_ms']['max']
+        assert record['tracemalloc_peak_bytes'] >= 0
+
+
+def test_compare_flags_regressions_over_threshold():
+    def stage():
+        return {'wall_ms': {'median': 10.0}, 'peak_rss_bytes': None}
+
+    base = {'sizes': [{'rows': 100, 'stages': {'windows': stage(), 'rollout_numpy': stage()}}]}
+    new = copy.deepcopy(base)
+    new['sizes'][0]['stages']['rollout_numpy']['wall_ms']['median'] = 15.0
+
+    _, regressions = compare(base, new, threshold=0.2)
+
+    assert [(rows, name) for rows, name, _ in regressions] == [(100, 'rollout_numpy')]
@@ -0,0 +1,65 @@
+import pytest
+
+import ml.forecast_store
+import ml.result_cache
+import ml.results
+from ml import batch
+from ml.forecast_store import ForecastStore, decode_predictions, is_default_run
+
+
+def _result(close, bands=False):
+    predictions = []
+    for day in range(1, 4):
+        point = {'time': f'2024-09-0{day} 00:00:00', 'open': close + day, 'high': close + day + 1,
+                 'low': close + day - 1, 'close': close + day, 'volume': 100 * day}
+        if bands:
+            point['bands'] = {'p5': close, 'p95': close + 10}
+        predictions.append(point)
+    return {'ticker': 'sber', 'current_price': close, 'engine': 'numpy', 'predictions': predictions}
+
+
+def test_runs_round_trip_and_latest_lookup(tmp_path):
+    store = ForecastStore(str(tmp_path))
+    first = store.put(_result(100.0), model_hash='a')
+    second = store.put(_result(200.5, bands=True), model_hash='b')
+
+    entry, columns = store.read('SBER')
+    assert entry['run_id'] == second['run_id'] and entry['model_hash'] == 'b'
+    assert entry['current_price'] == 200.5 and entry['points'] == 3
+    assert decode_predictions(columns) == _result(200.5, bands=True)['predictions']
+
+    entry, columns = store.read('SBER', first['run_id'])
+    assert decode_predictions(columns) == _result(100.0)['predictions']
+    assert store.read('GAZP') is None
+
+
+def test_retention_keeps_newest_runs_in_new_generation(tmp_path):
+    store = ForecastStore(str(tmp_path), keep_runs=2)
+    ids = [store.put(_result(float(i)))['run_id'] for i in range(3)]
+
+    runs = store.runs('SBER')
+    assert [r['run_id'] for r in runs] == ids[1:]
+    assert {r['file'] for r in runs} == {'SBER.1.bin'}
+    assert sorted(p.name for p in tmp_path.glob('*.bin')) == ['SBER.1.bin']
+    assert decode_predictions(store.read('SBER', ids[1])[1]) == _result(1.0)['predictions']
+
+
+def test_only_the_default_mode_is_a_chart_forecast():
+    assert is_default_run(252)
+    assert not is_default_run(30)
+    assert not is_default_run(252, samples=100)
+    assert not is_default_run(252, rollout='stateful')
+    assert not is_default_run(252, recursive=True)
+
+
+@pytest.mark.parametrize('days, samples, rollout, stored', [
+    (252, 0, 'window', True), (30, 0, 'window', False), (252, 50, 'window', False), (252, 0, 'stateful', False)])
+def test_batch_stores_only_default_runs(monkeypatch, days, samples, rollout, stored):
+    calls = []
+    monkeypatch.setattr(ml.results, 'check_model_exists', lambda ticker: None)
+    monkeypatch.setattr(ml.result_cache, 'cached_forecast', lambda *args, **kwargs: _result(100.0))
+    monkeypatch.setattr(ml.forecast_store, 'store_result', lambda result: calls.append(result['ticker']))
+
+    result = batch._forecast_ticker('SBER', days, True, 'numpy', False, 'full', None, samples=samples, rollout=rollout)
+
+    assert 'error' not in result and calls == (['sber'] if stored else [])
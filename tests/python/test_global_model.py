@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('tensorflow')
+
+from ml import global_model, paths  # noqa: E402
+from ml.forecast_store import ForecastStore  # noqa: E402
+from ml.global_model import GlobalModel, _embedding_table, _numpy_core  # noqa: E402
+from ml.model_factory import build_global_model  # noqa: E402
+
+LOOKBACK = 12
+
+
+@pytest.fixture(scope='module')
+def models():
+    keras_model = build_global_model(lookback=LOOKBACK, n_tickers=2, embedding_dim=3, units=8, lstm_layers=2)
+    meta = {'lookback': LOOKBACK, 'tickers': {'AAA': {'id': 1}, 'BBB': {'id': 2}}}
+    embedding = _embedding_table(keras_model)
+    return (GlobalModel(meta, keras_model, embedding, 'keras'),
+            GlobalModel(meta, _numpy_core(keras_model), embedding, 'numpy'))
+
+
+def test_numpy_engine_matches_keras_with_ticker_embedding(models):
+    keras_model, numpy_model = models
+    windows = np.random.default_rng(0).random((3, LOOKBACK, 1)).astype(np.float32)
+    ids = np.array([1, 2, 0])
+
+    np.testing.assert_allclose(numpy_model.predict(windows, ids), keras_model.predict(windows, ids), atol=1e-5)
+    assert [numpy_model.ticker_id(t) for t in ('aaa', 'BBB', 'NEW')] == [1, 2, 0]
+
+
+@pytest.mark.parametrize('rollout', ['window', 'stateful'])
+def test_batched_rollout_equals_per_ticker_rollouts(models, rollout):
+    _, model = models
+    windows = np.random.default_rng(1).random((2, LOOKBACK, 1)).astype(np.float32)
+
+    batched = model.rollout(windows, [1, 2], 5, rollout)
+    separate = [model.rollout(windows[i:i + 1], [i + 1], 5, rollout)[0] for i in range(2)]
+
+    np.testing.assert_allclose(batched, np.stack(separate), atol=1e-6)
+
+
+def _write_csv(directory, ticker, rows, seed):
+    import pandas as pd
+
+    close = 100 + np.cumsum(np.random.default_rng(seed).normal(0, 1, rows))
+    times = pd.bdate_range('2020-01-01', periods=rows).strftime('%Y-%m-%d %H:%M:%S')
+    df = pd.DataFrame({'ticker': ticker, 'time': times, 'open': close, 'high': close + 1, 'low': close - 1,
+                       'close': close, 'volume': 1000})
+    df.to_csv(directory / f'{ticker}.csv', index=False)
+    return close
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    for name in ('models', 'securities', 'forecasts', 'cache'):
+        (tmp_path / name).mkdir()
+    monkeypatch.setattr(paths, 'models_dir', str(tmp_path / 'models'))
+    monkeypatch.setattr(paths, 'csv_dir', str(tmp_path / 'securities'))
+    monkeypatch.setattr(paths, 'forecast_store_dir', str(tmp_path / 'forecasts'))
+    monkeypatch.setattr(paths, 'forecast_cache_dir', str(tmp_path / 'cache'))
+    return tmp_path
+
+
+def test_forecast_tickers_known_unknown_and_missing(models, storage):
+    closes = {t: _write_csv(storage / 'securities', t, 40, seed) for seed, t in enumerate(('AAA', 'NEW'))}
+    meta = {'lookback': LOOKBACK,
+            'tickers': {'AAA': {'id': 1, 'scaler': global_model.fit_scaler(closes['AAA'] * 2).to_dict()}}}
+    model = GlobalModel(meta, models[1].model, models[1].embedding, 'numpy')
+    results = global_model.forecast_tickers(model, ['AAA', 'NEW', 'NONE'], days=5)
+
+    assert results['AAA']['model'] == 'global' and results['NEW']['model'] == 'global_unknown'
+    assert 'error' in results['NONE']
+    for ticker in ('AAA', 'NEW'):
+        assert len(results[ticker]['predictions']) == 5
+        assert results[ticker]['current_price'] == pytest.approx(closes[ticker][-1])
+
+    # Тикер вне обучения идет с номером 0 и scaler'ом по своей истории; известный - со scaler'ом обучения
+    scalers = {'AAA': global_model.fit_scaler(closes['AAA'] * 2), 'NEW': global_model.fit_scaler(closes['NEW'])}
+    windows = np.stack([scalers[t].transform(closes[t][-LOOKBACK:].reshape(-1, 1)) for t in ('AAA', 'NEW')])
+    raw = model.rollout(windows.astype(np.float32), [1, 0], 5)
+    for row, ticker in enumerate(('AAA', 'NEW')):
+        expected = scalers[ticker].inverse_transform(raw[row].reshape(-1, 1)).ravel()
+        actual = [p['close'] for p in results[ticker]['predictions']]
+        np.testing.assert_allclose(actual, expected, rtol=1e-5)
+
+
+def test_train_global_and_forecast_without_touching_ticker_store(storage):
+    for seed, ticker in enumerate(('AAA', 'BBB')):
+        _write_csv(storage / 'securities', ticker, 120, seed)
+    _write_csv(storage / 'securities', 'SHORT', 30, 2)
+    _write_csv(storage / 'securities', 'NEW', 60, 3)
+
+    meta = global_model.train_global(['AAA', 'BBB', 'SHORT', 'MISSING'], embedding_dim=2, lookback=LOOKBACK,
+                                     units=4, lstm_layers=1, dropout=0.0, batch_size=16, epochs=1)
+    assert {t: e['id'] for t, e in meta['tickers'].items()} == {'AAA': 1, 'BBB': 2}
+    assert set(meta['skipped']) == {'SHORT', 'MISSING'}
+    assert all(e['mape'] is not None for e in meta['tickers'].values())
+    assert global_model.load_meta()['tickers'] == meta['tickers']
+
+    model = GlobalModel.load('numpy')
+    assert model.engine == 'numpy' and model.embedding.shape == (3, 2)
+    assert [model.ticker_id(t) for t in ('AAA', 'BBB', 'NEW')] == [1, 2, 0]
+
+    results = global_model.run_global_forecasts(['aaa', 'NEW'], days=252, use_cache=False)
+    assert [r['model'] for r in results] == ['global', 'global_unknown']
+    # Без store=True прогнозы общей модели не заменяют в хранилище прогнозы моделей тикеров
+    assert ForecastStore().latest('AAA') is None
+
+    global_model.run_global_forecasts(['AAA'], days=252, use_cache=False, store=True)
+    assert ForecastStore().latest('AAA')['model'] == 'global'
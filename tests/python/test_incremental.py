@@ -0,0 +1,108 @@
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('tensorflow')
+pytest.importorskip('sklearn')
+
+from sklearn.preprocessing import MinMaxScaler  # noqa: E402
+
+import ml.forecast  # noqa: E402
+from ml import paths  # noqa: E402
+from ml.incremental import FullRetrainRequired, warm_start  # noqa: E402
+from ml.model_factory import build_pattern_model  # noqa: E402
+from ml.snapshot import write_snapshot  # noqa: E402
+
+LOOKBACK = 5
+OLD_COUNT = 180
+
+
+def _frame(close):
+    return pd.DataFrame({'time': pd.date_range('2024-01-01', periods=len(close), freq='D'), 'close': close,
+                         'volume': np.ones(len(close))})
+
+
+@pytest.fixture
+def trained(tmp_path, monkeypatch):
+    """Модель "обучена" на первых OLD_COUNT свечах; возвращает ряд с 20 новыми свечами и окна fit."""
+    monkeypatch.setattr(paths, 'models_dir', str(tmp_path))
+    rng = np.random.default_rng(0)
+    close = 100 + np.cumsum(rng.normal(0, 1, OLD_COUNT + 20))
+    # Новые свечи - внутри диапазона scaler'а, обученного на старых
+    close[OLD_COUNT:] = np.clip(close[OLD_COUNT:], close[:OLD_COUNT].min(), close[:OLD_COUNT].max())
+
+    scaler = MinMaxScaler().fit(close[:OLD_COUNT].reshape(-1, 1))
+    with open(paths.scaler_path('ZZZ'), 'wb') as f:
+        pickle.dump(scaler, f)
+    open(paths.model_path('ZZZ'), 'w').close()
+    old = _frame(close[:OLD_COUNT])
+    write_snapshot(paths.snapshot_dir('ZZZ'), old, close[OLD_COUNT - LOOKBACK:OLD_COUNT],
+                   {'lookback': LOOKBACK, 'forecast_days': 1})
+
+    model = build_pattern_model(lookback=LOOKBACK, units=4, lstm_layers=1, dropout=0.0)
+    fitted = []
+    original_fit = model.fit
+
+    def fit(X, y, **kwargs):
+        fitted.append(np.asarray(X))
+        return original_fit(X, y, **kwargs)
+
+    model.fit = fit
+    monkeypatch.setattr(ml.forecast, 'load_keras_model', lambda path: model)
+    return close, fitted
+
+
+def _warm(close, **kwargs):
+    return warm_start('ZZZ', _frame(close), lookback=LOOKBACK, epochs=1, max_degradation=1e9, **kwargs)
+
+
+def test_fine_tune_windows_never_reach_the_evaluation_set(trained):
+    close, fitted = trained
+
+    warm = _warm(close)
+
+    X, eval_idx = warm['X'], warm['eval_idx']
+    fit_windows = {w.tobytes() for w in fitted[0].astype(np.float32)}
+    assert not any(X[i].astype(np.float32).tobytes() in fit_windows for i in eval_idx)
+    # Отложены тест прошлого обучения и последние окна новых свечей
+    new_start = OLD_COUNT - LOOKBACK
+    assert set(eval_idx) >= set(range(int(new_start * 0.8), new_start)) | {len(X) - 1}
+    assert len(fitted[0]) + len(eval_idx) <= len(X)
+    assert warm['new_records'] == 20 and warm['mae_after'] is not None
+
+
+def test_price_outside_scaler_range_requires_full_retrain(trained):
+    close, fitted = trained
+    close = close.copy()
+    close[-1] = close.max() * 2
+
+    with pytest.raises(FullRetrainRequired, match='диапазон'):
+        _warm(close)
+    assert not fitted
+
+
+def test_changed_history_requires_full_retrain(trained):
+    close, fitted = trained
+    close = close.copy()
+    close[OLD_COUNT - 2] += 1
+
+    with pytest.raises(FullRetrainRequired, match='история'):
+        _warm(close)
+    with pytest.raises(FullRetrainRequired, match='меньше'):
+        _warm(close[:OLD_COUNT - 1])
+    assert not fitted
+
+
+def test_no_new_rows_and_too_many_new_rows(trained):
+    close, _ = trained
+
+    assert _warm(close[:OLD_COUNT]) is None
+    longer = np.concatenate([close, np.full(100, close[-1])])
+    with pytest.raises(FullRetrainRequired, match='слишком много'):
+        _warm(longer)
+    os.remove(paths.snapshot_header_path('ZZZ'))
+    with pytest.raises(FullRetrainRequired, match='снимка'):
+        _warm(close)
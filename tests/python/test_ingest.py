@@ -0,0 +1,137 @@
+import asyncio
+import json
+import socket
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from ml import ingest
+from ml.locks import try_lock
+
+COLUMNS = ['open', 'close', 'high', 'low', 'value', 'volume', 'begin', 'end']
+
+
+def _candle(day, price):
+    begin = f'{day.isoformat()} 00:00:00'
+    return [price, price + 0.5, price + 1, price - 1, 1e6, 100, begin, f'{day.isoformat()} 23:59:59']
+
+
+@pytest.fixture
+def iss_stub():
+    """Локальный ISS: свечи последних 10 дней, страницы по ingest.PAGE_SIZE строк."""
+    today = date.today()
+    candles = [_candle(today - timedelta(days=10 - i), 100.0 + i) for i in range(10)]
+    seen = {'requests': [], 'connections': set()}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            query = parse_qs(urlsplit(self.path).query)
+            start = int(query['start'][0])
+            rows = [c for c in candles if c[6] >= query['from'][0]][start:start + ingest.PAGE_SIZE]
+            body = json.dumps({'candles': {'columns': COLUMNS, 'data': rows}}).encode()
+            seen['requests'].append(self.path)
+            seen['connections'].add(self.client_address)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/iss', candles, seen
+    server.shutdown()
+    server.server_close()
+
+
+def test_ingest_appends_new_candles_and_then_uses_index(tmp_path, iss_stub, monkeypatch):
+    url, candles, seen = iss_stub
+    monkeypatch.setattr(ingest, 'PAGE_SIZE', 3)
+    # В CSV уже есть первые 4 свечи (время в кавычках, как пишет fputcsv)
+    existing = ''.join(f'SBER,"{c[6]}",{c[0]},{c[2]},{c[3]},{c[1]},100\n' for c in candles[:4])
+    (tmp_path / 'SBER.csv').write_text(ingest.CSV_HEADER + existing)
+
+    results, stats = asyncio.run(ingest.ingest(['SBER', 'GAZP'], url=url, concurrency=2, csv_directory=str(tmp_path)))
+    by_ticker = {r['ticker']: r for r in results}
+
+    assert by_ticker['SBER']['added'] == 6 and by_ticker['SBER']['pages'] == 3
+    # Без CSV - свечи за последние 30 дней и файл с заголовком
+    assert by_ticker['GAZP']['added'] == 10 and by_ticker['GAZP']['pages'] == 4
+    assert stats['requests'] == 7 and stats['connections'] <= 2 and len(seen['connections']) <= 2
+
+    lines = (tmp_path / 'SBER.csv').read_text().splitlines()
+    assert len(lines) == 11
+    assert lines[5] == f'SBER,"{candles[4][6]}",104,105,103,104.5,100'
+    assert (tmp_path / 'GAZP.csv').read_text().startswith(ingest.CSV_HEADER)
+
+    # Второй запуск: CSV не читается, запрос начинается со следующего дня
+    monkeypatch.setattr(ingest, 'scan_csv', lambda path: pytest.fail('CSV не должен перечитываться'))
+    seen['requests'].clear()
+    results, _ = asyncio.run(ingest.ingest(['SBER'], url=url, csv_directory=str(tmp_path)))
+    assert results[0]['added'] == 0 and results[0]['last'] == candles[-1][6]
+    assert len(seen['requests']) == 1 and f'from={date.today().isoformat()}' in seen['requests'][0]
+    assert len((tmp_path / 'SBER.csv').read_text().splitlines()) == 11
+
+
+def test_http_errors_are_reported_per_ticker(tmp_path):
+    results, _ = asyncio.run(ingest.ingest(['SBER'], url='http://127.0.0.1:9/iss', csv_directory=str(tmp_path)))
+
+    assert 'error' in results[0] and not (tmp_path / 'SBER.csv').exists()
+
+
+def test_rows_appended_by_another_writer_are_not_fetched_again(tmp_path, iss_stub):
+    url, candles, seen = iss_stub
+    asyncio.run(ingest.ingest(['SBER'], url=url, csv_directory=str(tmp_path)))
+    csv = tmp_path / 'SBER.csv'
+    # Индекс - как после записи без последней свечи; ее затем дописывает "PHP"
+    lines = csv.read_text().splitlines(keepends=True)
+    size = len(''.join(lines[:-1]).encode())
+    ingest.save_index(ingest.index_path(str(tmp_path)), {
+        'SBER': {'last': candles[-2][6], 'size': size, 'fingerprint': ingest.fingerprint(str(csv), size)}})
+
+    seen['requests'].clear()
+    results, _ = asyncio.run(ingest.ingest(['SBER'], url=url, csv_directory=str(tmp_path)))
+
+    assert results[0]['added'] == 0 and results[0]['last'] == candles[-1][6]
+    assert f'from={date.today().isoformat()}' in seen['requests'][0]
+    assert csv.read_text() == ''.join(lines)
+
+
+def test_rewritten_csv_is_scanned_again(tmp_path, iss_stub):
+    url, candles, _ = iss_stub
+    asyncio.run(ingest.ingest(['SBER'], url=url, csv_directory=str(tmp_path)))
+    csv = tmp_path / 'SBER.csv'
+    lines = csv.read_text().splitlines(keepends=True)
+    # Файл переписан той же длины: последняя строка заменена другой свечой
+    csv.write_text(''.join(lines[:-2]) + lines[-1] + lines[-2])
+
+    results, _ = asyncio.run(ingest.ingest(['SBER'], url=url, csv_directory=str(tmp_path)))
+
+    assert results[0]['added'] == 0 and results[0]['last'] == candles[-2][6]
+    assert len(csv.read_text().splitlines()) == len(lines)
+
+
+def test_stalled_handshake_times_out_and_releases_the_lock(tmp_path):
+    # Сервер принимает TCP, но не отвечает на TLS-рукопожатие
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen()
+    try:
+        url = f'https://127.0.0.1:{server.getsockname()[1]}/iss'
+        started = time.perf_counter()
+        results, _ = ingest.run_ingest(['SBER'], url=url, csv_directory=str(tmp_path), timeout=0.3)
+        assert 'error' in results[0] and time.perf_counter() - started < 5
+    finally:
+        server.close()
+
+    with open(ingest.index_path(str(tmp_path)) + '.lock', 'a+') as f:
+        assert try_lock(f)
@@ -0,0 +1,43 @@
+import numpy as np
+from sklearn.preprocessing import MinMaxScaler
+
+from benchmarks.forecast_bench import random_numpy_model
+from ml.forecast import ModelArtifacts, run_forecast
+from ml.snapshot import Snapshot
+
+
+def make_artifacts():
+    scaler = MinMaxScaler().fit(np.array([[50.0], [150.0]]))
+    last_sequence = np.linspace(0.3, 0.6, 60, dtype=np.float32).reshape(-1, 1)
+    snapshot = Snapshot({
+        'last_date': '2024-09-06 00:00:00',
+        'last_price': 100.0,
+        'lookback': 60,
+        'forecast_days': 1,
+        'records_count': 60,
+    }, arrays={'last_sequence': last_sequence, 'volume': np.full(60, 1000, np.float32)})
+    return ModelArtifacts('MCTEST', random_numpy_model(seed=1), scaler, snapshot, 'numpy')
+
+
+def test_dropout_is_identity_without_rng():
+    model = random_numpy_model(seed=1)
+    x = np.random.default_rng(0).random((4, 60, 1), dtype=np.float32)
+
+    np.testing.assert_array_equal(model.predict(x), model.predict(x))
+    assert not np.allclose(model.predict(x, rng=np.random.default_rng(0)), model.predict(x))
+
+
+def test_monte_carlo_bands_keep_deterministic_path():
+    artifacts = make_artifacts()
+    plain = run_forecast(artifacts, days=10, use_snapshot=True)
+    mc = run_forecast(artifacts, days=10, use_snapshot=True, samples=64, quantiles=(5, 50, 95), seed=3)
+
+    assert [p['close'] for p in mc['predictions']] == [p['close'] for p in plain['predictions']]
+    assert mc['uncertainty']['samples'] == 64
+    for prediction in mc['predictions']:
+        bands = prediction['bands']
+        assert bands['p5'] <= bands['p50'] <= bands['p95']
+        assert (prediction['low'], prediction['high']) == (bands['p5'], bands['p95'])
+
+    again = run_forecast(artifacts, days=10, use_snapshot=True, samples=64, quantiles=(5, 50, 95), seed=3)
+    assert again['predictions'] == mc['predictions']
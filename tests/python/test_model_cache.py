@@ -0,0 +1,101 @@
+import threading
+import time
+
+import pytest
+
+from ml import model_cache
+from ml.model_cache import ArtifactCache
+
+
+class FakeModel:
+
+    def __init__(self, params):
+        self.params = params
+
+    def count_params(self):
+        return self.params
+
+
+class FakeArtifacts:
+
+    def __init__(self, ticker, params=25):
+        self.ticker = ticker
+        self.model = FakeModel(params)
+        self.snapshot = None
+        self.direct = None
+
+
+@pytest.fixture
+def fake_loader(monkeypatch):
+    """Загрузка без файлов: счетчик загрузок, версии файлов и необязательная блокировка по тикеру."""
+    state = {'loads': [], 'mtimes': {}, 'gates': {}}
+
+    def load(ticker, engine='keras'):
+        state['loads'].append(ticker)
+        gate = state['gates'].get(ticker)
+        if gate is not None:
+            gate.wait(5)
+        return FakeArtifacts(ticker)
+
+    monkeypatch.setattr(model_cache.ModelArtifacts, 'load', staticmethod(load))
+    monkeypatch.setattr(model_cache, '_artifact_mtimes', lambda ticker: state['mtimes'].get(ticker, 1))
+    return state
+
+
+def test_lru_eviction_by_size(fake_loader):
+    # Каждая модель - 25 параметров по 4 байта
+    cache = ArtifactCache(max_bytes=250)
+    cache.get('AAA')
+    cache.get('BBB')
+    cache.get('AAA')
+    cache.get('CCC')
+
+    assert cache.stats()['entries'] == ['AAA:keras', 'CCC:keras']
+    assert fake_loader['loads'] == ['AAA', 'BBB', 'CCC']
+
+
+def test_reload_after_mtime_change(fake_loader):
+    cache = ArtifactCache()
+    first, _ = cache.get('AAA')
+    assert cache.get('AAA')[0] is first
+
+    fake_loader['mtimes']['AAA'] = 2
+    assert cache.get('AAA')[0] is not first
+    assert fake_loader['loads'] == ['AAA', 'AAA']
+
+
+def test_hit_is_served_during_cold_load_of_other_ticker(fake_loader):
+    cache = ArtifactCache()
+    cache.get('AAA')
+    gate = fake_loader['gates']['BBB'] = threading.Event()
+
+    loaders = [threading.Thread(target=cache.get, args=('BBB',)) for _ in range(2)]
+    for t in loaders:
+        t.start()
+    time.sleep(0.1)
+
+    started = time.perf_counter()
+    cache.get('AAA')
+    assert time.perf_counter() - started < 0.5
+
+    gate.set()
+    for t in loaders:
+        t.join()
+    # Два одновременных промаха по одному тикеру - одна загрузка
+    assert fake_loader['loads'] == ['AAA', 'BBB']
+    assert cache._loading == {}
+
+
+def test_load_locks_do_not_outlive_loads(fake_loader, monkeypatch):
+    cache = ArtifactCache(max_bytes=100)
+    for ticker in ('AAA', 'BBB', 'CCC'):
+        cache.get(ticker)
+
+    def missing(ticker, engine='keras'):
+        raise FileNotFoundError(ticker)
+
+    monkeypatch.setattr(model_cache.ModelArtifacts, 'load', staticmethod(missing))
+    with pytest.raises(FileNotFoundError):
+        cache.get('NOSUCH')
+    # Вытесненные и несуществующие тикеры замков не оставляют
+    assert cache._loading == {}
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from ml.numpy_lstm import PARITY_ATOL, NumpyLSTMModel, StatefulRollout
+
+tf = pytest.importorskip('tensorflow')
+
+
+def build_keras_model(lookback=60):
+    from tensorflow.keras.layers import LSTM, Dense, Dropout, Input
+    from tensorflow.keras.models import Sequential
+
+    # Та же архитектура, что в stock.py
+    return Sequential([
+        Input(shape=(lookback, 1)),
+        LSTM(32, return_sequences=True),
+        Dropout(0.3),
+        LSTM(32, return_sequences=True),
+        Dropout(0.3),
+        LSTM(32),
+        Dropout(0.3),
+        Dense(1),
+    ])
+
+
+def test_numpy_engine_matches_keras_from_h5_and_npz(tmp_path):
+    tf.random.set_seed(0)
+    model = build_keras_model()
+    h5_path = str(tmp_path / 'lstm_patterns_test.h5')
+    model.save(h5_path)
+
+    x = np.random.default_rng(0).random((8, 60, 1), dtype=np.float32)
+    expected = model.predict(x, verbose=0)
+
+    from_h5 = NumpyLSTMModel.from_h5(h5_path)
+    np.testing.assert_allclose(from_h5.predict(x), expected, atol=PARITY_ATOL)
+
+    npz_path = str(tmp_path / 'lstm_patterns_test.npz')
+    NumpyLSTMModel.from_keras_model(model).save_npz(npz_path)
+    from_npz = NumpyLSTMModel.from_npz(npz_path)
+    np.testing.assert_allclose(from_npz.predict(x), expected, atol=PARITY_ATOL)
+
+
+def test_stateful_step_equals_prediction_over_extended_sequence():
+    tf.random.set_seed(0)
+    model = NumpyLSTMModel.from_keras_model(build_keras_model())
+    rng = np.random.default_rng(0)
+    window = rng.random((2, 60, 1), dtype=np.float32)
+    tail = rng.random((2, 3, 1), dtype=np.float32)
+
+    rollout = StatefulRollout(model, window)
+    np.testing.assert_allclose(rollout.output, model.predict(window), atol=PARITY_ATOL)
+    for t in range(tail.shape[1]):
+        out = rollout.step(tail[:, t])
+
+    # Перенос состояния = прогон всей последовательности с нуля, а не последних 60 значений
+    np.testing.assert_allclose(out, model.predict(np.concatenate([window, tail], axis=1)), atol=PARITY_ATOL)
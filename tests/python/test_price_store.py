@@ -0,0 +1,123 @@
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from ml import paths
+from ml.price_store import INDEX_FILE, PriceStore, drop_future_rows, load_prices, main, store_dir
+
+HEADER = 'ticker,time,open,high,low,close,volume\n'
+
+
+def _row(day, close):
+    return f'TEST,"2024-01-{day:02d} 00:00:00",{close},{close},{close},{close},100\n'
+
+
+def _reference(csv_path):
+    """Та же очистка, что делал pd.read_csv-путь до хранилища."""
+    df = pd.read_csv(csv_path)
+    df['time'] = pd.to_datetime(df['time'])
+    df = df.sort_values('time', kind='stable').drop_duplicates(subset='time', keep='last')
+    return df.reset_index(drop=True)
+
+
+def test_incremental_append_matches_full_parse(tmp_path):
+    csv_path = tmp_path / 'TEST.csv'
+    csv_path.write_text(HEADER + ''.join(_row(d, 100 + d) for d in range(1, 11)))
+    assert len(load_prices('TEST', str(tmp_path))) == 10
+
+    # Прогнозные строки, затем свеча раньше них, дубль даты и недописанная строка
+    with open(csv_path, 'a') as f:
+        f.write(''.join(_row(d, 200 + d) for d in range(20, 25)))
+        f.write(_row(11, 111) + _row(5, 555))
+        f.write('TEST,"2024-01-12 00:00')
+
+    series = load_prices('TEST', str(tmp_path))
+    complete = tmp_path / 'complete.csv'
+    complete.write_text(csv_path.read_text().rsplit('\n', 1)[0] + '\n')
+    expected = _reference(complete)
+
+    df = series.to_dataframe()
+    assert list(df['time']) == list(expected['time'])
+    np.testing.assert_array_equal(df['close'].to_numpy(), expected['close'].to_numpy())
+    assert df.loc[df['time'] == '2024-01-05', 'close'].item() == 555
+
+    # Строка дописана - разбирается только она
+    with open(csv_path, 'a') as f:
+        f.write(' 00:00:00",112,112,112,112,100\n')
+    assert len(load_prices('TEST', str(tmp_path))) == len(series) + 1
+
+
+def test_rewritten_csv_triggers_rebuild(tmp_path):
+    csv_path = tmp_path / 'TEST.csv'
+    csv_path.write_text(HEADER + ''.join(_row(d, 100 + d) for d in range(1, 11)))
+    load_prices('TEST', str(tmp_path))
+
+    csv_path.write_text(HEADER + ''.join(_row(d, 300 + d) for d in range(1, 4)))
+    series = PriceStore('TEST', str(tmp_path)).load()
+    assert list(series['close']) == [301.0, 302.0, 303.0]
+
+    series = series.until(np.datetime64('2024-01-02'))
+    assert len(series) == 2
+
+
+def test_drop_future_rows_removes_old_forecast_rows(tmp_path, monkeypatch):
+    csv_path = tmp_path / 'TEST.csv'
+    history = HEADER + ''.join(_row(d, 100 + d) for d in range(1, 11))
+    csv_path.write_text(history + ''.join(_row(d, 200 + d) for d in range(20, 25)))
+    assert len(load_prices('TEST', str(tmp_path))) == 15
+
+    assert drop_future_rows('TEST', datetime(2024, 1, 15), str(tmp_path)) == 5
+    assert csv_path.read_text() == history
+    assert drop_future_rows('TEST', datetime(2024, 1, 15), str(tmp_path)) == 0
+    # Хранилище замечает перезапись CSV и перестраивается
+    assert load_prices('TEST', str(tmp_path)).to_dataframe()['time'].max() == pd.Timestamp('2024-01-10')
+
+    # Команда: строки прогноза в будущем относительно сегодняшнего дня
+    monkeypatch.setattr(paths, 'csv_dir', str(tmp_path))
+    csv_path.write_text(history + 'TEST,"2999-01-01 00:00:00",1,1,1,1,0\n')
+    assert main(['TEST', '--drop-future']) == 0
+    assert csv_path.read_text() == history
+
+
+def test_rewrite_keeps_previous_generation_for_readers_of_old_index(tmp_path):
+    csv_path = tmp_path / 'TEST.csv'
+    csv_path.write_text(HEADER + ''.join(_row(d, 100 + d) for d in range(1, 6)))
+    load_prices('TEST', str(tmp_path))
+    directory = store_dir('TEST', str(tmp_path))
+    with open(os.path.join(directory, INDEX_FILE), 'r', encoding='utf-8') as f:
+        old_index = json.load(f)
+
+    # Переписан с тем же числом строк: читатель старого index.json видит только старые колонки
+    csv_path.write_text(HEADER + ''.join(_row(d, 300 + d) for d in range(1, 6)))
+    assert list(load_prices('TEST', str(tmp_path))['close']) == [301.0, 302.0, 303.0, 304.0, 305.0]
+    old_close = np.load(os.path.join(directory, old_index['columns']['close']))
+    assert list(old_close) == [101.0, 102.0, 103.0, 104.0, 105.0]
+
+    csv_path.write_text(HEADER + ''.join(_row(d, 500 + d) for d in range(1, 6)))
+    load_prices('TEST', str(tmp_path))
+    # Хранятся только текущее и предыдущее поколения
+    assert len([n for n in os.listdir(directory) if n.endswith('.npy')]) == 12
+    assert not os.path.exists(os.path.join(directory, old_index['columns']['close']))
+
+
+def test_store_without_generations_is_read_and_replaced(tmp_path):
+    csv_path = tmp_path / 'TEST.csv'
+    csv_path.write_text(HEADER + ''.join(_row(d, 100 + d) for d in range(1, 6)))
+    load_prices('TEST', str(tmp_path))
+    directory = store_dir('TEST', str(tmp_path))
+    index_path = os.path.join(directory, INDEX_FILE)
+    with open(index_path, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    for name, file_name in index.pop('columns').items():
+        os.replace(os.path.join(directory, file_name), os.path.join(directory, f'{name}.npy'))
+    with open(index_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+
+    with open(csv_path, 'a') as f:
+        f.write(_row(6, 106))
+    assert list(load_prices('TEST', str(tmp_path))['close']) == [101.0, 102.0, 103.0, 104.0, 105.0, 106.0]
+    # Старые <name>.npy остаются на одну запись - для читателей старого index.json
+    assert os.path.exists(os.path.join(directory, 'close.npy'))
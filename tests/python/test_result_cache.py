@@ -0,0 +1,87 @@
+import os
+import time
+from datetime import date
+
+import pytest
+
+from ml import paths, result_cache
+from ml.result_cache import ResultCache
+
+
+@pytest.fixture
+def artifacts(tmp_path, monkeypatch):
+    monkeypatch.setattr(paths, 'models_dir', str(tmp_path / 'models'))
+    monkeypatch.setattr(paths, 'csv_dir', str(tmp_path / 'csv'))
+    holidays = tmp_path / 'holidays.txt'
+    holidays.write_text('2025-01-01\n')
+    monkeypatch.setenv('MOEX_HOLIDAYS_FILE', str(holidays))
+    os.makedirs(paths.csv_dir)
+    os.makedirs(paths.snapshot_dir('ZZZ'))
+    for path, content in ((paths.model_path('ZZZ'), b'model'), (paths.scaler_path('ZZZ'), b'scaler'),
+                          (paths.snapshot_header_path('ZZZ'), b'{"timestamp": 1}'),
+                          (paths.csv_path('ZZZ'), b'date,close\n')):
+        with open(path, 'wb') as f:
+            f.write(content)
+    return ResultCache(str(tmp_path / 'cache'))
+
+
+@pytest.mark.parametrize('source', [True, False])
+@pytest.mark.parametrize('changed', ['model_path', 'scaler_path', 'snapshot_header_path', 'csv_path'])
+def test_key_changes_with_the_files_it_depends_on(artifacts, source, changed):
+    before = artifacts.key_for('ZZZ', 252, source, 'numpy')
+    with open(getattr(paths, changed)('ZZZ'), 'ab') as f:
+        f.write(b'retrained')
+    after = artifacts.key_for('ZZZ', 252, source, 'numpy')
+
+    # Снимок не влияет на прогноз по CSV и наоборот
+    unrelated = (source and changed == 'csv_path') or (not source and changed == 'snapshot_header_path')
+    assert (before == after) == unrelated
+    assert before[1] == ('snapshot' if source else 'csv')
+
+
+def test_csv_key_changes_with_the_date_and_the_snapshot_key_does_not(artifacts, monkeypatch):
+    before = [artifacts.key_for('ZZZ', 252, source, 'numpy')[0] for source in (True, False)]
+
+    class Tomorrow(date):
+        @classmethod
+        def today(cls):
+            return date(2099, 1, 2)
+
+    monkeypatch.setattr(result_cache, 'date', Tomorrow)
+    after = [artifacts.key_for('ZZZ', 252, source, 'numpy')[0] for source in (True, False)]
+
+    assert before[0] == after[0] and before[1] != after[1]
+
+
+def test_key_depends_on_days_engine_and_options(artifacts):
+    keys = {artifacts.key_for('ZZZ', 252, True, 'numpy')[0], artifacts.key_for('ZZZ', 30, True, 'numpy')[0],
+            artifacts.key_for('ZZZ', 252, True, 'keras')[0],
+            artifacts.key_for('ZZZ', 252, True, 'numpy', {'samples': 10})[0]}
+    assert len(keys) == 4
+
+
+def test_expired_entries_are_misses_and_are_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path), max_age=60)
+    cache.put('old', {'close': 1.0})
+    cache.put('new', {'close': 2.0})
+    stale = time.time() - 120
+    os.utime(tmp_path / 'old.json', (stale, stale))
+
+    assert cache.get('old') is None and cache.get('new') == {'close': 2.0}
+    cache.evict()
+    assert sorted(os.listdir(tmp_path)) == ['new.json']
+
+
+def test_size_limit_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    for i, key in enumerate(('a', 'b', 'c')):
+        cache.put(key, {'forecast': [float(i)] * 50})
+        past = time.time() - 100 + i
+        os.utime(tmp_path / f'{key}.json', (past, past))
+    # Чтение 'a' делает ее самой свежей по времени доступа
+    assert cache.get('a') is not None
+
+    cache.max_bytes = os.path.getsize(tmp_path / 'a.json') * 2
+    cache.evict()
+
+    assert sorted(os.listdir(tmp_path)) == ['a.json', 'c.json']
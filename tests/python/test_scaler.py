@@ -0,0 +1,37 @@
+import os
+
+import numpy as np
+from sklearn.preprocessing import MinMaxScaler
+
+from ml.scaler import ArrayScaler, load_scaler, save_sidecar, sidecar_path
+
+
+def test_array_scaler_matches_sklearn_bit_for_bit():
+    data = np.random.default_rng(0).random((500, 1)) * 300 + 50
+    scaler = MinMaxScaler(feature_range=(0, 1)).fit(data)
+    params = ArrayScaler.from_dict(ArrayScaler.from_sklearn(scaler).to_dict())
+
+    for x in (data, data.astype(np.float32)):
+        assert np.array_equal(params.transform(x), scaler.transform(x))
+        scaled = scaler.transform(x)
+        assert np.array_equal(params.inverse_transform(scaled), scaler.inverse_transform(scaled))
+
+
+def test_load_scaler_writes_sidecar_and_prefers_it(tmp_path):
+    import pickle
+
+    path = str(tmp_path / 'scaler_patterns_test.pkl')
+    with open(path, 'wb') as f:
+        pickle.dump(MinMaxScaler().fit(np.array([[1.0], [3.0]])), f)
+
+    assert isinstance(load_scaler(path), MinMaxScaler)
+    assert os.path.exists(sidecar_path(path))
+    assert isinstance(load_scaler(path), ArrayScaler)
+
+    # Переобученный pickle новее sidecar'а - sidecar пересоздается
+    with open(path, 'wb') as f:
+        pickle.dump(MinMaxScaler().fit(np.array([[0.0], [10.0]])), f)
+    os.utime(path, (os.path.getmtime(sidecar_path(path)) + 1,) * 2)
+    assert load_scaler(path).data_max_[0] == 10.0
+    save_sidecar(load_scaler(path), sidecar_path(path))
+    assert load_scaler(path).data_max_[0] == 10.0
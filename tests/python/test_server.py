@@ -0,0 +1,73 @@
+import json
+import threading
+from http.server import ThreadingHTTPServer
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+import ml.server
+from ml.model_cache import ArtifactCache
+from ml.server import ForecastRequestHandler
+
+
+@pytest.fixture
+def server_url(monkeypatch):
+    monkeypatch.setattr(ForecastRequestHandler, 'cache', ArtifactCache())
+    monkeypatch.setattr(ForecastRequestHandler, 'result_cache', None)
+    monkeypatch.setattr(ForecastRequestHandler, 'log_message', lambda self, *args: None)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ForecastRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def _get(url):
+    try:
+        with urlopen(url, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_health_and_request_validation(server_url):
+    status, body = _get(f'{server_url}/health')
+    assert status == 200 and body['cache']['entries'] == []
+
+    assert _get(f'{server_url}/forecast')[0] == 400
+    assert _get(f'{server_url}/forecast?ticker=SBER&engine=torch')[0] == 400
+    assert _get(f'{server_url}/forecast?ticker=SBER&rollout=beam')[0] == 400
+    assert _get(f'{server_url}/other')[0] == 404
+
+
+def test_missing_model_is_unprocessable(server_url):
+    status, body = _get(f'{server_url}/forecast?ticker=NOSUCHTICKER&engine=numpy')
+    assert status == 422 and 'error' in body
+
+
+@pytest.mark.parametrize('query, recursive, stored', [
+    ('', False, True), ('&recursive=1', True, False), ('&days=30', False, False), ('&samples=8', False, False)])
+def test_default_runs_are_stored_and_recursive_is_passed_through(server_url, monkeypatch, query, recursive, stored):
+    calls = {'forecast': [], 'options': [], 'stored': []}
+
+    def run_forecast(artifacts, **kwargs):
+        calls['forecast'].append(kwargs['recursive'])
+        return {'ticker': 'SBER', 'predictions': []}
+
+    def cached_forecast(cache, ticker, days, use_snapshot, engine, compute, options=None):
+        calls['options'].append(options)
+        return compute()
+
+    monkeypatch.setattr(ml.server, 'check_model_exists', lambda ticker: None)
+    monkeypatch.setattr(ml.server, 'cached_forecast', cached_forecast)
+    monkeypatch.setattr(ml.server, 'run_forecast', run_forecast)
+    monkeypatch.setattr(ml.server, 'store_result', lambda result: calls['stored'].append(result['ticker']))
+    monkeypatch.setattr(ArtifactCache, 'get', lambda self, ticker, engine: (None, threading.Lock()))
+
+    status, _ = _get(f'{server_url}/forecast?ticker=SBER&engine=numpy{query}')
+
+    assert status == 200
+    assert calls['forecast'] == [recursive]
+    assert (calls['options'][0] or {}).get('forecast_mode') == ('recursive' if recursive else None)
+    assert calls['stored'] == (['SBER'] if stored else [])
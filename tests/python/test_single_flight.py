@@ -0,0 +1,98 @@
+import json
+import subprocess
+import sys
+import threading
+import time
+
+from ml.result_cache import ResultCache, cached_forecast
+
+
+def _compute(calls, delay=0.3):
+    def compute():
+        calls.append(threading.get_ident())
+        time.sleep(delay)
+        return {'ticker': 'ZZZ', 'data_source': 'csv', 'close': 1.0}
+    return compute
+
+
+def test_concurrent_misses_run_one_computation(tmp_path):
+    calls, results = [], []
+
+    def request():
+        cache = ResultCache(str(tmp_path))
+        results.append(cached_forecast(cache, 'ZZZ', 252, False, 'numpy', _compute(calls)))
+
+    threads = [threading.Thread(target=request) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert sorted(r['cache']['hit'] for r in results) == [False, True, True, True]
+    assert all(r['cache'].get('coalesced') for r in results if r['cache']['hit'])
+
+
+def test_lease_of_killed_process_is_released(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    key, _ = cache.key_for('ZZZ', 252, False, 'numpy')
+    holder = subprocess.Popen([sys.executable, '-c', (
+        'import sys, time\n'
+        f'sys.path.insert(0, {repr(sys.path[0])})\n'
+        'from ml.locks import try_lock\n'
+        f'f = open({repr(str(tmp_path / (key + ".lease")))}, "a+")\n'
+        'assert try_lock(f)\n'
+        'print("locked", flush=True)\n'
+        'time.sleep(60)\n'
+    )], stdout=subprocess.PIPE, text=True)
+    assert holder.stdout.readline().strip() == 'locked'
+    threading.Timer(0.3, holder.kill).start()
+
+    calls = []
+    started = time.monotonic()
+    result = cached_forecast(cache, 'ZZZ', 252, False, 'numpy', _compute(calls, delay=0))
+    holder.wait()
+
+    assert len(calls) == 1 and result['cache']['hit'] is False
+    assert 0.2 < time.monotonic() - started < 5
+
+
+def test_expired_lease_of_hung_holder_is_ignored(tmp_path):
+    cache = ResultCache(str(tmp_path), lease_timeout=1)
+    key, _ = cache.key_for('ZZZ', 252, False, 'numpy')
+    with cache.lease(key) as lease:
+        assert lease['held']
+        # Владелец "завис": расчет начат давно
+        with open(tmp_path / f'{key}.lease', 'w') as f:
+            f.write(json.dumps({'pid': 1, 'started': time.time() - 10}))
+
+        calls = []
+        result = cached_forecast(ResultCache(str(tmp_path), lease_timeout=1), 'ZZZ', 252, False, 'numpy',
+                                 _compute(calls, delay=0))
+
+    assert len(calls) == 1 and result['cache']['hit'] is False and result['cache']['waited_ms'] < 1000
+
+
+def test_windows_locks_always_cover_the_first_byte(tmp_path, monkeypatch):
+    import os
+    import types
+
+    from ml.locks import try_lock, unlock
+
+    calls = []
+    fake = types.SimpleNamespace(LK_NBLCK=2, LK_UNLCK=0,
+                                 locking=lambda fd, mode, size: calls.append((mode, os.lseek(fd, 0, os.SEEK_CUR))))
+    monkeypatch.setitem(sys.modules, 'msvcrt', fake)
+    monkeypatch.setattr(os, 'name', 'nt')
+
+    path = tmp_path / 'key.lease'
+    with open(path, 'a+', encoding='utf-8') as holder, open(path, 'a+', encoding='utf-8') as waiter:
+        assert try_lock(holder)
+        holder.write(json.dumps({'pid': 1, 'started': time.time()}))
+        holder.flush()
+        # Позиция 'a+' - конец файла, но блокируется все тот же первый байт
+        waiter.seek(0, os.SEEK_END)
+        try_lock(waiter)
+        unlock(holder)
+
+    assert calls == [(2, 0), (2, 0), (0, 0)]
@@ -0,0 +1,90 @@
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ml import paths
+from ml.snapshot import Snapshot, convert_legacy, main, read_snapshot, write_snapshot
+
+
+def _frame(n, start=100.0):
+    return pd.DataFrame({
+        'time': pd.date_range('2024-01-01', periods=n, freq='D'),
+        'close': np.arange(n, dtype=np.float64) + start,
+        'volume': np.full(n, 10.0),
+    })
+
+
+@pytest.fixture
+def models_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(paths, 'models_dir', str(tmp_path))
+    return tmp_path
+
+
+def test_write_read_round_trip(tmp_path):
+    df = _frame(30)
+    write_snapshot(str(tmp_path), df, df['close'].to_numpy()[-5:], {'lookback': 5, 'forecast_days': 1, 'mape': 2.5})
+
+    snapshot = Snapshot.open(str(tmp_path))
+
+    assert snapshot.records_count == 30 and snapshot['mape'] == 2.5
+    np.testing.assert_array_equal(snapshot.last_sequence.ravel(), np.arange(125, 130, dtype=np.float32))
+    pd.testing.assert_frame_equal(snapshot.to_dataframe(), df, check_dtype=False)
+    assert snapshot.avg_volume() == 10
+
+
+def test_reader_of_previous_header_keeps_its_own_arrays(tmp_path):
+    meta = {'lookback': 5, 'forecast_days': 1}
+    write_snapshot(str(tmp_path), _frame(30), np.zeros(5), meta)
+    old = Snapshot.open(str(tmp_path))
+
+    write_snapshot(str(tmp_path), _frame(40, start=500.0), np.ones(5), meta)
+    new = Snapshot.open(str(tmp_path))
+
+    # Открытый до перезаписи снимок не получает массивы новой записи
+    assert len(old.array('close')) == old.records_count == 30 and old.array('close')[0] == 100
+    assert len(new.array('close')) == new.records_count == 40 and new.array('close')[0] == 500
+
+    write_snapshot(str(tmp_path), _frame(50), np.ones(5), meta)
+    # Хранятся только текущее и предыдущее поколения
+    assert len([name for name in os.listdir(tmp_path) if name.endswith('.npy')]) == 8
+
+
+def test_header_without_generations_is_still_readable(tmp_path):
+    write_snapshot(str(tmp_path), _frame(10), np.zeros(5), {'lookback': 5, 'forecast_days': 1})
+    snapshot = Snapshot.open(str(tmp_path))
+    for name, file_name in snapshot.header.pop('arrays').items():
+        os.replace(tmp_path / file_name, tmp_path / f'{name}.npy')
+
+    assert len(Snapshot(snapshot.header, str(tmp_path)).array('close')) == 10
+
+
+def test_convert_legacy_matches_pickle_and_removes_it(models_dir):
+    df = _frame(20)
+    legacy = {'df': df, 'X_pat': np.zeros((3, 5, 1)), 'last_sequence': np.arange(5.0).reshape(-1, 1),
+              'lookback': 5, 'forecast_days': 1, 'last_date': pd.Timestamp('2024-01-20'), 'mape': 1.5}
+    with open(paths.snapshot_path('ZZZ'), 'wb') as f:
+        pickle.dump(legacy, f)
+    from_pickle = read_snapshot('ZZZ')
+
+    assert main(['ZZZ', '--remove-legacy']) == 0
+    converted = read_snapshot('ZZZ')
+
+    assert not os.path.exists(paths.snapshot_path('ZZZ'))
+    assert converted.directory == paths.snapshot_dir('ZZZ')
+    assert converted['last_date'] == from_pickle['last_date'] == '2024-01-20 00:00:00'
+    assert converted.records_count == from_pickle.records_count == 20
+    for name in ('last_sequence', 'close', 'volume', 'time'):
+        np.testing.assert_array_equal(np.asarray(converted.array(name)).ravel(),
+                                      np.asarray(from_pickle.array(name)).ravel())
+
+
+def test_convert_legacy_keeps_pickle_by_default(models_dir):
+    with open(paths.snapshot_path('ZZZ'), 'wb') as f:
+        pickle.dump({'df': _frame(10), 'last_sequence': np.zeros((5, 1)), 'lookback': 5, 'forecast_days': 1}, f)
+
+    convert_legacy('ZZZ')
+
+    assert os.path.exists(paths.snapshot_path('ZZZ')) and read_snapshot('ZZZ').records_count == 10
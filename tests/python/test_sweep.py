@@ -0,0 +1,37 @@
+from ml import paths
+from ml.hyperparams import DEFAULTS, load_hyperparams, save_hyperparams
+from ml.sweep import candidate_grid, pick_winner, should_prune
+
+
+def test_candidate_grid_starts_with_current_defaults():
+    space = {'lookback': [30, 60, 90], 'units': [16, 32]}
+
+    grid = candidate_grid(space)
+    sampled = candidate_grid(space, seed=1, trials=3)
+
+    assert len(grid) == 6
+    assert grid[0] == {'lookback': 60, 'units': 32}
+    assert sampled[0] == grid[0] and len(sampled) == 3 and len({str(p) for p in sampled}) == 3
+
+
+def test_trial_is_pruned_only_when_worse_than_median_after_warmup():
+    reports = {'SBER:0': [0.5, 0.4], 'SBER:1': [0.6, 0.3], 'SBER:2': [0.9, 0.8], 'GAZP:0': [0.01, 0.01]}
+
+    assert not should_prune(reports, 'SBER:2', 1, warmup_epochs=2)
+    assert should_prune(reports, 'SBER:2', 2, warmup_epochs=2)
+    assert not should_prune(reports, 'SBER:1', 2, warmup_epochs=2)
+
+
+def test_winner_is_saved_for_stock_py(tmp_path, monkeypatch):
+    monkeypatch.setattr(paths, 'models_dir', str(tmp_path))
+    trials = [
+        {'trial': 0, 'params': {'lookback': 60}, 'val_loss': 0.2, 'best_epoch': 30, 'pruned': False},
+        {'trial': 1, 'params': {'lookback': 30}, 'val_loss': 0.1, 'best_epoch': 4, 'pruned': False},
+        {'trial': 2, 'params': {'lookback': 90}, 'val_loss': 0.05, 'best_epoch': 3, 'pruned': True},
+    ]
+
+    best, config = pick_winner(trials)
+    save_hyperparams('TEST', config, val_loss=best['val_loss'])
+
+    assert load_hyperparams('TEST') == {**DEFAULTS, 'lookback': 30, 'epochs': 14}
+    assert load_hyperparams('OTHER') == DEFAULTS
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+from ml.tf_pipeline import window_dataset  # noqa: E402
+from ml.windowing import make_windows  # noqa: E402
+
+
+def test_window_dataset_matches_make_windows():
+    series = np.random.default_rng(0).random(200).astype(np.float32)
+    X_ref, y_ref = make_windows(series, lookback=60, forecast_days=1)
+
+    batches = list(window_dataset(series, 10, 130, lookback=60, forecast_days=1, batch_size=32))
+    X = np.concatenate([b[0].numpy() for b in batches])
+    y = np.concatenate([b[1].numpy() for b in batches])
+
+    np.testing.assert_array_equal(X, X_ref[10:130])
+    np.testing.assert_array_equal(y, y_ref[10:130])
+
+
+def test_shuffled_dataset_covers_each_window_once():
+    series = np.arange(100, dtype=np.float32)
+    ds = window_dataset(series, 0, 30, lookback=5, forecast_days=1, batch_size=8, shuffle=True, seed=1)
+
+    starts = np.concatenate([b[0].numpy()[:, 0, 0] for b in ds])
+    assert sorted(starts.tolist()) == list(range(30))
+
+
+def test_horizon_targets_are_values_h_steps_after_window():
+    series = np.arange(100, dtype=np.float32)
+    ds = window_dataset(series, 0, 20, lookback=5, batch_size=8, horizons=[1, 3, 10])
+
+    X, y = (np.concatenate(parts) for parts in zip(*[(b[0].numpy(), b[1].numpy()) for b in ds]))
+    np.testing.assert_array_equal(y[:, 0], X[:, -1, 0] + 1)
+    np.testing.assert_array_equal(y, X[:, -1:, 0] + np.array([1, 3, 10]))
+
+
+def test_cached_shuffled_dataset_reshuffles_in_the_uncached_order():
+    series = np.arange(100, dtype=np.float32)
+    kwargs = dict(lookback=5, forecast_days=1, batch_size=8, shuffle=True, seed=3)
+    cached = window_dataset(series, 0, 30, cache=True, **kwargs)
+    plain = window_dataset(series, 0, 30, **kwargs)
+
+    def epoch(ds):
+        return np.concatenate([b[0].numpy()[:, 0, 0] for b in ds]).tolist()
+
+    first, second = epoch(cached), epoch(cached)
+    assert sorted(first) == list(range(30)) and first != second
+    assert [first, second] == [epoch(plain), epoch(plain)]
@@ -0,0 +1,47 @@
+import json
+
+import numpy as np
+
+from ml.timings import Timings, write_metrics
+
+
+def test_step_percentiles_match_numpy():
+    timings = Timings()
+    steps = np.random.default_rng(0).random(252) / 100
+    for seconds in steps:
+        timings.step(float(seconds))
+
+    report = timings.to_dict()['steps']
+
+    assert report['count'] == 252
+    for p in (50, 90, 99):
+        assert report[f'p{p}_ms'] == round(float(np.percentile(steps, p)) * 1000, 3)
+
+
+def test_prometheus_file_replaces_only_own_ticker(tmp_path):
+    path = str(tmp_path / 'forecast.prom')
+    for ticker, seconds in (('SBER', 1.0), ('GAZP', 2.0), ('SBER', 3.0)):
+        timings = Timings()
+        timings.add('rollout', seconds)
+        assert write_metrics(path, timings.to_dict(), 'predict_future', ticker) is None
+
+    lines = open(path, encoding='utf-8').read().splitlines()
+    rollout = [line for line in lines if 'stage="rollout"' in line]
+
+    assert rollout == [
+        'forecast_stage_seconds{script="predict_future",ticker="GAZP",stage="rollout"} 2.000000',
+        'forecast_stage_seconds{script="predict_future",ticker="SBER",stage="rollout"} 3.000000',
+    ]
+    # Один блок HELP/TYPE на метрику
+    assert sum(line == '# TYPE forecast_stage_seconds gauge' for line in lines) == 1
+
+
+def test_jsonl_appends_one_record_per_run(tmp_path):
+    path = str(tmp_path / 'metrics.jsonl')
+    for _ in range(2):
+        write_metrics(path, Timings().to_dict(), 'stock', 'SBER')
+
+    records = [json.loads(line) for line in open(path, encoding='utf-8')]
+
+    assert [r['ticker'] for r in records] == ['SBER', 'SBER']
+    assert 'stages_ms' in records[0]
@@ -0,0 +1,22 @@
+from datetime import datetime
+
+from ml.trading_calendar import business_calendar, format_dates, trading_days
+
+
+def test_trading_days_skip_weekends_and_holidays(tmp_path):
+    path = tmp_path / 'holidays.txt'
+    path.write_text('# праздники\n2024-11-04\n\nnot-a-date\n', encoding='utf-8')
+    calendar = business_calendar(str(path))
+
+    # Пятница перед праздничным понедельником
+    dates = format_dates(trading_days(datetime(2024, 11, 1, 10, 0), 3, calendar))
+
+    assert dates == ['2024-11-05 10:00:00', '2024-11-06 10:00:00', '2024-11-07 10:00:00']
+
+
+def test_trading_days_from_weekend_start_next_business_day(tmp_path):
+    calendar = business_calendar(str(tmp_path / 'missing.txt'))
+
+    dates = format_dates(trading_days(datetime(2024, 9, 7), 2, calendar))
+
+    assert dates == ['2024-09-09 00:00:00', '2024-09-10 00:00:00']
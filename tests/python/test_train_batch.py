@@ -0,0 +1,118 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from ml import paths, train_batch
+
+# Заглушка stock.py: записывает, когда шло "обучение", с какими аргументами и
+# потоками и какой статус тикера видел endpoint model-status в это время
+STUB = '''
+import json, os, sys, time
+ticker = sys.argv[1]
+started = time.time()
+with open(os.path.join(os.path.dirname(__file__), 'models', 'training_status.json'), encoding='utf-8') as f:
+    seen = json.load(f)['tickers'][ticker]
+time.sleep(0.3)
+with open(os.path.join(os.path.dirname(__file__), 'runs', ticker + '.json'), 'w') as f:
+    json.dump({'argv': sys.argv[1:], 'threads': os.environ['OMP_NUM_THREADS'], 'state': seen['state'],
+               'slot': seen['slot'], 'started': started, 'finished': time.time()}, f)
+sys.exit(3 if ticker.startswith('FAIL') else 0)
+'''
+
+
+@pytest.fixture
+def root(tmp_path, monkeypatch):
+    (tmp_path / 'stock.py').write_text(STUB)
+    (tmp_path / 'runs').mkdir()
+    models = tmp_path / 'models'
+    monkeypatch.setattr(paths, 'script_dir', str(tmp_path))
+    monkeypatch.setattr(paths, 'models_dir', str(models))
+    monkeypatch.setattr(paths, 'csv_dir', str(tmp_path / 'csv'))
+    monkeypatch.setattr(paths, 'logs_dir', str(tmp_path / 'logs'))
+    monkeypatch.setattr(paths, 'training_status_path', str(models / 'training_status.json'))
+    monkeypatch.setattr(paths, 'training_slots_dir', str(models / '.training_slots'))
+    monkeypatch.setattr(train_batch, 'SLOT_POLL_SECONDS', 0.05)
+    return tmp_path
+
+
+def _runs(root):
+    return {name[:-5]: json.loads((root / 'runs' / name).read_text()) for name in os.listdir(root / 'runs')}
+
+
+def _max_overlap(runs):
+    events = sorted([(r['started'], 1) for r in runs] + [(r['finished'], -1) for r in runs])
+    current = peak = 0
+    for _, delta in events:
+        current += delta
+        peak = max(peak, current)
+    return peak
+
+
+def test_failures_are_counted_and_status_is_recorded(root):
+    failed = train_batch.run_training_batch(['AAA', 'fail1', 'aaa'], max_parallel=2, threads_per_job=3,
+                                            direct='checkpoints')
+
+    runs = _runs(root)
+    status = train_batch.read_status()['tickers']
+    assert failed == 1
+    assert set(runs) == {'AAA', 'FAIL1'}
+    assert runs['AAA']['argv'] == ['AAA', '--direct', 'checkpoints'] and runs['AAA']['threads'] == '3'
+    assert runs['AAA']['state'] == 'running'
+    assert status['AAA']['state'] == 'done' and status['AAA']['returncode'] == 0
+    assert status['FAIL1']['state'] == 'failed' and status['FAIL1']['returncode'] == 3
+    assert status['AAA']['duration'] >= 0.3 and status['AAA']['pid'] is None
+    assert os.path.exists(paths.training_log_path('AAA'))
+
+
+def test_slots_limit_parallel_jobs_across_independent_batches(root):
+    batches = [threading.Thread(target=train_batch.run_training_batch, args=(tickers,), kwargs={'max_parallel': 2})
+               for tickers in (['A1', 'A2', 'A3'], ['B1', 'B2', 'B3'])]
+    for t in batches:
+        t.start()
+    for t in batches:
+        t.join()
+
+    runs = _runs(root)
+    assert len(runs) == 6
+    assert _max_overlap(runs.values()) == 2
+    assert {r['slot'] for r in runs.values()} == {0, 1}
+    assert train_batch.read_status()['tickers']['B3']['state'] == 'done'
+
+
+def test_up_to_date_models_are_skipped_unless_forced(root):
+    os.makedirs(paths.csv_dir)
+    os.makedirs(paths.models_dir)
+    for path in (paths.csv_path('AAA'), paths.model_path('AAA'), paths.scaler_path('AAA'), paths.csv_path('BBB')):
+        open(path, 'w').close()
+    past = time.time() - 100
+    os.utime(paths.csv_path('AAA'), (past, past))
+
+    assert train_batch.run_training_batch(train_batch.all_tickers()) == 0
+    assert set(_runs(root)) == {'BBB'}
+    assert train_batch.read_status()['tickers']['AAA']['state'] == 'skipped'
+
+    # Новые гиперпараметры делают модель устаревшей
+    open(paths.hyperparams_path('AAA'), 'w').close()
+    assert not train_batch.is_up_to_date('AAA')
+
+    os.remove(root / 'runs' / 'BBB.json')
+    assert train_batch.run_training_batch(['AAA'], force=True, incremental=True) == 0
+    assert _runs(root)['AAA']['argv'] == ['AAA', '--incremental']
+
+
+def test_main_exit_code(root, capsys):
+    assert train_batch.main(['--tickers', 'AAA']) == 0
+    assert train_batch.main(['--tickers', 'AAA,FAIL1', '--max-parallel', '1']) == 1
+    assert train_batch.main(['--tickers', ' , ']) == 1
+    assert 'с ошибкой 1 (FAIL1)' in capsys.readouterr().out
+
+
+def test_training_slot_is_released_when_the_job_raises(root):
+    with pytest.raises(RuntimeError):
+        with train_batch.training_slot(1):
+            raise RuntimeError('boom')
+    with train_batch.training_slot(1) as slot:
+        assert slot == 0
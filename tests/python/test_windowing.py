@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from ml.windowing import make_windows
+
+
+def legacy_windows(scaled, lookback, forecast_days):
+    # Цикл, которым окна строились раньше в stock.py и predict_future.py
+    X, y = [], []
+    for i in range(lookback, len(scaled) - forecast_days + 1):
+        X.append(scaled[i - lookback:i])
+        y.append(scaled[i + forecast_days - 1, 0])
+    return np.asarray(X), np.asarray(y)
+
+
+@pytest.mark.parametrize('length,lookback,forecast_days', [
+    (200, 60, 1),
+    (61, 60, 1),
+    (120, 10, 5),
+    (300, 1, 1),
+])
+def test_make_windows_matches_legacy_loop(length, lookback, forecast_days):
+    scaled = np.random.default_rng(length).random((length, 1))
+
+    expected_X, expected_y = legacy_windows(scaled, lookback, forecast_days)
+
+    X, y = make_windows(scaled, lookback=lookback, forecast_days=forecast_days, dtype=np.float64)
+    np.testing.assert_array_equal(X, expected_X)
+    np.testing.assert_array_equal(y, expected_y)
+
+    X32, y32 = make_windows(scaled, lookback=lookback, forecast_days=forecast_days)
+    assert X32.dtype == np.float32
+    np.testing.assert_array_equal(X32, expected_X.astype(np.float32))
+    np.testing.assert_array_equal(y32, expected_y.astype(np.float32))
+
+
+def test_make_windows_returns_view_without_copying_windows():
+    scaled = np.random.default_rng(0).random((500, 1)).astype(np.float32)
+
+    X, y = make_windows(scaled, lookback=60)
+
+    assert np.shares_memory(X, scaled)
+    assert np.shares_memory(y, scaled)
+
+
+def test_make_windows_returns_empty_for_short_series():
+    X, y = make_windows(np.zeros((60, 1)), lookback=60, forecast_days=1)
+
+    assert X.shape == (0, 60, 1)
+    assert y.shape == (0,)